@@ -0,0 +1,236 @@
+"""Almacén de embeddings faciales (ArcFace) por RUT e índice en memoria para búsqueda 1:N.
+
+Cada embedding se guarda normalizado (norma 1) como float32 en la tabla
+embeddings_faciales (512 dimensiones = 2 KB por vecino). En memoria todos quedan
+en una sola matriz (N, d) float32, así:
+- 1:N: la distancia coseno contra todos es 1 - M @ q en una pasada vectorizada
+  y los k más cercanos salen con argpartition; sirve para detectar el mismo
+  rostro registrándose con dos RUT;
+- 1:1: la re-verificación compara la selfie nueva con el embedding guardado,
+  sin volver a detectar el rostro del carnet.
+
+guardar_embedding() solo inserta: un RUT que ya tiene rostro no se sobrescribe
+(RostroYaRegistrado). Reemplazarlo es reemplazar_embedding(), que solo usa el
+re-enrolamiento autorizado por la directiva.
+
+Como el índice UV de geometria.py, la matriz se revalida cada
+EMBEDDINGS_REVISION_SEG contra la BD (conteo y última actualización) para que
+varios workers de uvicorn vean lo que guardan los demás.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
+
+from conexion import SesionDB, conectar_db
+
+EMBEDDINGS_REVISION_SEG = float(os.getenv("EMBEDDINGS_REVISION_SEG", "30"))
+
+DDL_EMBEDDINGS_FACIALES = """
+CREATE TABLE IF NOT EXISTS `embeddings_faciales` (
+  `rut` varchar(45) NOT NULL,
+  `modelo` varchar(30) NOT NULL,
+  `vector` blob NOT NULL,
+  `actualizado_en` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`rut`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+"""
+
+
+def normalizar_rut(rut: str) -> str:
+    """'12.345.678-k' → '12345678-K' (misma clave con o sin puntos/guion)."""
+    s = "".join(c for c in (rut or "") if c.isalnum()).upper()
+    return f"{s[:-1]}-{s[-1]}" if len(s) > 1 else s
+
+
+def normalizar(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    n = float(np.linalg.norm(v))
+    if n == 0:
+        raise ValueError("embedding nulo")
+    return v / n
+
+
+def a_bytes(vector) -> bytes:
+    return normalizar(vector).tobytes()
+
+
+def de_bytes(datos: bytes) -> np.ndarray:
+    return np.frombuffer(datos, dtype=np.float32)
+
+
+class IndiceEmbeddings:
+    def __init__(self, filas=(), dim: int | None = None):
+        self.ruts = []
+        self._pos = {}
+        vectores = []
+        for rut, datos in filas:
+            v = de_bytes(datos)
+            if dim is None:
+                dim = v.size
+            if v.size != dim:
+                continue  # embedding de otro modelo
+            self._pos[rut] = len(self.ruts)
+            self.ruts.append(rut)
+            vectores.append(v)
+        self.dim = dim
+        self.matriz = np.vstack(vectores).astype(np.float32, copy=False) if vectores else np.empty((0, dim or 0), np.float32)
+
+    def __len__(self):
+        return len(self.ruts)
+
+    def obtener(self, rut: str) -> np.ndarray | None:
+        i = self._pos.get(rut)
+        return None if i is None else self.matriz[i]
+
+    def agregar(self, rut: str, vector) -> None:
+        v = normalizar(vector)
+        if self.dim is None or not len(self):
+            self.dim = v.size
+            self.matriz = np.empty((0, v.size), np.float32)
+        if v.size != self.dim:
+            raise ValueError(f"dimensión {v.size} distinta a la del índice ({self.dim})")
+        i = self._pos.get(rut)
+        if i is not None:
+            self.matriz[i] = v
+            return
+        self._pos[rut] = len(self.ruts)
+        self.ruts.append(rut)
+        self.matriz = np.vstack([self.matriz, v[None, :]])
+
+    def buscar(self, vector, k: int = 5, umbral: float | None = None, excluir: str | None = None) -> list:
+        """Los k más cercanos por distancia coseno: [(rut, distancia)] ordenados, opcionalmente <= umbral."""
+        if not len(self):
+            return []
+        d = 1.0 - self.matriz @ normalizar(vector)
+        i = self._pos.get(excluir) if excluir is not None else None
+        if i is not None and i < d.size:
+            d[i] = np.inf
+        k = min(k, d.size)
+        idx = np.argpartition(d, k - 1)[:k]
+        idx = idx[np.argsort(d[idx])]
+        salida = [(self.ruts[i], float(d[i])) for i in idx if np.isfinite(d[i])]
+        if umbral is not None:
+            salida = [(r, dist) for r, dist in salida if dist <= umbral]
+        return salida
+
+
+class RostroYaRegistrado(Exception):
+    """El RUT ya tiene un embedding guardado."""
+
+
+_lock = threading.Lock()
+_indice: IndiceEmbeddings | None = None
+_huella = None
+_revisado_en = 0.0
+
+
+def _leer_huella(cur):
+    cur.execute("SELECT COUNT(*) AS n, MAX(actualizado_en) AS ultimo FROM embeddings_faciales")
+    fila = cur.fetchone()
+    return (fila["n"], fila["ultimo"]) if fila else None
+
+
+def _cargar() -> IndiceEmbeddings:
+    global _indice, _huella, _revisado_en
+    db = conectar_db()
+    if db is None:
+        raise RuntimeError("No se pudo conectar a la base de datos")
+    cur = db.cursor(dictionary=True)
+    try:
+        huella = _leer_huella(cur)
+        if _indice is not None and huella == _huella:
+            _revisado_en = time.monotonic()
+            return _indice
+        cur.execute("SELECT rut, vector FROM embeddings_faciales")
+        indice = IndiceEmbeddings([(f["rut"], f["vector"]) for f in cur.fetchall()])
+    finally:
+        cur.close()
+        db.close()
+    _indice, _huella, _revisado_en = indice, huella, time.monotonic()
+    print(f"[BIOMETRIA] índice de embeddings cargado: {len(indice)} rostros")
+    return indice
+
+
+def indice_embeddings() -> IndiceEmbeddings:
+    """Índice vigente; lo carga o revalida contra la BD si corresponde."""
+    if _indice is not None and time.monotonic() - _revisado_en < EMBEDDINGS_REVISION_SEG:
+        return _indice
+    with _lock:
+        if _indice is not None and time.monotonic() - _revisado_en < EMBEDDINGS_REVISION_SEG:
+            return _indice
+        try:
+            return _cargar()
+        except Exception as e:
+            if _indice is None:
+                raise
+            print(f"[BIOMETRIA] no se pudo revalidar el índice de embeddings: {e}")
+            return _indice
+
+
+def _agregar_al_indice(rut: str, datos: bytes) -> None:
+    with _lock:
+        if _indice is not None:
+            _indice.agregar(rut, de_bytes(datos))
+
+
+def _escribir(sql: str, rut: str, vector, modelo: str) -> None:
+    """Ejecuta el INSERT/UPSERT (en la transacción del request); el índice se actualiza tras el commit."""
+    rut = normalizar_rut(rut)
+    datos = a_bytes(vector)
+    db = conectar_db()
+    if db is None:
+        raise RuntimeError("No se pudo conectar a la base de datos")
+    cur = db.cursor()
+    try:
+        try:
+            cur.execute(sql, (rut, modelo, datos))
+        except IntegrityError as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise RostroYaRegistrado(rut) from e
+            raise
+        if isinstance(db, SesionDB):
+            # si el commit del middleware falla, el índice no debe tener un rostro que no está en la tabla
+            db.despues_del_commit(lambda: _agregar_al_indice(rut, datos))
+        else:
+            db.commit()
+            _agregar_al_indice(rut, datos)
+    finally:
+        cur.close()
+        db.close()
+
+
+def guardar_embedding(rut: str, vector, modelo: str) -> None:
+    """Guarda el primer embedding del RUT; si ya tiene uno lanza RostroYaRegistrado."""
+    _escribir("INSERT INTO embeddings_faciales (rut, modelo, vector) VALUES (%s, %s, %s)", rut, vector, modelo)
+
+
+def reemplazar_embedding(rut: str, vector, modelo: str) -> None:
+    """Inserta o reemplaza el embedding del RUT. Solo para el re-enrolamiento autorizado."""
+    _escribir(
+        "INSERT INTO embeddings_faciales (rut, modelo, vector) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE modelo = VALUES(modelo), vector = VALUES(vector)",
+        rut, vector, modelo,
+    )
+
+
+def duplicados(vector, rut: str | None, umbral: float, k: int = 3) -> list:
+    """Otros RUT cuyo embedding guardado está a distancia <= umbral: [{rut, distancia}]."""
+    cercanos = indice_embeddings().buscar(vector, k=k, umbral=umbral, excluir=normalizar_rut(rut))
+    return [{"rut": r, "distancia": round(d, 4)} for r, d in cercanos]
+
+
+def embedding_de(rut: str) -> np.ndarray | None:
+    return indice_embeddings().obtener(normalizar_rut(rut))
+
+
+def indice_info() -> dict:
+    return {
+        "cargado": _indice is not None,
+        "rostros": len(_indice) if _indice else 0,
+        "dim": _indice.dim if _indice else None,
+        "edad_s": round(time.monotonic() - _revisado_en, 1) if _indice else None,
+    }
@@ -0,0 +1,204 @@
+"""Motor de verificación facial: ArcFace + RetinaFace cargados una vez y calentados.
+
+DeepFace construye los modelos la primera vez que se usan y TensorFlow traza el
+grafo en la primera inferencia, así que el primer /biometria/verificar tardaba
+varios segundos más que los siguientes. El motor:
+- carga ambos modelos con DeepFace.build_model (quedan en la cache de DeepFace);
+- los calienta con una verificación sobre una imagen sintética, que ejecuta
+  detector y modelo de punta a punta;
+- recibe las imágenes ya decodificadas y reducidas por biometria/preproceso.py
+  (o bytes, que decodifica con cv2.imdecode), sin archivos temporales;
+- calcula los embeddings con DeepFace.represent y la distancia coseno aquí
+  mismo, para devolver el embedding de la selfie (biometria/embeddings.py lo
+  guarda) y comparar una selfie contra un embedding guardado sin el carnet.
+
+deepface (y con él TensorFlow/Keras) y cv2 se importan recién al cargar el
+motor o decodificar la primera imagen: importar este módulo, el pool o el
+router no arrastra el stack de ML, que en modo procesos solo vive en los
+trabajadores biométricos.
+
+Cada proceso del pool biométrico (biometria/pool.py) tiene su propio motor y
+lo carga al iniciar; main.py levanta el pool al arrancar (BIOMETRIA_PRECARGAR=1),
+así la API acepta requests mientras carga. /biometria/estado responde 503 hasta
+que hay un trabajador listo y /biometria/calentar fuerza la carga y espera. Un
+trabajo que llega durante la carga espera hasta BIOMETRIA_ESPERA_SEG.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+BIOMETRIA_MODELO = os.getenv("BIOMETRIA_MODELO", "ArcFace")
+BIOMETRIA_DETECTOR = os.getenv("BIOMETRIA_DETECTOR", "retinaface")
+BIOMETRIA_METRICA = os.getenv("BIOMETRIA_METRICA", "cosine")
+# 0: la API no expone /biometria ni levanta el pool (despliegues sin verificación facial)
+BIOMETRIA_HABILITADA = os.getenv("BIOMETRIA_HABILITADA", "1") == "1"
+BIOMETRIA_PRECARGAR = os.getenv("BIOMETRIA_PRECARGAR", "1") == "1"
+BIOMETRIA_ESPERA_SEG = float(os.getenv("BIOMETRIA_ESPERA_SEG", "60"))
+# por defecto el umbral que DeepFace usa para modelo + métrica (se lee al calentar)
+BIOMETRIA_UMBRAL = float(os.getenv("BIOMETRIA_UMBRAL", "0")) or None
+
+FRIO, CARGANDO, LISTO, ERROR = "frio", "cargando", "listo", "error"
+
+DeepFace = None  # ver _deepface()
+
+
+def _deepface():
+    global DeepFace
+    if DeepFace is None:
+        from deepface import DeepFace as _DeepFace
+        DeepFace = _DeepFace
+    return DeepFace
+
+
+class MotorNoListo(Exception):
+    pass
+
+
+class ImagenInvalida(ValueError):
+    pass
+
+
+def decodificar(datos) -> np.ndarray:
+    """Bytes de JPEG/PNG/etc. → imagen BGR (lo que DeepFace espera de un arreglo).
+
+    Un arreglo ya decodificado (biometria/preproceso.py) pasa tal cual.
+    """
+    if isinstance(datos, np.ndarray):
+        return datos
+    import cv2
+
+    if not datos:
+        raise ImagenInvalida("archivo vacío")
+    img = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ImagenInvalida("formato de imagen no reconocido")
+    return img
+
+
+def confianza(distancia: float, umbral: float) -> float:
+    """1.0 con distancia 0; 0.5 en el umbral; 0 desde 2 * umbral."""
+    return max(0.0, min(1.0, 1.0 - (distancia / umbral) / 2.0))
+
+
+def distancia_coseno(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return max(0.0, float(1.0 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))))
+
+
+class MotorBiometrico:
+    def __init__(self, modelo=BIOMETRIA_MODELO, detector=BIOMETRIA_DETECTOR, metrica=BIOMETRIA_METRICA):
+        self.modelo = modelo
+        self.detector = detector
+        self.metrica = metrica
+        self.umbral = BIOMETRIA_UMBRAL
+        self.estado = FRIO
+        self.error = None
+        self.tiempos = {}
+        self._lock = threading.Lock()
+        self._listo = threading.Event()
+
+    def listo(self) -> bool:
+        return self.estado == LISTO
+
+    def cargar(self):
+        """Construye y calienta los modelos (idempotente; llamadas concurrentes esperan a la primera)."""
+        with self._lock:
+            if self.estado == LISTO:
+                return
+            self.estado, self.error = CARGANDO, None
+            try:
+                t0 = time.perf_counter()
+                _deepface().build_model(model_name=self.modelo, task="facial_recognition")
+                _deepface().build_model(model_name=self.detector, task="face_detector")
+                t1 = time.perf_counter()
+                self._calentar()
+                t2 = time.perf_counter()
+                self.tiempos = {"carga_s": round(t1 - t0, 3), "calentamiento_s": round(t2 - t1, 3)}
+                self.estado = LISTO
+                self._listo.set()
+                print(f"[BIOMETRIA] {self.modelo}/{self.detector} listos en {t2 - t0:.1f}s")
+            except Exception as e:
+                self.estado, self.error = ERROR, f"{type(e).__name__}: {e}"
+                print(f"[BIOMETRIA] Error al cargar modelos: {self.error}")
+                raise
+
+    def _calentar(self):
+        # imagen sintética con algo de textura: recorre detector y modelo (primer trazado de TF)
+        img = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        resultado = self._verify(img, img, enforce_detection=False)
+        if self.umbral is None:
+            self.umbral = float(resultado.get("threshold", 0.68))
+        self._representar(img, enforce_detection=False)
+
+    def esperar(self, timeout: float = BIOMETRIA_ESPERA_SEG):
+        """Espera a que el motor esté listo; lo carga (o reintenta la carga fallida) si hace falta."""
+        if self.estado in (FRIO, ERROR):
+            try:
+                self.cargar()
+            except Exception as e:
+                raise MotorNoListo(self.error) from e
+        if not self._listo.wait(timeout):
+            raise MotorNoListo(self.error or f"modelos {self.estado}")
+
+    def _verify(self, img1, img2, enforce_detection=True) -> dict:
+        return _deepface().verify(
+            img1_path=img1,
+            img2_path=img2,
+            model_name=self.modelo,
+            detector_backend=self.detector,
+            distance_metric=self.metrica,
+            enforce_detection=enforce_detection,
+        )
+
+    def _representar(self, img, enforce_detection=True) -> list:
+        """Embeddings (float32) de los rostros detectados, del más grande al más chico."""
+        caras = _deepface().represent(
+            img_path=img,
+            model_name=self.modelo,
+            detector_backend=self.detector,
+            enforce_detection=enforce_detection,
+        )
+        caras = sorted(caras, key=lambda c: c["facial_area"]["w"] * c["facial_area"]["h"], reverse=True)
+        return [np.asarray(c["embedding"], dtype=np.float32) for c in caras]
+
+    def _resultado(self, distancia: float, t0: float, embedding) -> dict:
+        return {
+            "match": distancia <= self.umbral,
+            "distance": distancia,
+            "threshold": self.umbral,
+            "confidence": confianza(distancia, self.umbral),
+            "inferencia_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "embedding": embedding,
+        }
+
+    def verificar(self, img1: np.ndarray | bytes, img2: np.ndarray | bytes) -> dict:
+        """Compara el rostro del carnet (img1) con la selfie (img2). Match si distancia <= umbral.
+
+        Como DeepFace.verify, toma la menor distancia entre los rostros del carnet
+        (trae foto principal y foto fantasma) y el rostro principal de la selfie.
+        Incluye "embedding": el de la selfie, para guardarlo.
+        """
+        self.esperar()
+        a, b = decodificar(img1), decodificar(img2)
+        t0 = time.perf_counter()
+        selfie = self._representar(b)[0]
+        distancia = min(distancia_coseno(e, selfie) for e in self._representar(a))
+        return self._resultado(distancia, t0, selfie)
+
+    def comparar(self, img: np.ndarray | bytes, guardado) -> dict:
+        """1:1 de una selfie contra un embedding guardado (sin volver a procesar el carnet)."""
+        self.esperar()
+        b = decodificar(img)
+        t0 = time.perf_counter()
+        selfie = self._representar(b)[0]
+        return self._resultado(distancia_coseno(guardado, selfie), t0, selfie)
+
+    def info(self) -> dict:
+        return {"estado": self.estado, "modelo": self.modelo, "detector": self.detector,
+                "metrica": self.metrica, "umbral": self.umbral, "error": self.error, **self.tiempos}
+
+
+motor = MotorBiometrico()
@@ -0,0 +1,194 @@
+"""Verificación facial fuera del event loop: pool acotado de procesos con cola y timeouts.
+
+DeepFace.verify (detección + inferencia de TensorFlow) es CPU puro; corrido en
+el handler async congelaba todos los requests del worker de uvicorn. Aquí:
+- BIOMETRIA_PROCESOS procesos (spawn) cargan y calientan el motor en su
+  initializer, así cada proceso queda listo antes de su primer trabajo;
+  con BIOMETRIA_PROCESOS=0 se usa un hilo del mismo proceso (desarrollo);
+- a lo más BIOMETRIA_COLA_MAX trabajos en curso o en espera; el siguiente se
+  rechaza de inmediato con Saturado (el router responde 429 + Retry-After
+  estimado con la latencia promedio);
+- cada trabajo tiene BIOMETRIA_TIMEOUT_SEG; al vencer se informa TiempoAgotado
+  (504). Un trabajo ya en ejecución no se puede interrumpir, así que sigue
+  ocupando su cupo hasta terminar y la cola refleja la carga real;
+- si un proceso muere (BrokenProcessPool) el pool se recrea.
+"""
+import asyncio
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+from biometria.motor import motor, MotorNoListo
+
+BIOMETRIA_PROCESOS = int(os.getenv("BIOMETRIA_PROCESOS", "2"))
+BIOMETRIA_COLA_MAX = int(os.getenv("BIOMETRIA_COLA_MAX", str(max(BIOMETRIA_PROCESOS, 1) * 4)))
+BIOMETRIA_TIMEOUT_SEG = float(os.getenv("BIOMETRIA_TIMEOUT_SEG", "30"))
+
+
+class Saturado(Exception):
+    def __init__(self, reintentar_en: int):
+        super().__init__(f"cola biométrica llena, reintente en {reintentar_en}s")
+        self.reintentar_en = reintentar_en
+
+
+class TiempoAgotado(Exception):
+    pass
+
+
+# ---------- funciones que corren en el proceso trabajador ----------
+
+def _iniciar_trabajador():
+    # una excepción aquí rompería el pool completo; el error queda en motor.info()
+    try:
+        motor.cargar()
+    except Exception:
+        pass
+
+
+def _calentar_trabajador() -> dict:
+    motor.esperar()
+    return {"pid": os.getpid(), **motor.info()}
+
+
+def _verificar_trabajador(img1, img2) -> dict:
+    return motor.verificar(img1, img2)
+
+
+def _comparar_trabajador(img, guardado) -> dict:
+    return motor.comparar(img, guardado)
+
+
+# ---------- lado de la API ----------
+
+class PoolBiometrico:
+    def __init__(self, procesos: int = BIOMETRIA_PROCESOS, cola_max: int = BIOMETRIA_COLA_MAX,
+                 timeout: float = BIOMETRIA_TIMEOUT_SEG):
+        self.procesos = procesos
+        self.cola_max = max(1, cola_max)
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self._latencia_s = None  # promedio móvil
+        self.listos = set()
+        self.error = None
+        self.stats = {"completados": 0, "rechazados": 0, "timeouts": 0, "errores": 0, "reinicios": 0}
+
+    def _crear(self):
+        if self.procesos > 0:
+            return ProcessPoolExecutor(max_workers=self.procesos, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_iniciar_trabajador)
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="biometria", initializer=_iniciar_trabajador)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._crear()
+            return self._executor
+
+    def iniciar(self):
+        """Levanta los trabajadores y los calienta en segundo plano (uno por proceso)."""
+        pool = self._pool()
+        for _ in range(max(self.procesos, 1)):
+            pool.submit(_calentar_trabajador).add_done_callback(self._calentado)
+
+    def _calentado(self, fut):
+        try:
+            info = fut.result()
+            self.listos.add(info["pid"])
+            self.error = None
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"[BIOMETRIA] Error al calentar un trabajador: {self.error}")
+
+    def listo(self) -> bool:
+        return bool(self.listos)
+
+    def _reiniciar(self, roto):
+        with self._lock:
+            if self._executor is roto:
+                self._executor = None
+                self.listos.clear()
+                self.stats["reinicios"] += 1
+        roto.shutdown(wait=False, cancel_futures=True)
+
+    def _admitir(self):
+        with self._lock:
+            if self._en_curso >= self.cola_max:
+                self.stats["rechazados"] += 1
+                lat = self._latencia_s or self.timeout
+                raise Saturado(max(1, math.ceil(lat * self._en_curso / max(self.procesos, 1))))
+            self._en_curso += 1
+
+    def _liberar(self, _fut=None):
+        with self._lock:
+            self._en_curso -= 1
+
+    async def _ejecutar(self, fn, *args):
+        self._admitir()
+        pool = self._pool()
+        try:
+            cf = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._liberar()
+            self._reiniciar(pool)
+            raise MotorNoListo("el pool biométrico se reinició, reintente")
+        except Exception:
+            self._liberar()
+            raise
+        # el cupo se libera cuando el trabajo termina de verdad, no cuando vence el timeout
+        cf.add_done_callback(self._liberar)
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        try:
+            resultado = await asyncio.wait_for(asyncio.wrap_future(cf), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise TiempoAgotado(f"la verificación superó {self.timeout:g}s")
+        except BrokenProcessPool:
+            self.stats["errores"] += 1
+            self._reiniciar(pool)
+            raise MotorNoListo("un proceso biométrico terminó inesperadamente, reintente")
+        except Exception:
+            self.stats["errores"] += 1
+            raise
+        dur = loop.time() - inicio
+        self._latencia_s = dur if self._latencia_s is None else 0.8 * self._latencia_s + 0.2 * dur
+        self.stats["completados"] += 1
+        return resultado
+
+    async def verificar(self, img1, img2) -> dict:
+        return await self._ejecutar(_verificar_trabajador, img1, img2)
+
+    async def comparar(self, img, guardado) -> dict:
+        return await self._ejecutar(_comparar_trabajador, img, guardado)
+
+    async def calentar(self) -> dict:
+        info = await self._ejecutar(_calentar_trabajador)
+        self.listos.add(info["pid"])
+        return info
+
+    def cerrar(self):
+        with self._lock:
+            pool, self._executor = self._executor, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def info(self) -> dict:
+        return {
+            "modo": "procesos" if self.procesos > 0 else "hilo",
+            "procesos": self.procesos,
+            "procesos_listos": len(self.listos),
+            "en_curso": self._en_curso,
+            "cola_max": self.cola_max,
+            "timeout_s": self.timeout,
+            "latencia_promedio_s": round(self._latencia_s, 3) if self._latencia_s is not None else None,
+            "error": self.error,
+            **self.stats,
+        }
+
+
+pool_biometrico = PoolBiometrico()
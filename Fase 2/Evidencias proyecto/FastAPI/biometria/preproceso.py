@@ -0,0 +1,92 @@
+"""Preprocesamiento de las fotos subidas a /biometria antes de la inferencia.
+
+Las selfies y fotos del carnet llegan a la resolución de la cámara (12+ MP) y
+RetinaFace tarda en proporción a los megapíxeles. Aquí, en memoria:
+1. leer_limitado() lee el UploadFile por trozos y corta apenas pasa
+   BIOMETRIA_MAX_BYTES, sin cargar el resto;
+2. preprocesar() valida el formato (JPEG/PNG/WEBP) y las dimensiones del
+   encabezado (BIOMETRIA_MAX_PIXELES) antes de decodificar nada;
+3. los JPEG se decodifican directamente a 1/2, 1/4 u 1/8 de escala (draft de
+   Pillow, en la IDCT) y luego se reducen a BIOMETRIA_LADO_MAX en el lado mayor;
+4. se aplica la orientación EXIF (las fotos de teléfono vienen giradas) y se
+   entrega un arreglo BGR listo para DeepFace, sin recodificar.
+"""
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from biometria.motor import ImagenInvalida
+
+BIOMETRIA_MAX_BYTES = int(os.getenv("BIOMETRIA_MAX_BYTES", str(10 * 1024 * 1024)))
+BIOMETRIA_MAX_PIXELES = int(os.getenv("BIOMETRIA_MAX_PIXELES", "50000000"))
+BIOMETRIA_LADO_MAX = int(os.getenv("BIOMETRIA_LADO_MAX", "1024"))
+
+FORMATOS = {"JPEG", "MPO", "PNG", "WEBP"}  # MPO: JPEG multi-imagen de algunas cámaras
+_TROZO = 256 * 1024
+_ORIENTACION = 0x0112
+
+
+class ImagenDemasiadoGrande(ImagenInvalida):
+    pass
+
+
+class FormatoNoSoportado(ImagenInvalida):
+    pass
+
+
+async def leer_limitado(upload, max_bytes: int = BIOMETRIA_MAX_BYTES) -> bytes:
+    """Bytes del UploadFile; ImagenDemasiadoGrande en cuanto superan max_bytes."""
+    if upload.size is not None and upload.size > max_bytes:
+        raise ImagenDemasiadoGrande(f"{upload.filename}: supera {max_bytes // 1024} KB")
+    partes, total = [], 0
+    while True:
+        trozo = await upload.read(_TROZO)
+        if not trozo:
+            break
+        total += len(trozo)
+        if total > max_bytes:
+            raise ImagenDemasiadoGrande(f"{upload.filename}: supera {max_bytes // 1024} KB")
+        partes.append(trozo)
+    return b"".join(partes)
+
+
+def preprocesar(datos: bytes, lado_max: int = BIOMETRIA_LADO_MAX) -> tuple:
+    """Bytes de imagen → (arreglo BGR uint8 con lado mayor <= lado_max, info)."""
+    if not datos:
+        raise ImagenInvalida("archivo vacío")
+    try:
+        img = Image.open(io.BytesIO(datos))
+    except UnidentifiedImageError:
+        raise FormatoNoSoportado("formato de imagen no reconocido")
+    except Image.DecompressionBombError as e:
+        raise ImagenDemasiadoGrande(str(e))
+    formato = img.format
+    if formato not in FORMATOS:
+        raise FormatoNoSoportado(f"formato {formato} no soportado (use JPEG, PNG o WEBP)")
+    ancho, alto = img.size
+    if ancho * alto > BIOMETRIA_MAX_PIXELES:
+        raise ImagenDemasiadoGrande(f"{ancho}x{alto} supera {BIOMETRIA_MAX_PIXELES // 1_000_000} MP")
+    orientacion = img.getexif().get(_ORIENTACION, 1)
+
+    try:
+        factor = lado_max / max(ancho, alto)
+        if factor < 1 and formato in ("JPEG", "MPO"):
+            # la escala más chica que siga cubriendo lado_max
+            img.draft("RGB", (max(1, int(ancho * factor)), max(1, int(alto * factor))))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((lado_max, lado_max), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    except (OSError, ValueError) as e:
+        raise ImagenInvalida(f"imagen dañada: {e}")
+
+    bgr = np.ascontiguousarray(np.asarray(img)[:, :, ::-1])
+    return bgr, {
+        "formato": formato,
+        "original": [ancho, alto],
+        "procesada": [bgr.shape[1], bgr.shape[0]],
+        "orientacion_exif": orientacion,
+        "bytes": len(datos),
+    }
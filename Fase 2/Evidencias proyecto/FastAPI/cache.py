@@ -0,0 +1,54 @@
+"""Cache en memoria LRU con TTL por entrada, seguro entre hilos."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, clave):
+        """Devuelve (encontrado, valor). Distingue un None guardado de una ausencia."""
+        ahora = time.monotonic()
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None or item[1] <= ahora:
+                if item is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return True, item[0]
+
+    def guardar(self, clave, valor, ttl: float | None = None):
+        vence = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (valor, vence)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def borrar_si(self, condicion):
+        """Elimina las entradas cuyo (clave, valor) cumple la condición."""
+        with self._lock:
+            for clave in [c for c, (v, _) in self._datos.items() if condicion(c, v)]:
+                del self._datos[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entradas": len(self._datos), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
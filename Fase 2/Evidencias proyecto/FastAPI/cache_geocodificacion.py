@@ -0,0 +1,138 @@
+"""Cache persistente de geocodificación para geocode_best.
+
+Dos niveles: un LRU en memoria por proceso y un archivo SQLite local
+(GEOCACHE_PATH) compartido entre workers y reinicios. La clave es la
+dirección normalizada (sin tildes, mayúsculas ni puntuación) junto a comuna y
+país. Los resultados vencen según el proveedor que los produjo y los "no
+encontrado" también se guardan (caché negativa) con un TTL más corto.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from cache import CacheLRU
+
+GEOCACHE_PATH = os.getenv(
+    "GEOCACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocache.sqlite3")
+)
+_DIA = 86400.0
+# TTL (s) por fuente del resultado; las direcciones casi no cambian de coordenadas
+GEOCACHE_TTL = {
+    "google": float(os.getenv("GEOCACHE_TTL_GOOGLE", str(30 * _DIA))),
+    "nominatim": float(os.getenv("GEOCACHE_TTL_NOMINATIM", str(90 * _DIA))),
+    "geoapify": float(os.getenv("GEOCACHE_TTL_GEOAPIFY", str(30 * _DIA))),
+    "opencage": float(os.getenv("GEOCACHE_TTL_OPENCAGE", str(30 * _DIA))),
+}
+GEOCACHE_TTL_DEFAULT = 30 * _DIA
+GEOCACHE_TTL_NEGATIVO = float(os.getenv("GEOCACHE_TTL_NEGATIVO", str(6 * 3600)))
+GEOCACHE_MEMORIA = int(os.getenv("GEOCACHE_MEMORIA", "2048"))
+
+
+def normalizar(texto: str) -> str:
+    t = unicodedata.normalize("NFKD", texto or "")
+    t = "".join(c for c in t if not unicodedata.combining(c)).lower()
+    t = re.sub(r"\b(n[º°o]\.?|num\.?|numero)\s*(?=\d)", " ", t)
+    t = re.sub(r"[^a-z0-9]+", " ", t)
+    return " ".join(t.split())
+
+
+def clave(direccion: str, comuna: str, pais: str) -> str:
+    return "|".join(normalizar(x) for x in (direccion, comuna, pais))
+
+
+def ttl_para(resultado) -> float:
+    if not resultado:
+        return GEOCACHE_TTL_NEGATIVO
+    # 'nominatim(structured)' -> 'nominatim'
+    fuente = (resultado.get("source") or "").split("(")[0]
+    return GEOCACHE_TTL.get(fuente, GEOCACHE_TTL_DEFAULT)
+
+
+class CacheGeocodificacion:
+    def __init__(self, ruta: str = GEOCACHE_PATH, memoria: int = GEOCACHE_MEMORIA):
+        self.ruta = ruta
+        self.memoria = CacheLRU(maxsize=memoria)
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats_disco = {"hits": 0, "misses": 0, "negativos": 0, "escrituras": 0, "errores": 0}
+
+    def _conexion(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.ruta, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocache ("
+                " clave TEXT PRIMARY KEY,"
+                " resultado TEXT,"  # JSON, o NULL para 'no encontrado'
+                " fuente TEXT,"
+                " creado REAL NOT NULL,"
+                " vence REAL NOT NULL)"
+            )
+        return self._db
+
+    def obtener(self, k: str):
+        """(encontrado, resultado). resultado None con encontrado=True es un negativo cacheado."""
+        hit, valor = self.memoria.obtener(k)
+        if hit:
+            if valor is None:
+                self.stats_disco["negativos"] += 1
+            return True, valor
+        ahora = time.time()
+        try:
+            with self._lock:
+                row = self._conexion().execute(
+                    "SELECT resultado, vence FROM geocache WHERE clave = ?", (k,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[GEOCACHE] error de lectura: {e}")
+            self.stats_disco["errores"] += 1
+            return False, None
+        if row is None or row[1] <= ahora:
+            self.stats_disco["misses"] += 1
+            return False, None
+        self.stats_disco["hits"] += 1
+        resultado = json.loads(row[0]) if row[0] is not None else None
+        if resultado is None:
+            self.stats_disco["negativos"] += 1
+        self.memoria.guardar(k, resultado, ttl=row[1] - ahora)
+        return True, resultado
+
+    def guardar(self, k: str, resultado):
+        ttl = ttl_para(resultado)
+        self.memoria.guardar(k, resultado, ttl=ttl)
+        ahora = time.time()
+        try:
+            with self._lock:
+                db = self._conexion()
+                db.execute(
+                    "INSERT OR REPLACE INTO geocache (clave, resultado, fuente, creado, vence) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        k,
+                        json.dumps(resultado, ensure_ascii=False) if resultado else None,
+                        (resultado or {}).get("source"),
+                        ahora,
+                        ahora + ttl,
+                    ),
+                )
+                db.commit()
+            self.stats_disco["escrituras"] += 1
+        except sqlite3.Error as e:
+            print(f"[GEOCACHE] error de escritura: {e}")
+            self.stats_disco["errores"] += 1
+
+    def purgar_vencidos(self) -> int:
+        with self._lock:
+            db = self._conexion()
+            n = db.execute("DELETE FROM geocache WHERE vence <= ?", (time.time(),)).rowcount
+            db.commit()
+        return n
+
+    def stats(self) -> dict:
+        return {"memoria": self.memoria.stats(), "disco": dict(self.stats_disco), "ruta": self.ruta}
+
+
+geocache = CacheGeocodificacion()
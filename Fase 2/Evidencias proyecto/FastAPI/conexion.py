@@ -1,83 +1,321 @@
 import os
-import requests
+import contextvars
+import queue
+import threading
+import time
 import mysql.connector
 from mysql.connector import Error
 from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
 
 
 load_dotenv()
 
+_DB_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 3306,
+    "user": "root",
+    "password": "1234",
+    "database": "bd_sut",
+    "autocommit": False,
+    "connection_timeout": 5,
+}
+
+# -------------------------------
+# Pool de conexiones MySQL
+# -------------------------------
+# Tamaño base, conexiones extra permitidas en picos, edad máxima (s) antes de
+# reciclar, ping al hacer checkout y espera máxima (s) cuando el pool está lleno.
+#
+# Ojo al dimensionar: la SesionDB de cada request (más abajo) retiene su
+# conexión desde el primer conectar_db() hasta que termina el handler, incluido
+# lo lento que haga después (geocodificar, armar PDFs, etc.). Las conexiones en
+# uso se acercan a los requests concurrentes que tocan la BD, no a las consultas
+# en curso; DB_POOL_SIZE + DB_POOL_OVERFLOW debe cubrir ese pico por worker.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", "10"))
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PING = os.getenv("DB_POOL_PING", "1").lower() not in ("0", "false", "no")
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+
+class ConexionPool:
+    """Envoltorio de una conexión del pool.
+
+    Delega todo en la conexión real, salvo close(), que la devuelve al pool
+    en vez de cerrar el socket. Así el código existente (db.close()) sigue igual.
+    """
+
+    def __init__(self, pool, cnx, creada_en):
+        self._pool = pool
+        self._cnx = cnx
+        self._creada_en = creada_en
+
+    def __getattr__(self, nombre):
+        cnx = self.__dict__.get("_cnx")
+        if cnx is None:
+            raise Error("La conexión ya fue devuelta al pool")
+        return getattr(cnx, nombre)
+
+    def close(self):
+        cnx, self._cnx = self._cnx, None
+        if cnx is not None:
+            self._pool.devolver(cnx, self._creada_en)
+
+
+class PoolConexiones:
+    def __init__(self, config, size=5, overflow=10, recycle=1800.0, ping=True, timeout=5.0):
+        self.config = dict(config)
+        self.size = max(1, size)
+        self.overflow = max(0, overflow)
+        self.recycle = recycle
+        self.ping = ping
+        self.timeout = timeout
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._abiertas = 0
+        self._stats = {
+            "checkouts": 0,
+            "creadas": 0,
+            "recicladas": 0,
+            "ping_fallidos": 0,
+            "esperas": 0,
+            "agotado": 0,
+        }
+
+    def _crear(self):
+        cnx = mysql.connector.connect(**self.config)
+        with self._lock:
+            self._stats["creadas"] += 1
+        return cnx, time.monotonic()
+
+    def _descartar(self, cnx):
+        try:
+            cnx.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._abiertas -= 1
+
+    def _reservar_cupo(self) -> bool:
+        with self._lock:
+            if self._abiertas < self.size + self.overflow:
+                self._abiertas += 1
+                return True
+            return False
+
+    def obtener(self) -> ConexionPool:
+        try:
+            cnx, creada_en = self._libres.get_nowait()
+        except queue.Empty:
+            if self._reservar_cupo():
+                try:
+                    cnx, creada_en = self._crear()
+                except Exception:
+                    with self._lock:
+                        self._abiertas -= 1
+                    raise
+                return self._entregar(cnx, creada_en)
+            with self._lock:
+                self._stats["esperas"] += 1
+            try:
+                cnx, creada_en = self._libres.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._stats["agotado"] += 1
+                raise Error(f"Pool agotado: {self._abiertas} conexiones en uso")
+
+        # reciclar si es muy antigua; si no, comprobar que siga viva
+        if self.recycle and time.monotonic() - creada_en > self.recycle:
+            with self._lock:
+                self._stats["recicladas"] += 1
+            cnx, creada_en = self._reemplazar(cnx)
+        elif self.ping:
+            try:
+                cnx.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._stats["ping_fallidos"] += 1
+                cnx, creada_en = self._reemplazar(cnx)
+        return self._entregar(cnx, creada_en)
+
+    def _reemplazar(self, cnx):
+        # el cupo de la conexión descartada pasa a la nueva
+        try:
+            cnx.close()
+        except Exception:
+            pass
+        try:
+            return self._crear()
+        except Exception:
+            with self._lock:
+                self._abiertas -= 1
+            raise
+
+    def _entregar(self, cnx, creada_en) -> ConexionPool:
+        with self._lock:
+            self._stats["checkouts"] += 1
+        return ConexionPool(self, cnx, creada_en)
+
+    def devolver(self, cnx, creada_en):
+        # descarta transacciones abiertas para no filtrar estado entre requests
+        try:
+            if cnx.in_transaction:
+                cnx.rollback()
+        except Exception:
+            self._descartar(cnx)
+            return
+        # las conexiones de overflow se cierran en vez de quedar ociosas
+        if self._libres.qsize() >= self.size:
+            self._descartar(cnx)
+            return
+        self._libres.put((cnx, creada_en))
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            abiertas = self._abiertas
+            stats = dict(self._stats)
+        libres = self._libres.qsize()
+        return {
+            "size": self.size,
+            "overflow": self.overflow,
+            "recycle_s": self.recycle,
+            "ping": self.ping,
+            "abiertas": abiertas,
+            "libres": libres,
+            "en_uso": abiertas - libres,
+            **stats,
+        }
+
+
+_pool = PoolConexiones(
+    _DB_CONFIG,
+    size=DB_POOL_SIZE,
+    overflow=DB_POOL_OVERFLOW,
+    recycle=DB_POOL_RECYCLE,
+    ping=DB_POOL_PING,
+    timeout=DB_POOL_TIMEOUT,
+)
+
+
+# -------------------------------
+# Sesión por request
+# -------------------------------
+_sesion_actual = contextvars.ContextVar("sesion_db", default=None)
+
+
+class SesionDB:
+    """Conexión única compartida por dependencias y handler de un request.
+
+    Se abre perezosamente (el primer conectar_db() hace el checkout) y la
+    cierra el middleware antes de enviar la respuesta: commit si es < 400,
+    rollback si no. Si el commit falla, finalizar() relanza el error y el
+    middleware responde 500 en lugar del 2xx del handler.
+    despues_del_commit() deja acciones (p. ej. actualizar caches en memoria)
+    que solo corren si ese commit resulta.
+    close() no hace nada para que el código existente pueda seguir llamándolo.
+    """
+
+    def __init__(self):
+        self._db = None
+        self.activa = True
+        self._al_confirmar = []
+
+    def conexion(self):
+        if self._db is None:
+            self._db = _pool.obtener()
+        return self._db
+
+    def __getattr__(self, nombre):
+        return getattr(self.conexion(), nombre)
+
+    def close(self):
+        pass
+
+    def despues_del_commit(self, accion):
+        self._al_confirmar.append(accion)
+
+    def finalizar(self, ok: bool):
+        self.activa = False
+        db, self._db = self._db, None
+        acciones, self._al_confirmar = self._al_confirmar, []
+        if db is None:
+            return
+        try:
+            if ok:
+                db.commit()
+            else:
+                db.rollback()
+        except Error as err:
+            print(f"[DB] Error al finalizar sesión: {err}")
+            if ok:
+                try:
+                    db.rollback()
+                except Error:
+                    pass
+                raise
+        finally:
+            db.close()
+        if ok:
+            for accion in acciones:
+                try:
+                    accion()
+                except Exception as e:
+                    print(f"[DB] Error tras el commit: {e}")
+
+
+def abrir_sesion():
+    sesion = SesionDB()
+    return sesion, _sesion_actual.set(sesion)
+
+
+def cerrar_sesion(token):
+    _sesion_actual.reset(token)
+
+
 def conectar_db():
+    """Conexión para el request en curso; db.close() no la cierra realmente.
+
+    Dentro de un request devuelve la SesionDB compartida; fuera de uno (tareas
+    en segundo plano, scripts) toma una conexión propia del pool. None si falla.
+    """
     try:
-        cnx = mysql.connector.connect(
-            host="127.0.0.1",
-            port=3306,
-            user="root",
-            password="1234",
-            database="bd_sut",
-            autocommit=False,
-            connection_timeout=5
-        )
-        if cnx.is_connected():
-            return cnx
+        sesion = _sesion_actual.get()
+        if sesion is not None and sesion.activa:
+            sesion.conexion()
+            return sesion
+        return _pool.obtener()
     except Error as err:
         print(f"[DB] Error al conectar: {err}")
     return None
 
-# -------------------------------
-# Google Maps Geocoding
-# -------------------------------
-_GOOGLE_MAPS_KEY = (os.getenv("GOOGLE_MAPS_KEY") or "").strip()
 
-_google_session = requests.Session()
-_google_session.headers.update({
-    "User-Agent": "JV-Loader/1.0 (+jorge-dev-demo)"
-})
+def pool_stats() -> dict:
+    return _pool.estadisticas()
 
-def geocode_google(direccion: str, comuna: str = "Maipú", pais: str = "Chile", timeout_sec: float = 8.0):
-    """
-    Geocodifica con Google Maps (dirección -> lat/lon).
-    Devuelve dict con: lat, lon, display_name, source='google'
-    Si no hay clave o falla, devuelve None.
-    timeout_sec: límite por request.
-    """
-    if not _GOOGLE_MAPS_KEY:
-        print("[GOOGLE] Falta GOOGLE_MAPS_KEY")
-        return None
 
+# -------------------------------
+# Dependencias FastAPI
+# -------------------------------
+def get_db():
+    db = conectar_db()
+    if db is None:
+        raise HTTPException(status_code=500, detail="No hay conexión a la base de datos")
     try:
-        # limpiamos espacios extra y evitamos repetir comuna/pais
-        q = f"{(direccion or '').strip()}, {comuna}, {pais}".strip(", ")
-
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {
-            "address": q,
-            # región para sesgo a Chile
-            "region": "cl",
-            # componentes para sesgo fuerte a Maipú/Chile
-            # Nota: 'administrative_area' no siempre matchea; 'locality' Maipú ayuda bastante
-            "components": "country:CL|locality:Maipú",
-            "key": _GOOGLE_MAPS_KEY,
-        }
+        yield db
+    finally:
+        try:
+            db.close()
+        except Exception:
+            pass
+
 
-        r = _google_session.get(url, params=params, timeout=timeout_sec)  # ⬅️ usa timeout paramétrico
-        r.raise_for_status()
-        data = r.json()
-
-        if data.get("status") == "OK" and data.get("results"):
-            # Tomamos el 1º resultado; si quieres, filtra por 'types'
-            res0 = data["results"][0]
-            loc = res0["geometry"]["location"]
-            return {
-                "lat": float(loc["lat"]),
-                "lon": float(loc["lng"]),
-                "display_name": res0.get("formatted_address", q),
-                "source": "google",
-            }
-
-        print("[GOOGLE] sin resultados:", data.get("status"), data.get("error_message"))
-        return None
-
-    except Exception as e:
-        print("[GOOGLE] error:", e)
-        return None
+def get_cursor(db=Depends(get_db)):
+    cur = db.cursor(dictionary=True)
+    try:
+        yield cur
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
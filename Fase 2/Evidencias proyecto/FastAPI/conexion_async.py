@@ -0,0 +1,96 @@
+"""Pool asíncrono de MySQL (aiomysql) para los listados de alto tráfico.
+
+Los handlers sync usan mysql.connector en el threadpool de Starlette (40 hilos
+por defecto), que acota cuántos requests pueden esperar a la BD a la vez. Los
+listados async esperan la BD en el event loop y solo ocupan una conexión del
+pool mientras corre la consulta. La diferencia real depende de la latencia de
+la BD y de los tamaños de pool; medirla con pruebas_rendimiento/bench_listados.py.
+
+Son lecturas con autocommit: no participan de la transacción por request de
+conexion.SesionDB, así que no deben usarse para escrituras.
+"""
+import asyncio
+import os
+
+import aiomysql
+from fastapi import HTTPException
+
+from conexion import _DB_CONFIG
+
+DB_ASYNC_POOL_MIN = int(os.getenv("DB_ASYNC_POOL_MIN", "1"))
+DB_ASYNC_POOL_MAX = int(os.getenv("DB_ASYNC_POOL_MAX", "20"))
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# el pool y su lock pertenecen al event loop que los creó; si cambia el loop
+# (otro TestClient, reinicio) se crean de nuevo en el loop actual
+_pool: aiomysql.Pool | None = None
+_pool_loop = None
+_lock: asyncio.Lock | None = None
+_lock_loop = None
+
+
+def _lock_del_loop(loop) -> asyncio.Lock:
+    global _lock, _lock_loop
+    if _lock is None or _lock_loop is not loop:
+        _lock, _lock_loop = asyncio.Lock(), loop
+    return _lock
+
+
+async def obtener_pool() -> aiomysql.Pool:
+    """Crea el pool en el primer uso (dentro del event loop de la app)."""
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
+        async with _lock_del_loop(loop):
+            if _pool is None or _pool_loop is not loop:
+                _pool_loop = None
+                _pool = await aiomysql.create_pool(
+                    host=_DB_CONFIG["host"],
+                    port=_DB_CONFIG["port"],
+                    user=_DB_CONFIG["user"],
+                    password=_DB_CONFIG["password"],
+                    db=_DB_CONFIG["database"],
+                    connect_timeout=_DB_CONFIG.get("connection_timeout", 5),
+                    autocommit=True,
+                    charset="utf8mb4",
+                    minsize=DB_ASYNC_POOL_MIN,
+                    maxsize=DB_ASYNC_POOL_MAX,
+                    pool_recycle=int(DB_POOL_RECYCLE),
+                )
+                _pool_loop = loop
+    return _pool
+
+
+async def cerrar_pool():
+    global _pool, _pool_loop
+    pool, _pool, _pool_loop = _pool, None, None
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+
+
+async def get_cursor_async():
+    """Dependencia FastAPI: cursor dict async; devuelve la conexión al pool al terminar."""
+    try:
+        pool = await obtener_pool()
+        conn = await pool.acquire()
+    except Exception as e:
+        print(f"[DB ASYNC] Error al conectar: {e}")
+        raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cur:
+            yield cur
+    finally:
+        pool.release(conn)
+
+
+def pool_async_stats() -> dict:
+    if _pool is None:
+        return {"creado": False}
+    return {
+        "creado": True,
+        "tamano": _pool.size,
+        "libres": _pool.freesize,
+        "min": _pool.minsize,
+        "max": _pool.maxsize,
+    }
@@ -42,5 +42,5 @@ def configurar_cors(app):
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["*"],
+        expose_headers=["*", "X-Next-Cursor", "X-Total-Count"],
     )
\ No newline at end of file
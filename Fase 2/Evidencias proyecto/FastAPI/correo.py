@@ -0,0 +1,547 @@
+"""Bandeja de salida de correos (tabla correos_salida) y worker de envío SMTP.
+
+Los endpoints no abren SMTP: encolar_correo() inserta el mensaje en la tabla
+con la misma conexión del request, así que el correo queda registrado solo si
+el cambio que lo origina hace commit (y sobrevive a un reinicio de la API).
+
+El worker reclama lotes de CORREO_LOTE mensajes vencidos con
+SELECT ... FOR UPDATE SKIP LOCKED (varios workers no se pisan), los envía por
+una sola conexión SMTP autenticada que se reutiliza entre mensajes y lotes
+(se cierra tras SMTP_IDLE_SEG sin uso) y marca cada uno:
+- enviado;
+- error temporal (4xx, desconexión, timeout): vuelve a pendiente con backoff
+  exponencial CORREO_BACKOFF_SEG * 2^(intentos-1), hasta CORREO_MAX_INTENTOS;
+- error permanente (5xx, destinatario rechazado): fallido.
+Un mensaje reclamado queda 'enviando' con un plazo (CORREO_PLAZO_SEG); si el
+worker muere a mitad, otro lo retoma cuando vence el plazo.
+
+Envíos masivos (/notificaciones/Notificar): crear_envio() registra el trabajo
+en envios_masivos y encola una fila por destinatario con su id_envio, en
+inserts de varias filas; el request responde de inmediato y progreso_envio()
+da el estado por destinatario.
+
+El worker son CORREO_CONEXIONES hilos, cada uno con su propia conexión SMTP y
+sus propios lotes (SKIP LOCKED), así que envían en paralelo. El límite del
+proveedor, CORREO_MAX_POR_MINUTO, se respeta entre todos los procesos (cada
+worker de uvicorn corre sus propios hilos): los reclamos se serializan con
+GET_LOCK('correos_reclamar') y cada uno toma a lo más lo que queda del cupo
+del último minuto según la tabla (enviados en los últimos 60 s más los que
+están 'enviando'). Dentro del proceso un limitador reparte esos envíos a ritmo
+constante, y cada conexión se renueva tras SMTP_MAX_POR_CONEXION mensajes. El
+tamaño del lote se ajusta para que cada hilo alcance a enviarlo dentro del plazo.
+
+Modos (CORREO_WORKER): "app" (por defecto) corre el worker en hilos de la
+API; "externo" lo deja a un proceso aparte:
+
+    python correo.py
+"""
+import os
+import smtplib
+import socket
+import threading
+import time
+from email.message import EmailMessage
+
+from dotenv import load_dotenv
+
+from conexion import SesionDB, conectar_db
+
+load_dotenv()
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_MODO = os.getenv("SMTP_MODO", "ssl")  # ssl | starttls | plano
+SMTP_PORT = int(os.getenv("SMTP_PORT", {"ssl": "465", "starttls": "587"}.get(SMTP_MODO, "25")))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "20"))
+SMTP_IDLE_SEG = float(os.getenv("SMTP_IDLE_SEG", "60"))
+SMTP_MAX_POR_CONEXION = int(os.getenv("SMTP_MAX_POR_CONEXION", "100"))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+EMAIL_FROM = os.getenv("EMAIL_FROM", EMAIL_USER or "")
+
+CORREO_WORKER = os.getenv("CORREO_WORKER", "app")
+CORREO_LOTE = int(os.getenv("CORREO_LOTE", "50"))
+CORREO_CONEXIONES = max(1, int(os.getenv("CORREO_CONEXIONES", "3")))
+CORREO_MAX_POR_MINUTO = int(os.getenv("CORREO_MAX_POR_MINUTO", "120"))  # 0 = sin límite
+CORREO_INTERVALO_SEG = float(os.getenv("CORREO_INTERVALO_SEG", "2"))
+CORREO_MAX_INTENTOS = int(os.getenv("CORREO_MAX_INTENTOS", "6"))
+CORREO_BACKOFF_SEG = float(os.getenv("CORREO_BACKOFF_SEG", "30"))
+CORREO_BACKOFF_MAX_SEG = float(os.getenv("CORREO_BACKOFF_MAX_SEG", "3600"))
+CORREO_PLAZO_SEG = int(os.getenv("CORREO_PLAZO_SEG", "300"))
+
+DDL_CORREOS_SALIDA = """
+CREATE TABLE IF NOT EXISTS `correos_salida` (
+  `id_correo` bigint NOT NULL AUTO_INCREMENT,
+  `destinatario` varchar(255) NOT NULL,
+  `asunto` varchar(255) NOT NULL,
+  `cuerpo` mediumtext NOT NULL,
+  `adjunto_nombre` varchar(255) DEFAULT NULL,
+  `adjunto` longblob,
+  `estado` enum('pendiente','enviando','enviado','fallido') NOT NULL DEFAULT 'pendiente',
+  `intentos` int NOT NULL DEFAULT '0',
+  `proximo_intento` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `ultimo_error` varchar(500) DEFAULT NULL,
+  `creado_en` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `enviado_en` datetime DEFAULT NULL,
+  `id_envio` bigint DEFAULT NULL,
+  PRIMARY KEY (`id_correo`),
+  KEY `idx_correos_estado_proximo` (`estado`, `proximo_intento`),
+  KEY `idx_correos_envio_estado` (`id_envio`, `estado`),
+  KEY `idx_correos_enviado_en` (`enviado_en`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+"""
+
+DDL_ENVIOS_MASIVOS = """
+CREATE TABLE IF NOT EXISTS `envios_masivos` (
+  `id_envio` bigint NOT NULL AUTO_INCREMENT,
+  `segmento` varchar(50) NOT NULL,
+  `asunto` varchar(255) NOT NULL,
+  `total` int NOT NULL DEFAULT '0',
+  `creado_en` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id_envio`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+"""
+
+_FILAS_POR_INSERT = 500
+
+
+# ---------- Encolar ----------
+
+def encolar_correo(destinatario: str, asunto: str, cuerpo: str, adjunto: bytes | None = None,
+                   adjunto_nombre: str | None = None, conn=None) -> int | None:
+    """Agrega un mensaje a la bandeja de salida. Devuelve id_correo.
+
+    Dentro de un request usa la sesión compartida (commit/rollback junto con el
+    resto del request). Fuera de uno hace commit propio.
+    """
+    propia = conn is None
+    conn = conn or conectar_db()
+    if conn is None:
+        print("[CORREO] Sin conexión a la BD: no se pudo encolar")
+        return None
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO correos_salida (destinatario, asunto, cuerpo, adjunto_nombre, adjunto) VALUES (%s, %s, %s, %s, %s)",
+            (destinatario, asunto, cuerpo, adjunto_nombre, adjunto),
+        )
+        id_correo = cur.lastrowid
+        if propia and not isinstance(conn, SesionDB):
+            conn.commit()
+        return id_correo
+    finally:
+        cur.close()
+        if propia:
+            conn.close()
+
+
+def _insertar_filas(cur, destinatarios: list, asunto: str, cuerpo: str, id_envio: int):
+    for i in range(0, len(destinatarios), _FILAS_POR_INSERT):
+        tramo = destinatarios[i:i + _FILAS_POR_INSERT]
+        marcas = ", ".join(["(%s, %s, %s, %s)"] * len(tramo))
+        params = [v for d in tramo for v in (d, asunto, cuerpo, id_envio)]
+        cur.execute(f"INSERT INTO correos_salida (destinatario, asunto, cuerpo, id_envio) VALUES {marcas}", params)
+
+
+def crear_envio(conn, segmento: str, destinatarios: list, asunto: str, cuerpo: str) -> tuple:
+    """Registra un envío masivo y encola un correo por destinatario (sin repetidos). Devuelve (id_envio, total).
+
+    Usa `conn` sin hacer commit: el llamador decide (en un request, el middleware).
+    """
+    destinatarios = list(dict.fromkeys(d.strip() for d in destinatarios if d and d.strip()))
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO envios_masivos (segmento, asunto, total) VALUES (%s, %s, %s)",
+            (segmento, asunto, len(destinatarios)),
+        )
+        id_envio = cur.lastrowid
+        _insertar_filas(cur, destinatarios, asunto, cuerpo, id_envio)
+        return id_envio, len(destinatarios)
+    finally:
+        cur.close()
+
+
+def progreso_envio(cursor, id_envio: int, limit: int = 0, offset: int = 0) -> dict | None:
+    """Avance de un envío masivo; con limit > 0 incluye el estado de cada destinatario. None si no existe."""
+    cursor.execute("SELECT id_envio, segmento, asunto, total, creado_en FROM envios_masivos WHERE id_envio = %s", (id_envio,))
+    envio = cursor.fetchone()
+    if envio is None:
+        return None
+    cursor.execute(
+        "SELECT estado, COUNT(*) AS n, MAX(enviado_en) AS ultimo FROM correos_salida WHERE id_envio = %s GROUP BY estado",
+        (id_envio,),
+    )
+    conteo = {"pendiente": 0, "enviando": 0, "enviado": 0, "fallido": 0}
+    ultimo = None
+    for fila in cursor.fetchall():
+        conteo[fila["estado"]] = fila["n"]
+        ultimo = fila["ultimo"] or ultimo
+    hechos = conteo["enviado"] + conteo["fallido"]
+    total = envio["total"]
+    envio.update(conteo)
+    envio["procesados"] = hechos
+    envio["porcentaje"] = round(100 * hechos / total, 1) if total else 100.0
+    envio["terminado"] = hechos >= total
+    envio["ultimo_envio"] = ultimo
+    if limit > 0:
+        cursor.execute(
+            "SELECT id_correo, destinatario, estado, intentos, enviado_en, ultimo_error FROM correos_salida "
+            "WHERE id_envio = %s ORDER BY id_correo LIMIT %s OFFSET %s",
+            (id_envio, limit, offset),
+        )
+        envio["destinatarios"] = cursor.fetchall()
+    return envio
+
+
+# ---------- SMTP ----------
+
+def construir_mensaje(fila: dict, remitente: str | None = None) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = fila["asunto"]
+    msg["From"] = remitente or EMAIL_FROM
+    msg["To"] = fila["destinatario"]
+    msg.set_content(fila["cuerpo"])
+    if fila.get("adjunto"):
+        msg.add_attachment(bytes(fila["adjunto"]), maintype="application", subtype="pdf",
+                           filename=fila.get("adjunto_nombre") or "adjunto.pdf")
+    return msg
+
+
+def es_error_permanente(e: Exception) -> bool:
+    """5xx o destinatario rechazado: reintentar no sirve."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
+
+
+def espera_reintento(intentos: int) -> float:
+    return min(CORREO_BACKOFF_SEG * (2 ** max(intentos - 1, 0)), CORREO_BACKOFF_MAX_SEG)
+
+
+class Limitador:
+    """Reparte los envíos del proceso a ritmo constante: a lo más `por_minuto` mensajes por minuto."""
+
+    def __init__(self, por_minuto: int):
+        self.intervalo = 60.0 / por_minuto if por_minuto > 0 else 0.0
+        self._siguiente = 0.0
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+limitador = Limitador(CORREO_MAX_POR_MINUTO)
+
+
+def tamano_lote() -> int:
+    """Lote que un hilo alcanza a enviar en la mitad del plazo con el ritmo permitido."""
+    if not limitador.intervalo:
+        return CORREO_LOTE
+    cabe = int(CORREO_PLAZO_SEG / 2 / (limitador.intervalo * CORREO_CONEXIONES))
+    return max(1, min(CORREO_LOTE, cabe))
+
+
+class EnviadorSMTP:
+    """Conexión SMTP autenticada que se reutiliza entre mensajes."""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, modo=SMTP_MODO, usuario=EMAIL_USER, clave=EMAIL_PASS,
+                 timeout=SMTP_TIMEOUT, idle_seg=SMTP_IDLE_SEG, remitente=None, max_por_conexion=SMTP_MAX_POR_CONEXION):
+        self.host, self.port, self.modo = host, port, modo
+        self.usuario, self.clave = usuario, clave
+        self.remitente = remitente or EMAIL_FROM or usuario
+        self.timeout, self.idle_seg = timeout, idle_seg
+        self.max_por_conexion = max_por_conexion
+        self._smtp = None
+        self._usado_en = 0.0
+        self._en_conexion = 0
+        self.conexiones = 0
+        self.enviados = 0
+
+    def _conectar(self):
+        if self.modo == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.modo == "starttls":
+                smtp.starttls()
+        if self.usuario and self.clave:
+            smtp.login(self.usuario, self.clave)
+        self.conexiones += 1
+        self._en_conexion = 0
+        return smtp
+
+    def enviar(self, msg: EmailMessage):
+        if self._smtp is not None and (time.monotonic() - self._usado_en > self.idle_seg
+                                       or 0 < self.max_por_conexion <= self._en_conexion):
+            self.cerrar()
+        for intento in (1, 2):
+            if self._smtp is None:
+                self._smtp = self._conectar()
+            try:
+                self._smtp.send_message(msg)
+                break
+            except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+                # la conexión reutilizada pudo haberla cerrado el servidor: una reconexión
+                self._descartar()
+                if intento == 2:
+                    raise
+            except smtplib.SMTPRecipientsRefused:
+                raise
+            except smtplib.SMTPResponseException:
+                # deja la sesión lista para el siguiente mensaje
+                try:
+                    self._smtp.rset()
+                except Exception:
+                    self._descartar()
+                raise
+        self._usado_en = time.monotonic()
+        self._en_conexion += 1
+        self.enviados += 1
+
+    def _descartar(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def cerrar(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                try:
+                    smtp.close()
+                except Exception:
+                    pass
+
+    def inactivo(self) -> bool:
+        return self._smtp is not None and time.monotonic() - self._usado_en > self.idle_seg
+
+
+# ---------- Worker ----------
+
+_stats = {"lotes": 0, "enviados": 0, "reintentos": 0, "fallidos": 0, "sin_cupo": 0, "ultimo_lote": None, "ultimo_error": None}
+_stats_lock = threading.Lock()
+
+
+def _sumar(**kw):
+    with _stats_lock:
+        for k, v in kw.items():
+            _stats[k] = _stats[k] + v if isinstance(v, int) else v
+
+
+def _cupo_minuto(cur) -> int | None:
+    """Mensajes que aún caben en el último minuto entre todos los procesos (None: sin límite)."""
+    if CORREO_MAX_POR_MINUTO <= 0:
+        return None
+    cur.execute(
+        "SELECT (SELECT COUNT(*) FROM correos_salida WHERE enviado_en >= NOW() - INTERVAL 60 SECOND) + "
+        "(SELECT COUNT(*) FROM correos_salida WHERE estado = 'enviando' AND proximo_intento > NOW()) AS n"
+    )
+    return max(0, CORREO_MAX_POR_MINUTO - int((cur.fetchone() or {}).get("n") or 0))
+
+
+def _reclamar(conn) -> list:
+    """Toma hasta tamano_lote() mensajes vencidos (sin pasar el cupo por minuto) y los marca 'enviando' con plazo."""
+    cur = conn.cursor(dictionary=True)
+    bloqueado = False
+    try:
+        # un reclamo a la vez entre procesos, para que el cupo leído no lo use otro
+        cur.execute("SELECT GET_LOCK('correos_reclamar', %s) AS ok", (int(CORREO_INTERVALO_SEG * 5),))
+        bloqueado = (cur.fetchone() or {}).get("ok") == 1
+        if not bloqueado:
+            conn.rollback()
+            return []
+        limite = tamano_lote()
+        cupo = _cupo_minuto(cur)
+        if cupo is not None:
+            limite = min(limite, cupo)
+        if limite <= 0:
+            _sumar(sin_cupo=1)
+            conn.rollback()
+            return []
+        cur.execute(
+            "SELECT id_correo, destinatario, asunto, cuerpo, adjunto_nombre, adjunto, intentos FROM correos_salida "
+            "WHERE estado IN ('pendiente', 'enviando') AND proximo_intento <= NOW() "
+            "ORDER BY proximo_intento LIMIT %s FOR UPDATE SKIP LOCKED",
+            (limite,),
+        )
+        filas = cur.fetchall()
+        if filas:
+            marcas = ", ".join(["%s"] * len(filas))
+            cur.execute(
+                f"UPDATE correos_salida SET estado = 'enviando', intentos = intentos + 1, "
+                f"proximo_intento = NOW() + INTERVAL %s SECOND WHERE id_correo IN ({marcas})",
+                (CORREO_PLAZO_SEG, *[f["id_correo"] for f in filas]),
+            )
+        conn.commit()
+        for f in filas:
+            f["intentos"] += 1
+        return filas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if bloqueado:
+            try:
+                cur.execute("SELECT RELEASE_LOCK('correos_reclamar')")
+                cur.fetchall()
+            except Exception:
+                pass
+        cur.close()
+
+
+def _marcar(conn, resultados: list):
+    """resultados: [(id_correo, estado, espera_seg, error)]."""
+    cur = conn.cursor()
+    try:
+        for id_correo, estado, espera, error in resultados:
+            if estado == "enviado":
+                cur.execute(
+                    "UPDATE correos_salida SET estado = 'enviado', enviado_en = NOW(), ultimo_error = NULL WHERE id_correo = %s",
+                    (id_correo,),
+                )
+            else:
+                cur.execute(
+                    "UPDATE correos_salida SET estado = %s, proximo_intento = NOW() + INTERVAL %s SECOND, ultimo_error = %s "
+                    "WHERE id_correo = %s",
+                    (estado, int(espera), (error or "")[:500], id_correo),
+                )
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def procesar_lote(enviador: EnviadorSMTP, limite: Limitador = limitador) -> int:
+    """Envía un lote de la bandeja. Devuelve cuántos mensajes se procesaron."""
+    conn = conectar_db()
+    if conn is None:
+        return 0
+    try:
+        filas = _reclamar(conn)
+        if not filas:
+            return 0
+        resultados = []
+        for f in filas:
+            limite.esperar()
+            try:
+                enviador.enviar(construir_mensaje(f, enviador.remitente))
+                resultados.append((f["id_correo"], "enviado", 0, None))
+                _sumar(enviados=1)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if es_error_permanente(e) or f["intentos"] >= CORREO_MAX_INTENTOS:
+                    resultados.append((f["id_correo"], "fallido", 0, error))
+                    _sumar(fallidos=1, ultimo_error=error)
+                else:
+                    resultados.append((f["id_correo"], "pendiente", espera_reintento(f["intentos"]), error))
+                    _sumar(reintentos=1, ultimo_error=error)
+                print(f"[CORREO] {f['destinatario']}: {error}")
+        _marcar(conn, resultados)
+        _sumar(lotes=1, ultimo_lote=time.time())
+        return len(filas)
+    finally:
+        conn.close()
+
+
+class WorkerCorreos(threading.Thread):
+    def __init__(self, enviador: EnviadorSMTP | None = None, intervalo: float = CORREO_INTERVALO_SEG, nombre: str = "worker-correos"):
+        super().__init__(name=nombre, daemon=True)
+        self.enviador = enviador or EnviadorSMTP()
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+
+    def run(self):
+        print(f"[CORREO] {self.name} iniciado ({SMTP_MODO} {SMTP_HOST}:{SMTP_PORT}, lote {tamano_lote()})")
+        while not self._parar.is_set():
+            try:
+                n = procesar_lote(self.enviador)
+            except Exception as e:
+                print(f"[CORREO] Error en {self.name}: {e}")
+                _sumar(ultimo_error=f"{type(e).__name__}: {e}")
+                n = 0
+            if n < tamano_lote():
+                if self.enviador.inactivo():
+                    self.enviador.cerrar()
+                self._parar.wait(self.intervalo)
+        self.enviador.cerrar()
+
+    def detener(self, timeout: float = 10):
+        self._parar.set()
+        self.join(timeout)
+
+
+_workers: list = []
+
+
+def iniciar_worker(conexiones: int = CORREO_CONEXIONES) -> list:
+    """Arranca `conexiones` hilos de envío (uno por conexión SMTP) si no están corriendo."""
+    global _workers
+    _workers = [w for w in _workers if w.is_alive()]
+    for i in range(len(_workers), conexiones):
+        w = WorkerCorreos(nombre=f"worker-correos-{i + 1}")
+        w.start()
+        _workers.append(w)
+    return _workers
+
+
+def detener_worker():
+    global _workers
+    for w in _workers:
+        w._parar.set()
+    for w in _workers:
+        w.detener()
+    _workers = []
+
+
+def estado_correos() -> dict:
+    """Conteo por estado de la bandeja, pendiente más antiguo y estadísticas del worker de este proceso."""
+    vivos = [w for w in _workers if w.is_alive()]
+    info = {"worker": CORREO_WORKER, "hilos_activos": len(vivos), "max_por_minuto": CORREO_MAX_POR_MINUTO,
+            "lote": tamano_lote()}
+    with _stats_lock:
+        info["stats"] = dict(_stats)
+    info["stats"]["conexiones_smtp"] = sum(w.enviador.conexiones for w in vivos)
+    conn = conectar_db()
+    if conn is None:
+        return info
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT estado, COUNT(*) AS n FROM correos_salida GROUP BY estado")
+        info["bandeja"] = {f["estado"]: f["n"] for f in cur.fetchall()}
+        cur.execute(
+            "SELECT TIMESTAMPDIFF(SECOND, MIN(creado_en), NOW()) AS s FROM correos_salida WHERE estado IN ('pendiente', 'enviando')"
+        )
+        info["pendiente_mas_antiguo_s"] = (cur.fetchone() or {}).get("s")
+        cur.execute(
+            "SELECT id_correo, destinatario, intentos, ultimo_error FROM correos_salida "
+            "WHERE estado = 'fallido' ORDER BY id_correo DESC LIMIT 5"
+        )
+        info["ultimos_fallidos"] = cur.fetchall()
+    except Exception as e:
+        info["error"] = str(e)
+    finally:
+        cur.close()
+        conn.close()
+    return info
+
+
+if __name__ == "__main__":
+    iniciar_worker()
+    try:
+        while any(w.is_alive() for w in _workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        detener_worker()
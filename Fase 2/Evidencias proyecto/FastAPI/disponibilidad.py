@@ -0,0 +1,160 @@
+"""Motor de disponibilidad de reservas: reglas de reserva en una transacción y calendario por sector.
+
+Reglas (las que crear_reserva revisaba con tres consultas seguidas):
+- un vecino no puede reservar dos veces el mismo sector el mismo día;
+- un vecino tiene a lo más RESERVAS_ACTIVAS_MAX reservas pendientes o aprobadas;
+- un sector se reserva una sola vez por día, por cualquier vecino y en cualquier estado.
+
+reservar() las evalúa e inserta en una sola transacción:
+1. SELECT ... FOR UPDATE sobre la fila del vecino: dos reservas simultáneas del
+   mismo vecino se serializan, así que el conteo de activas es el real;
+2. una sola consulta FOR UPDATE calcula las tres reglas; el bloqueo sobre el
+   rango (nombreSector, fecha_inicio) del día impide que otra transacción
+   inserte en ese sector y día hasta el commit;
+3. INSERT y commit.
+Además la migración reservas.dia + UNIQUE (nombreSector, dia) (migraciones.py)
+deja la regla de sector/día garantizada por la BD; si igual choca, el
+duplicado se informa con el mismo 400.
+
+Dos vecinos que reservan a la vez el mismo sector y día libre toman ambos el
+gap lock del rango vacío (no se bloquean entre sí) y al insertar InnoDB aborta
+a uno con deadlock (1213), o vence su espera de bloqueo (1205). Esa transacción
+se reintenta entera RESERVAS_REINTENTOS veces: en el reintento ve la reserva
+del otro y responde el 400 de siempre.
+"""
+import os
+from datetime import date, datetime, timedelta
+
+from fastapi import HTTPException
+from mysql.connector import errorcode
+from mysql.connector.errors import DatabaseError, IntegrityError
+
+from esquema import tiene_columna
+
+RESERVAS_ACTIVAS_MAX = int(os.getenv("RESERVAS_ACTIVAS_MAX", "2"))
+DISPONIBILIDAD_MAX_DIAS = int(os.getenv("DISPONIBILIDAD_MAX_DIAS", "366"))
+RESERVAS_REINTENTOS = int(os.getenv("RESERVAS_REINTENTOS", "1"))
+
+_BLOQUEOS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def rango_dia(dt):
+    """[00:00 del día, 00:00 del día siguiente) para comparar fecha_inicio por rango
+    (usa el índice, a diferencia de DATE(fecha_inicio) = ...)."""
+    inicio = datetime(dt.year, dt.month, dt.day)
+    return inicio.strftime(_FMT), (inicio + timedelta(days=1)).strftime(_FMT)
+
+
+def _rollback(conn):
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+
+def reservar(conn, id_vecino: int, sector: str, fecha: datetime, estado: str, id_uv: int | None = None) -> int:
+    """Valida las reglas e inserta la reserva en una transacción. Devuelve id_reserva.
+
+    Lanza HTTPException(400) con el mismo mensaje de antes para cada regla, y
+    409 si la transacción sigue chocando con otra después de los reintentos.
+    """
+    intento = 0
+    while True:
+        try:
+            return _reservar(conn, id_vecino, sector, fecha, estado, id_uv)
+        except DatabaseError as e:
+            if e.errno not in _BLOQUEOS:
+                raise
+            print(f"[RESERVAS] {sector} {fecha:%Y-%m-%d}: {e.msg} (intento {intento + 1})")
+            if intento >= RESERVAS_REINTENTOS:
+                raise HTTPException(status_code=409, detail="Otra reserva simultánea ocupó el sector; intente nuevamente.")
+            intento += 1
+
+
+def _reservar(conn, id_vecino: int, sector: str, fecha: datetime, estado: str, id_uv: int | None) -> int:
+    desde, hasta = rango_dia(fecha)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT id_vecino FROM vecinos WHERE id_vecino = %s FOR UPDATE", (id_vecino,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=400, detail="El vecino asociado no existe")
+
+        cursor.execute(
+            """
+            SELECT
+                COALESCE(SUM(id_vecino = %s AND estado IN ('pendiente', 'aprobado')), 0) AS activas,
+                COALESCE(SUM(id_vecino = %s AND nombreSector = %s AND fecha_inicio >= %s AND fecha_inicio < %s), 0) AS propia,
+                COALESCE(SUM(nombreSector = %s AND fecha_inicio >= %s AND fecha_inicio < %s), 0) AS ocupado
+            FROM reservas
+            WHERE id_vecino = %s OR (nombreSector = %s AND fecha_inicio >= %s AND fecha_inicio < %s)
+            FOR UPDATE
+            """,
+            (id_vecino, id_vecino, sector, desde, hasta, sector, desde, hasta, id_vecino, sector, desde, hasta),
+        )
+        r = cursor.fetchone()
+        if r["propia"]:
+            raise HTTPException(status_code=400, detail="Ya tienes una reserva para este sector y fecha.")
+        if r["activas"] >= RESERVAS_ACTIVAS_MAX:
+            raise HTTPException(status_code=400, detail=f"No puedes tener más de {RESERVAS_ACTIVAS_MAX} reservas activas.")
+        if r["ocupado"]:
+            raise HTTPException(status_code=400, detail="Ya existe una reserva para este sector y fecha.")
+
+        if tiene_columna("reservas"):
+            cursor.execute(
+                "INSERT INTO reservas (id_vecino, nombreSector, fecha_inicio, estado, id_uv) VALUES (%s, %s, %s, %s, %s)",
+                (id_vecino, sector, fecha.strftime(_FMT), estado, id_uv),
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO reservas (id_vecino, nombreSector, fecha_inicio, estado) VALUES (%s, %s, %s, %s)",
+                (id_vecino, sector, fecha.strftime(_FMT), estado),
+            )
+        id_reserva = cursor.lastrowid
+        conn.commit()
+        return id_reserva
+    except HTTPException:
+        _rollback(conn)
+        raise
+    except IntegrityError as e:
+        _rollback(conn)
+        if e.errno == errorcode.ER_DUP_ENTRY:
+            raise HTTPException(status_code=400, detail="Ya existe una reserva para este sector y fecha.")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        _rollback(conn)
+        raise
+    finally:
+        cursor.close()
+
+
+def calendario(cursor, sector: str, desde: date, hasta: date) -> list:
+    """Días de [desde, hasta] con su ocupación para `sector`, en una sola consulta.
+
+    Devuelve [{"dia": date, "libre": bool, "id_reserva": int | None, "estado": str | None}, ...].
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser igual o posterior a 'desde'")
+    dias = (hasta - desde).days + 1
+    if dias > DISPONIBILIDAD_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {DISPONIBILIDAD_MAX_DIAS} días")
+    cursor.execute(
+        "SELECT id_reserva, fecha_inicio, estado FROM reservas "
+        "WHERE nombreSector = %s AND fecha_inicio >= %s AND fecha_inicio < %s ORDER BY fecha_inicio",
+        (sector, rango_dia(desde)[0], rango_dia(hasta)[1]),
+    )
+    ocupados = {}
+    for fila in cursor.fetchall():
+        ocupados.setdefault(fila["fecha_inicio"].date(), fila)
+    salida = []
+    for i in range(dias):
+        dia = desde + timedelta(days=i)
+        fila = ocupados.get(dia)
+        salida.append({
+            "dia": dia,
+            "libre": fila is None,
+            "id_reserva": fila["id_reserva"] if fila else None,
+            "estado": fila["estado"] if fila else None,
+        })
+    return salida
@@ -1,11 +1,19 @@
 from models.models import Actividad
-from fastapi import HTTPException,APIRouter, Depends, Body, Header
+from fastapi import HTTPException,APIRouter, Depends, Body, Header, Query, Response
 from pydantic import ValidationError, BaseModel
 from typing import List, Optional
 from datetime import datetime
+import os
 
-from conexion import conectar_db
-from jwt.deps import get_admin_uv
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
+
+from conexion import conectar_db, get_cursor
+from conexion_async import get_cursor_async
+from exportacion import exportar, parametro_formato
+from .utils import consulta_paginada, listar, listar_async, Pagina, respuesta_listado
+from esquema import tiene_columna
+from jwt.deps import get_admin_uv, get_directiva
 
 router = APIRouter(
     prefix="/actividades",
@@ -38,39 +46,77 @@ class ActividadCreate(BaseModel):
     ubicacion: Optional[str] = None
     usuarios_enrolados: List[int] = []
 
+
+ENROLAR_LOTE_MAX = int(os.getenv("ENROLAR_LOTE_MAX", "500"))
+
+
+class EnrolamientoLote(BaseModel):
+    usuario_ids: List[int]
+    # False: todos o ninguno; True: llena los cupos libres en el orden recibido
+    parcial: bool = False
+
+
+def _ocupar_cupos(cursor, id_actividad: int, n: int = 1) -> bool:
+    """Suma n a cupo_actual solo si caben (cupo_actual + n <= cupo_max), en una sentencia atómica."""
+    cursor.execute(
+        "UPDATE actividades SET cupo_actual = cupo_actual + %s WHERE id_actividad = %s AND cupo_actual + %s <= cupo_max",
+        (n, id_actividad, n)
+    )
+    return cursor.rowcount == 1
+
+
+# conteo por actividad con subconsulta sobre el índice (actividad_id, usuario_id):
+# el costo depende de las actividades de la página, no del total de inscripciones
+_SQL_ENROLADOS = ", (SELECT COUNT(*) FROM usuarios_en_actividades uea WHERE uea.actividad_id = t.id_actividad) AS enrolados"
+_SQL_ENROLADO = ", EXISTS(SELECT 1 FROM usuarios_en_actividades uea WHERE uea.actividad_id = t.id_actividad AND uea.usuario_id = %s) AS enrolado"
+
+
 @router.get("", response_model=List[Actividad])
-def obtener_actividades():
-    cnx = conectar_db()
-    if cnx is None:
-        raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
+async def obtener_actividades(
+    response: Response,
+    pagina: Pagina = Depends(),
+    usuario_id: Optional[int] = Query(None, description="Si viene, usuarios_enrolados = [usuario_id] cuando está inscrito"),
+    cursor=Depends(get_cursor_async),
+):
+    """Actividades con su número de inscritos (`enrolados`).
 
-    cursor = cnx.cursor(dictionary=True)
-    # LEFT JOIN para obtener usuarios enrolados y datos de la actividad en una sola consulta
-    query = """
-        SELECT a.id_actividad, a.titulo, a.descripcion, a.ubicacion, a.fecha_inicio, a.fecha_fin, a.cupo_max, a.cupo_actual,
-               GROUP_CONCAT(uea.usuario_id) AS usuarios_enrolados
-        FROM actividades a
-        LEFT JOIN usuarios_en_actividades uea ON a.id_actividad = uea.actividad_id
-        GROUP BY a.id_actividad, a.titulo, a.descripcion, a.ubicacion, a.fecha_inicio, a.fecha_fin, a.cupo_max, a.cupo_actual
+    usuarios_enrolados ya no trae la lista completa (ver /actividades/{id}/enrolados):
+    con ?usuario_id= contiene solo ese id si está inscrito, que es lo que usa el frontend.
     """
+    extra_select, extra_params = _SQL_ENROLADOS, ()
+    if usuario_id is not None:
+        extra_select += _SQL_ENROLADO
+        extra_params = (usuario_id,)
+    consulta = consulta_paginada('actividades', "FROM actividades t", [], (), pagina,
+                                 extra_select=extra_select, extra_params=extra_params)
 
     try:
-        cursor.execute(query)
-        resultados = cursor.fetchall()
-        actividades = []
+        resultados = await listar_async(cursor, 'actividades', consulta, pagina, response)
         for row in resultados:
-            # Parsear usuarios_enrolados como lista de int si no es None
-            if row["usuarios_enrolados"]:
-                row["usuarios_enrolados"] = [int(uid) for uid in row["usuarios_enrolados"].split(",") if uid]
-            else:
-                row["usuarios_enrolados"] = []
-            actividades.append(Actividad(**row))
-        return actividades
+            row["usuarios_enrolados"] = [usuario_id] if row.pop("enrolado", False) else []
+        if pagina.campos:
+            return respuesta_listado(resultados, pagina, response)
+        return [Actividad(**row) for row in resultados]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener actividades: {e}")
-    finally:
-        cursor.close()
-        cnx.close()
+
+
+@router.get("/{actividad_id}/enrolados")
+def listar_enrolados(actividad_id: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor),
+                     usuario=Depends(get_directiva)):
+    """Inscritos de una actividad, paginados por usuario_id (recorre el índice (actividad_id, usuario_id)).
+
+    Trae el nombre de usuario de cada inscrito, por eso solo para la directiva.
+    """
+    consulta = consulta_paginada(
+        'usuarios_en_actividades',
+        "FROM usuarios_en_actividades t LEFT JOIN usuarios u ON u.id_usuario = t.usuario_id",
+        ["t.actividad_id = %s"], (actividad_id,), pagina,
+        order_by='usuario_id', extra_select=", u.nombre",
+    )
+    return listar(cursor, 'usuarios_en_actividades', consulta, pagina, response, order_by='usuario_id')
 
 @router.get("/{actividad_id}", response_model=Actividad)
 def obtener_actividad(actividad_id: int):
@@ -115,14 +161,7 @@ def crear_actividad(payload: dict = Body(...), id_uv: int | None = Depends(get_a
     cursor = cnx.cursor()
     try:
         # Verificar si la tabla tiene columna id_uv
-        try:
-            cursor.execute(
-                "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'id_uv'",
-                ("actividades",)
-            )
-            has_id_uv = cursor.fetchone() is not None
-        except Exception:
-            has_id_uv = False
+        has_id_uv = tiene_columna("actividades")
 
         # Convertir fechas a formato MySQL
         fecha_inicio = iso_to_mysql(actividad_data.fecha_inicio)
@@ -161,17 +200,16 @@ def crear_actividad(payload: dict = Body(...), id_uv: int | None = Depends(get_a
         cursor.execute(query, values)
         actividad_id = cursor.lastrowid
 
-        # Enrolar automáticamente al usuario creador
+        # Enrolar automáticamente al usuario creador (si el cupo lo permite)
         try:
             cursor.execute(
                 "INSERT INTO usuarios_en_actividades (usuario_id, actividad_id) VALUES (%s, %s)",
                 (actividad_data.id_usuario, actividad_id)
             )
-            # Actualizar el cupo_actual (ya que el usuario creador está enrolado)
-            cursor.execute(
-                "UPDATE actividades SET cupo_actual = cupo_actual + 1 WHERE id_actividad = %s",
-                (actividad_id,)
-            )
+            id_inscripcion = cursor.lastrowid
+            if not _ocupar_cupos(cursor, actividad_id):
+                # cupo_actual inicial ya completo: el creador no queda inscrito
+                cursor.execute("DELETE FROM usuarios_en_actividades WHERE id = %s", (id_inscripcion,))
         except Exception:
             pass  # Si ya está enrolado o hay error, continuar igual
 
@@ -194,37 +232,117 @@ def crear_actividad(payload: dict = Body(...), id_uv: int | None = Depends(get_a
 # Enrolar usuario a actividad
 @router.post("/{id_actividad}/enrolar")
 def enrolar_usuario(id_actividad: int, usuario_id: int = Body(..., embed=True)):
+    """Bloqueo de la actividad + INSERT (la UNIQUE (usuario_id, actividad_id) detecta el
+    duplicado) + UPDATE condicional del cupo; nunca se supera cupo_max.
+
+    La fila de la actividad se bloquea antes del INSERT, igual que en el lote: ambos
+    caminos toman los bloqueos en el mismo orden y no se cruzan en un deadlock.
+    """
     cnx = conectar_db()
     if cnx is None:
         raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
     cursor = cnx.cursor()
     try:
-        # Verifica si el usuario ya está enrolado
-        cursor.execute(
-            "SELECT id FROM usuarios_en_actividades WHERE usuario_id = %s AND actividad_id = %s",
-            (usuario_id, id_actividad)
-        )
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="El usuario ya está enrolado en esta actividad")
-        # Enrola al usuario
+        cursor.execute("SELECT 1 FROM actividades WHERE id_actividad = %s FOR UPDATE", (id_actividad,))
+        if cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Actividad no encontrada")
+        try:
+            cursor.execute(
+                "INSERT INTO usuarios_en_actividades (usuario_id, actividad_id) VALUES (%s, %s)",
+                (usuario_id, id_actividad)
+            )
+        except IntegrityError as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise HTTPException(status_code=400, detail="El usuario ya está enrolado en esta actividad")
+            raise
+        if not _ocupar_cupos(cursor, id_actividad):
+            raise HTTPException(status_code=409, detail="No quedan cupos en esta actividad")
+        cnx.commit()
+        return {"detail": "Usuario enrolado correctamente"}
+    except HTTPException as he:
+        cnx.rollback()
+        raise he
+    except Exception as e:
+        cnx.rollback()
+        print("Error al enrolar usuario:", e)
+        raise HTTPException(status_code=500, detail="Error interno al enrolar usuario")
+    finally:
+        cursor.close()
+        cnx.close()
+
+
+@router.post("/{id_actividad}/enrolar/lote")
+def enrolar_usuarios_lote(
+    id_actividad: int,
+    lote: EnrolamientoLote,
+    usuario=Depends(get_directiva),
+):
+    """Enrola varios usuarios en una transacción: bloqueo de la actividad, un SELECT de
+    los ya enrolados, un INSERT multi-fila y un UPDATE del cupo.
+
+    Las inscripciones individuales concurrentes esperan el mismo bloqueo antes de
+    insertar, así que no pueden colarse entre el SELECT y el INSERT del lote.
+    """
+    ids = list(dict.fromkeys(lote.usuario_ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="usuario_ids vacío")
+    if len(ids) > ENROLAR_LOTE_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {ENROLAR_LOTE_MAX} usuarios por lote")
+
+    cnx = conectar_db()
+    if cnx is None:
+        raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
+    cursor = cnx.cursor(dictionary=True)
+    try:
         cursor.execute(
-            "INSERT INTO usuarios_en_actividades (usuario_id, actividad_id) VALUES (%s, %s)",
-            (usuario_id, id_actividad)
+            "SELECT cupo_max, cupo_actual FROM actividades WHERE id_actividad = %s FOR UPDATE",
+            (id_actividad,)
         )
-        # Actualiza el cupo_actual
+        act = cursor.fetchone()
+        if act is None:
+            raise HTTPException(status_code=404, detail="Actividad no encontrada")
+
+        marcas = ", ".join(["%s"] * len(ids))
+        # lectura con bloqueo: ve lo último confirmado aunque la transacción ya tenga snapshot
         cursor.execute(
-            "UPDATE actividades SET cupo_actual = cupo_actual + 1 WHERE id_actividad = %s",
-            (id_actividad,)
+            f"SELECT usuario_id FROM usuarios_en_actividades WHERE actividad_id = %s AND usuario_id IN ({marcas}) FOR UPDATE",
+            (id_actividad, *ids)
         )
+        ya = {fila["usuario_id"] for fila in cursor.fetchall()}
+        nuevos = [u for u in ids if u not in ya]
+        libres = max(act["cupo_max"] - act["cupo_actual"], 0)
+        if len(nuevos) > libres and not lote.parcial:
+            raise HTTPException(
+                status_code=409,
+                detail={"mensaje": "No hay cupos para todo el lote", "cupos_libres": libres, "solicitados": len(nuevos)},
+            )
+        enrolar, sin_cupo = nuevos[:libres], nuevos[libres:]
+
+        if enrolar:
+            filas = ", ".join(["(%s, %s)"] * len(enrolar))
+            cursor.execute(
+                f"INSERT INTO usuarios_en_actividades (usuario_id, actividad_id) VALUES {filas}",
+                tuple(v for u in enrolar for v in (u, id_actividad))
+            )
+            cursor.execute(
+                "UPDATE actividades SET cupo_actual = cupo_actual + %s WHERE id_actividad = %s",
+                (len(enrolar), id_actividad)
+            )
         cnx.commit()
-        return {"detail": "Usuario enrolado correctamente"}
+        return {
+            "enrolados": enrolar,
+            "ya_enrolados": [u for u in ids if u in ya],
+            "sin_cupo": sin_cupo,
+            "cupo_actual": act["cupo_actual"] + len(enrolar),
+            "cupo_max": act["cupo_max"],
+        }
     except HTTPException as he:
         cnx.rollback()
         raise he
     except Exception as e:
         cnx.rollback()
-        print("Error al enrolar usuario:", e)
-        raise HTTPException(status_code=500, detail="Error interno al enrolar usuario")
+        print("Error al enrolar lote:", e)
+        raise HTTPException(status_code=500, detail="Error interno al enrolar usuarios")
     finally:
         cursor.close()
         cnx.close()
@@ -287,19 +405,14 @@ def eliminar_actividad(actividad_id: int):
         cnx.close()
 
 @router.get("/uv/{id_uv}")
-def listar_actividades_por_uv(id_uv: int):
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            SELECT * FROM actividades WHERE id_uv = %s
-            ORDER BY fecha_inicio DESC
-        """, (id_uv,))
-        rows = cursor.fetchall()
-        return rows
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+def listar_actividades_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
+    consulta = consulta_paginada('actividades', "FROM actividades t", ["t.id_uv = %s"], (id_uv,), pagina, order_by='fecha_inicio DESC')
+    return listar(cursor, 'actividades', consulta, pagina, response, order_by='fecha_inicio DESC')
+
+
+@router.get("/uv/{id_uv}/export")
+async def exportar_actividades_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Exporta todas las actividades de la UV en streaming (NDJSON, CSV o JSON), sin cargarlas en memoria."""
+    consulta = consulta_paginada('actividades', "FROM actividades t", ["t.id_uv = %s"], (id_uv,), order_by='fecha_inicio DESC')
+    return await exportar(consulta, formato, f"actividades_uv{id_uv}")
 
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from models.models import Usuario
-from conexion import conectar_db
+from conexion import conectar_db, get_cursor
+from jwt.deps import invalidar_usuario
 
 router = APIRouter(prefix="/usuarios", tags=["CRUD Usuarios"])
 
@@ -9,28 +10,15 @@ router = APIRouter(prefix="/usuarios", tags=["CRUD Usuarios"])
 # CRUD usuarios
 
 @router.get("/", response_model=List[Usuario])
-def listar_usuarios():
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-
+def listar_usuarios(cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM usuarios")
-    result = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-    return result
+    return cursor.fetchall()
 
 @router.get("/{usuario_id}", response_model=Usuario)
-def obtener_usuario(usuario_id: int):
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-
+def obtener_usuario(usuario_id: int, cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM usuarios WHERE id_usuario = %s", (usuario_id,))
     usuario = cursor.fetchone()
 
-    cursor.close()
-    conn.close()
-
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return usuario
@@ -51,6 +39,7 @@ def actualizar_usuario(usuario_id: int, usuario: Usuario):
 
     cursor.execute(query, values)
     conn.commit()
+    invalidar_usuario(id_usuario=usuario_id, id_vecino=usuario.id_vecino, rut=usuario.rut)
 
     if cursor.rowcount == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -70,6 +59,7 @@ def eliminar_usuario(usuario_id: int):
 
     cursor.execute("DELETE FROM usuarios WHERE id_usuario = %s", (usuario_id,))
     conn.commit()
+    invalidar_usuario(id_usuario=usuario_id)
 
     if cursor.rowcount == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -86,6 +76,7 @@ def actualizar_rol(user_id: int, rol: str):
     cursor = conn.cursor()
     cursor.execute("UPDATE usuarios SET rol=%s WHERE id_usuario=%s", (rol, user_id))
     conn.commit()
+    invalidar_usuario(id_usuario=user_id)
     if cursor.rowcount == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     cursor.close()
@@ -1,58 +1,165 @@
 # endpoints/endpointBiometria.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from deepface import DeepFace
-import tempfile, shutil, os
+import time
+
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from starlette.concurrency import run_in_threadpool
+from biometria.motor import MotorNoListo, ImagenInvalida, BIOMETRIA_MODELO
+from biometria.pool import pool_biometrico, Saturado, TiempoAgotado
+from biometria.embeddings import (
+    RostroYaRegistrado, duplicados, embedding_de, guardar_embedding, indice_info, reemplazar_embedding,
+)
+from biometria.preproceso import leer_limitado, preprocesar, ImagenDemasiadoGrande, FormatoNoSoportado
+from jwt.deps import get_current_user, get_directiva
 
 router = APIRouter(prefix="/biometria", tags=["biometria"])
 
+
+async def _en_pool(trabajo):
+    """Espera un trabajo del pool biométrico traduciendo sus errores a HTTP."""
+    try:
+        return await trabajo
+    except Saturado as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.reintentar_en)})
+    except TiempoAgotado as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except MotorNoListo as e:
+        raise HTTPException(status_code=503, detail=f"Motor biométrico no disponible: {e}")
+
+
+async def _preparar(upload: UploadFile) -> tuple:
+    """Lee el archivo con tope de tamaño y lo deja orientado y reducido, antes de ocupar el pool."""
+    try:
+        datos = await leer_limitado(upload)
+        return await run_in_threadpool(preprocesar, datos)
+    except ImagenDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=f"Imagen demasiado grande: {e}")
+    except FormatoNoSoportado as e:
+        raise HTTPException(status_code=415, detail=f"Formato no soportado: {e}")
+    except ImagenInvalida as e:
+        raise HTTPException(status_code=422, detail=f"Imagen inválida: {e}")
+
+
+def _tiempos(resultado: dict, t0: float, t_pre: float, imagenes: dict) -> dict:
+    resultado["preprocesamiento_ms"] = round((t_pre - t0) * 1000, 1)
+    resultado["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    resultado["imagenes"] = imagenes
+    return resultado
+
+@router.get("/estado")
+def estado_biometria():
+    """Readiness: 200 con al menos un trabajador con los modelos cargados y calentados, 503 mientras no."""
+    info = {**pool_biometrico.info(), "embeddings": indice_info()}
+    if not pool_biometrico.listo():
+        raise HTTPException(status_code=503, detail=info)
+    return info
+
+@router.post("/calentar")
+async def calentar_biometria():
+    """Carga y calienta los modelos de un trabajador si aún no lo están (espera a que terminen)."""
+    await _en_pool(pool_biometrico.calentar())
+    return pool_biometrico.info()
+
+async def _carnet_vs_selfie(id_front: UploadFile, selfie: UploadFile) -> tuple:
+    """Compara carnet y selfie en el pool; devuelve (resultado, embedding de la selfie, tiempos)."""
+    # las imágenes se decodifican y reducen en memoria, sin archivos temporales
+    t0 = time.perf_counter()
+    img_front, info_front = await _preparar(id_front)
+    img_selfie, info_selfie = await _preparar(selfie)
+    t_pre = time.perf_counter()
+    try:
+        # ArcFace + RetinaFace en el pool de procesos; match si distance <= threshold
+        resultado = await _en_pool(pool_biometrico.verificar(img_front, img_selfie))
+    except HTTPException:
+        raise
+    except ImagenInvalida as e:
+        raise HTTPException(status_code=422, detail=f"Imagen inválida: {e}")
+    except Exception as e:
+        # Si no detecta rostro con enforce_detection=True, caerá aquí
+        raise HTTPException(status_code=422, detail=f"No se pudo detectar rostros válidos: {e}")
+    embedding = resultado.pop("embedding")
+    return resultado, embedding, (t0, t_pre, {"id_front": info_front, "selfie": info_selfie})
+
+
+async def _registrado_con_otro_rut(resultado: dict, embedding, rut: str | None = None) -> bool:
+    """1:N contra los rostros guardados. Los RUT que coinciden quedan solo en el log del servidor."""
+    otros = await run_in_threadpool(duplicados, embedding, rut, resultado["threshold"])
+    if not otros:
+        return False
+    print(f"[BIOMETRIA] rostro de {rut or 'registro nuevo'} coincide con {otros}")
+    resultado["match"] = False
+    resultado["error"] = "No se pudo verificar la identidad"
+    return True
+
+
 @router.post("/verificar")
 async def verificar_identidad(
     id_front: UploadFile = File(...),
-    selfie: UploadFile = File(...)
+    selfie: UploadFile = File(...),
 ):
-    tmp_front = None
-    tmp_selfie = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as f1:
-            shutil.copyfileobj(id_front.file, f1)
-            tmp_front = f1.name
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as f2:
-            shutil.copyfileobj(selfie.file, f2)
-            tmp_selfie = f2.name
-
-        # Modelo y detector recomendados
-        result = DeepFace.verify(
-            img1_path=tmp_front,
-            img2_path=tmp_selfie,
-            model_name="ArcFace",            # mejor separabilidad
-            detector_backend="retinaface",   # detector más robusto
-            distance_metric="cosine",
-            enforce_detection=True           # exige detección real
-        )
-        # Regla correcta: match si distance <= threshold
-        distance = float(result.get("distance", 1.0))
-        threshold = float(result.get("threshold", 0.4))  # DeepFace devuelve uno específico
-        match = distance <= threshold
-
-        # Confianza normalizada 0..1 (aprox) según umbral
-        # 1.0 cuando distance = 0 ; 0.5 cuando distance = threshold ; 0 si distance >= 2*threshold
-        confidence = max(0.0, min(1.0, 1.0 - (distance/threshold)/2.0))
-
-        return {
-            "match": bool(match),
-            "distance": distance,
-            "threshold": threshold,
-            "confidence": confidence
-        }
+    """Carnet vs selfie antes de registrarse. También rechaza un rostro que ya está
+    registrado (1:N), sin decir con qué RUT; no guarda nada."""
+    resultado, embedding, tiempos = await _carnet_vs_selfie(id_front, selfie)
+    await _registrado_con_otro_rut(resultado, embedding)
+    return _tiempos(resultado, *tiempos)
+
+
+@router.post("/enrolar")
+async def enrolar_rostro(
+    id_front: UploadFile = File(...),
+    selfie: UploadFile = File(...),
+    usuario=Depends(get_current_user),
+):
+    """Carnet vs selfie del usuario autenticado; si coincide guarda el embedding de su propio RUT.
+    Solo la primera vez: cambiarlo es /reenrolar."""
+    if not usuario.get("rut"):
+        raise HTTPException(status_code=400, detail="El usuario no tiene RUT")
+    resultado, embedding, tiempos = await _carnet_vs_selfie(id_front, selfie)
+    resultado["guardado"] = False
+    if resultado["match"] and not await _registrado_con_otro_rut(resultado, embedding, usuario["rut"]):
+        try:
+            await run_in_threadpool(guardar_embedding, usuario["rut"], embedding, BIOMETRIA_MODELO)
+        except RostroYaRegistrado:
+            raise HTTPException(
+                status_code=409,
+                detail="Ya hay un rostro registrado para este RUT; para cambiarlo acuda a la directiva",
+            )
+        resultado["guardado"] = True
+    return _tiempos(resultado, *tiempos)
 
+
+@router.post("/reenrolar")
+async def reenrolar_rostro(
+    rut: str = Form(...),
+    id_front: UploadFile = File(...),
+    selfie: UploadFile = File(...),
+    usuario=Depends(get_directiva),
+):
+    """La directiva reemplaza el rostro guardado de un RUT tras comparar su carnet con la selfie."""
+    resultado, embedding, tiempos = await _carnet_vs_selfie(id_front, selfie)
+    resultado["guardado"] = False
+    if resultado["match"] and not await _registrado_con_otro_rut(resultado, embedding, rut):
+        await run_in_threadpool(reemplazar_embedding, rut, embedding, BIOMETRIA_MODELO)
+        print(f"[BIOMETRIA] rostro de {rut} re-enrolado por usuario {usuario.get('id_usuario')}")
+        resultado["guardado"] = True
+    return _tiempos(resultado, *tiempos)
+
+
+@router.post("/reverificar")
+async def reverificar_identidad(selfie: UploadFile = File(...), usuario=Depends(get_current_user)):
+    """1:1 de una selfie contra el embedding guardado del propio usuario, sin el carnet.
+
+    Solo responde match: la distancia serviría para ir ajustando una imagen hasta calzar.
+    """
+    guardado = await run_in_threadpool(embedding_de, usuario.get("rut"))
+    if guardado is None:
+        raise HTTPException(status_code=404, detail="No hay rostro registrado para este usuario")
+    img_selfie, _ = await _preparar(selfie)
+    try:
+        resultado = await _en_pool(pool_biometrico.comparar(img_selfie, guardado))
+    except HTTPException:
+        raise
+    except ImagenInvalida as e:
+        raise HTTPException(status_code=422, detail=f"Imagen inválida: {e}")
     except Exception as e:
-        # Si no detecta rostro con enforce_detection=True, caerá aquí
         raise HTTPException(status_code=422, detail=f"No se pudo detectar rostros válidos: {e}")
-    finally:
-        for p in (tmp_front, tmp_selfie):
-            try:
-                if p and os.path.exists(p):
-                    os.remove(p)
-            except:
-                pass
\ No newline at end of file
+    return {"match": bool(resultado["match"])}
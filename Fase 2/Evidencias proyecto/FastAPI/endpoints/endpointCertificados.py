@@ -1,28 +1,23 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header, Body
+from fastapi import APIRouter, HTTPException, Depends, Header, Body, Response
 from pydantic import ValidationError
 from pydantic import BaseModel
 from models.models import CertificadoResidencia
-from conexion import conectar_db
-from jwt.deps import get_admin_uv
+from conexion import conectar_db, get_cursor
+from esquema import tiene_columna
+from jwt.deps import get_admin_uv, get_directiva
 from jwt.jwt_utils import verificar_access_token
-from .utils import list_by_uv
+from conexion_async import get_cursor_async
+from exportacion import exportar, parametro_formato
+from .utils import list_by_uv, list_by_uv_async, consulta_por_uv, Pagina
+
+from correo import encolar_correo
 
 from fpdf import FPDF
-from email.message import EmailMessage
-import smtplib
 import re
 import traceback
 
 router = APIRouter()
 
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
-
 @router.post("/certificados/residencia",tags=["CRUD Certificados"])
 def emitir_certificado(
     payload: dict = Body(...),
@@ -74,15 +69,7 @@ def emitir_certificado(
             raise HTTPException(status_code=404, detail="Vecino no encontrado")
 
     # Comprueba si la columna id_uv existe en la tabla certificados; si no, hace un INSERT sin ella
-        try:
-            cursor.execute(
-                "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'id_uv'",
-                ("certificados",)
-            )
-            has_id_uv = cursor.fetchone() is not None
-        except Exception:
-            # En caso de error en la comprobación, asumir que la columna no existe para evitar romper
-            has_id_uv = False
+        has_id_uv = tiene_columna("certificados")
 
         # Debug: mostrar el id_uv efectivo y si la tabla tiene la columna
         print(f"[DEBUG] effective_id_uv={effective_id_uv} has_id_uv={has_id_uv}")
@@ -140,43 +127,32 @@ def obtener_certificado(rut: str):
     return certificado
 
 @router.get("/certificados/residencia",tags=["CRUD Certificados"])
-def listar_certificados(id_uv: int | None = Depends(get_admin_uv)):
+async def listar_certificados(response: Response, id_uv: int | None = Depends(get_admin_uv), pagina: Pagina = Depends(), cursor=Depends(get_cursor_async)):
     """Lista certificados. Si el token no permite derivar id_uv devuelve lista vacía.
     Si id_uv está presente, filtra por la UV correspondiente (mediante join con vecinos si es necesario).
     """
     # Use central helper
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        certificados = list_by_uv(cursor, 'certificados', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_solicitud DESC')
-        return certificados
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    return await list_by_uv_async(cursor, 'certificados', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_solicitud DESC', pagina=pagina, response=response)
 
 
 @router.get("/certificados/uv/{id_uv}", tags=["CRUD Certificados"])
-def listar_certificados_por_uv(id_uv: int):
+def listar_certificados_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
     """Listado de certificados filtrado por id_uv (recibe id_uv en el path)."""
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        rows = list_by_uv(cursor, 'certificados', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_solicitud DESC')
-        return rows
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    return list_by_uv(cursor, 'certificados', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_solicitud DESC', pagina=pagina, response=response)
+
+
+@router.get("/uv/{id_uv}/export")
+async def exportar_certificados_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Exporta todos los certificados de la UV en streaming (NDJSON, CSV o JSON), sin cargarlas en memoria."""
+    consulta = consulta_por_uv('certificados', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_solicitud DESC')
+    return await exportar(consulta, formato, f"certificados_uv{id_uv}")
 
 class EstadoCertificado(BaseModel):
     estado: str
     razon: str = None  # Para la razón de rechazo
 
 @router.put("/certificados/residencia/{id_certificado}",tags=["CRUD Certificados"])
-def actualizar_estado_certificado(id_certificado: int, estado_data: EstadoCertificado, background_tasks: BackgroundTasks):
+def actualizar_estado_certificado(id_certificado: int, estado_data: EstadoCertificado):
     conn = conectar_db()
     cursor = conn.cursor(dictionary=True)
     # Si es rechazo, actualiza también la razón
@@ -190,9 +166,8 @@ def actualizar_estado_certificado(id_certificado: int, estado_data: EstadoCertif
             "UPDATE certificados SET estado = %s WHERE id_certificado = %s",
             (estado_data.estado, id_certificado)
         )
-    conn.commit()
 
-    # Si es rechazo, busca el correo y envía el email
+    # Si es rechazo, busca el correo y encola el email (se guarda junto con el cambio de estado)
     if estado_data.estado == "rechazado":
         cursor.execute("SELECT id_vecino FROM certificados WHERE id_certificado = %s", (id_certificado,))
         cert = cursor.fetchone()
@@ -200,54 +175,33 @@ def actualizar_estado_certificado(id_certificado: int, estado_data: EstadoCertif
             cursor.execute("SELECT correo FROM vecinos WHERE id_vecino = %s", (cert["id_vecino"],))
             vecino = cursor.fetchone()
             if vecino and vecino["correo"]:
-                background_tasks.add_task(enviar_correo_rechazo, vecino["correo"], estado_data.razon)
+                enviar_correo_rechazo(vecino["correo"], estado_data.razon)
+    conn.commit()
     cursor.close()
     conn.close()
     return {"mensaje": "Estado actualizado"}
 
 def enviar_correo_rechazo(correo_destino, razon):
-    remitente = EMAIL_USER
-    password = EMAIL_PASS
     asunto = "Solicitud de Certificado Rechazada"
     cuerpo = f"Estimado/a,\n\nSu solicitud de certificado ha sido rechazada por la siguiente razón:\n\n{razon}\n\nAtentamente,\nJunta de Vecinos"
-
-    msg = EmailMessage()
-    msg["Subject"] = asunto
-    msg["From"] = remitente
-    msg["To"] = correo_destino
-    msg.set_content(cuerpo)
-
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(remitente, password)
-            smtp.send_message(msg)
-        print(f"Correo de rechazo enviado a {correo_destino}")
-    except Exception as e:
-        print(f"Error al enviar correo de rechazo: {e}")
+    encolar_correo(correo_destino, asunto, cuerpo)
+    print(f"Correo de rechazo encolado para {correo_destino}")
 
 @router.post("/certificados/enviar_pdf/{id_certificado}",tags=["CRUD Certificados"])
-def enviar_pdf_certificado(id_certificado: int, background_tasks: BackgroundTasks):
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
+def enviar_pdf_certificado(id_certificado: int, cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM certificados WHERE id_certificado = %s", (id_certificado,))
     certificado = cursor.fetchone()
-    cursor.close()
-    conn.close()
     if not certificado:
         raise HTTPException(status_code=404, detail="Certificado no encontrado")
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
     cursor.execute("SELECT correo FROM vecinos WHERE id_vecino = %s", (certificado["id_vecino"],))
     vecino = cursor.fetchone()
-    cursor.close()
-    conn.close()
     if not vecino or not vecino["correo"]:
         raise HTTPException(status_code=404, detail="Correo del vecino no encontrado")
 
-    background_tasks.add_task(generar_y_enviar_pdf, certificado, vecino["correo"])
-    return {"mensaje": "El PDF se está generando y enviando al correo."}
+    id_correo = generar_y_enviar_pdf(certificado, vecino["correo"])
+    return {"mensaje": "El PDF se generó y quedó en cola para enviarse al correo.", "id_correo": id_correo}
 
-def generar_y_enviar_pdf(certificado, correo_destino):
+def generar_pdf_certificado(certificado) -> bytes:
     pdf = FPDF()
     pdf.add_page()
 
@@ -318,36 +272,16 @@ def generar_y_enviar_pdf(certificado, correo_destino):
     pdf.cell(0, 8, "_________________________", ln=True, align="R")
     pdf.cell(0, 8, "Firma y Timbre", ln=True, align="R")
 
+    # en memoria: sin archivo temporal en el directorio de trabajo
+    return pdf.output(dest="S").encode("latin-1")
+
+def generar_y_enviar_pdf(certificado, correo_destino):
     nombre = certificado['nombreVecino']
     nombre_archivo = re.sub(r'[^\w\s-]', '', nombre).strip().replace(' ', '_')
-    pdf_output = f"certificado_{nombre_archivo}.pdf"
-    pdf.output(pdf_output)
-
-    # 2. Enviar el PDF por correo
-    remitente = EMAIL_USER
-    password = EMAIL_PASS
-    asunto = "Certificado de Residencia"
-    cuerpo = "Adjuntamos su certificado de residencia solicitado."
-
-    msg = EmailMessage()
-    msg["Subject"] = asunto
-    msg["From"] = remitente
-    msg["To"] = correo_destino
-    msg.set_content(cuerpo)
-
-    try:
-        with open(pdf_output, "rb") as f:
-            file_data = f.read()
-            file_name = pdf_output
-        msg.add_attachment(file_data, maintype="application", subtype="pdf", filename=file_name)
-
-        print(f"Enviando correo a {correo_destino} desde {remitente}...")
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(remitente, password)
-            smtp.send_message(msg)
-        print("Correo enviado exitosamente.")
-    except Exception as e:
-        print(f"Error al enviar correo: {e}")
-    finally:
-        if os.path.exists(pdf_output):
-            os.remove(pdf_output)
\ No newline at end of file
+    return encolar_correo(
+        correo_destino,
+        "Certificado de Residencia",
+        "Adjuntamos su certificado de residencia solicitado.",
+        adjunto=generar_pdf_certificado(certificado),
+        adjunto_nombre=f"certificado_{nombre_archivo}.pdf",
+    )
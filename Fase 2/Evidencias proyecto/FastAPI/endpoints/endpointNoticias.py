@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, Body, Header
+from fastapi import APIRouter, HTTPException, Depends, Body, Header, Response
 from pydantic import ValidationError
 from typing import List
 from models.models import Noticia
-from conexion import conectar_db
-from jwt.deps import get_admin_uv
-from .utils import list_by_uv
+from conexion import conectar_db, get_cursor
+from esquema import tiene_columna
+from jwt.deps import get_admin_uv, get_directiva
+from conexion_async import get_cursor_async
+from exportacion import exportar, parametro_formato
+from .utils import list_by_uv, list_by_uv_async, consulta_por_uv, Pagina, respuesta_listado
 
 router = APIRouter(prefix="/noticias", tags=["CRUD Noticias"])
 
@@ -39,14 +42,7 @@ def crear_noticia(payload: dict = Body(...), id_uv: int | None = Depends(get_adm
         raise HTTPException(status_code=400, detail="El autor no existe")
 
     # Comprobar si la tabla noticias tiene columna id_uv
-    try:
-        cursor.execute(
-            "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'id_uv'",
-            ("noticias",)
-        )
-        has_id_uv = cursor.fetchone() is not None
-    except Exception:
-        has_id_uv = False
+    has_id_uv = tiene_columna("noticias")
 
     if has_id_uv:
         query = """
@@ -71,49 +67,33 @@ def crear_noticia(payload: dict = Body(...), id_uv: int | None = Depends(get_adm
 
 
 @router.get("/", response_model=List[Noticia])
-def listar_noticias(id_uv: int | None = Depends(get_admin_uv)):
+async def listar_noticias(response: Response, id_uv: int | None = Depends(get_admin_uv), pagina: Pagina = Depends(), cursor=Depends(get_cursor_async)):
     # If id_uv can't be derived return []
     if id_uv is None:
         return []
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        result = list_by_uv(cursor, 'noticias', id_uv, join_table='usuarios', join_on='t.autor_id = j.id_usuario', order_by='fecha_publicacion DESC')
-        return result
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    rows = await list_by_uv_async(cursor, 'noticias', id_uv, join_table='usuarios', join_on='t.autor_id = j.id_usuario', order_by='fecha_publicacion DESC', pagina=pagina, response=response)
+    return respuesta_listado(rows, pagina, response)
 
 
 @router.get("/uv/{id_uv}")
-def listar_noticias_por_uv(id_uv: int):
+def listar_noticias_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
     """Listado de noticias filtrado por id_uv (recibe id_uv en el path)."""
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        rows = list_by_uv(cursor, 'noticias', id_uv, join_table='usuarios', join_on='t.autor_id = j.id_usuario', order_by='fecha_publicacion DESC')
-        return rows
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    return list_by_uv(cursor, 'noticias', id_uv, join_table='usuarios', join_on='t.autor_id = j.id_usuario', order_by='fecha_publicacion DESC', pagina=pagina, response=response)
 
 
+@router.get("/uv/{id_uv}/export")
+async def exportar_noticias_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Exporta todas las noticias de la UV en streaming (NDJSON, CSV o JSON), sin cargarlas en memoria."""
+    consulta = consulta_por_uv('noticias', id_uv, join_table='usuarios', join_on='t.autor_id = j.id_usuario', order_by='fecha_publicacion DESC')
+    return await exportar(consulta, formato, f"noticias_uv{id_uv}")
+
 
-@router.get("/{noticia_id}", response_model=Noticia)
-def obtener_noticia(noticia_id: int):
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
 
+@router.get("/{noticia_id}", response_model=Noticia)
+def obtener_noticia(noticia_id: int, cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM noticias WHERE id_noticia = %s", (noticia_id,))
     noticia = cursor.fetchone()
 
-    cursor.close()
-    conn.close()
-
     if not noticia:
         raise HTTPException(status_code=404, detail="Noticia no encontrada")
     return noticia
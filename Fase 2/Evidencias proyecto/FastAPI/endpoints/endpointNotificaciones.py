@@ -1,49 +1,34 @@
-from fastapi import APIRouter, Depends, Body, HTTPException
+from fastapi import APIRouter, Depends, Body, HTTPException, Response, Query
 from typing import List
 from pydantic import BaseModel
-from conexion import conectar_db
-from jwt.deps import get_admin_uv
-from .utils import list_by_uv
-import os
-from dotenv import load_dotenv
-from email.mime.text import MIMEText
-import smtplib
-# Cargar variables de entorno
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+from conexion import conectar_db, get_cursor
+from jwt.deps import get_admin_uv, get_directiva
+from exportacion import exportar, parametro_formato
+from .utils import list_by_uv, consulta_por_uv, Pagina
+from correo import crear_envio, progreso_envio
 
 router = APIRouter(prefix="/notificaciones", tags=["CRUD Notificaciones"])
 
 
 @router.get("/", tags=["CRUD Notificaciones"])
-def listar_notificaciones(id_uv: int | None = Depends(get_admin_uv)):
+def listar_notificaciones(response: Response, id_uv: int | None = Depends(get_admin_uv), pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
     if id_uv is None:
         return []
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        # Prefer id_uv in notificaciones, else join vecinos via id_vecino
-        result = list_by_uv(cursor, 'notificaciones', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_envio DESC')
-        return result
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    # Prefer id_uv in notificaciones, else join vecinos via id_vecino
+    return list_by_uv(cursor, 'notificaciones', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_envio DESC', pagina=pagina, response=response)
 
 
 @router.get("/uv/{id_uv}")
-def listar_notificaciones_por_uv(id_uv: int):
+def listar_notificaciones_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
     """Listado de notificaciones filtrado por id_uv (recibe id_uv en el path)."""
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        rows = list_by_uv(cursor, 'notificaciones', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_envio DESC')
-        return rows
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    return list_by_uv(cursor, 'notificaciones', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_envio DESC', pagina=pagina, response=response)
+
+
+@router.get("/uv/{id_uv}/export")
+async def exportar_notificaciones_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Exporta todas las notificaciones de la UV en streaming (NDJSON, CSV o JSON), sin cargarlas en memoria."""
+    consulta = consulta_por_uv('notificaciones', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_envio DESC')
+    return await exportar(consulta, formato, f"notificaciones_uv{id_uv}")
 
 
 
@@ -53,23 +38,7 @@ class NotificacionEnvio(BaseModel):
     id_actividad: int | None = None
     id_reserva: int | None = None
 
-def enviar_email(destinatarios: list[str], mensaje: str):
-    remitente = os.environ.get("EMAIL_USER")
-    password = os.environ.get("EMAIL_PASS")
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
-        server.login(remitente, password)
-        for destinatario in destinatarios:
-            msg = MIMEText(mensaje)
-            msg["Subject"] = "AVISO IMPORTANTE"
-            msg["From"] = remitente
-            msg["To"] = destinatario
-            server.sendmail(remitente, destinatario, msg.as_string())
-
-@router.post("/Notificar")
+@router.post("/Notificar", status_code=202)
 def Notificar(data: NotificacionEnvio = Body(...)):
     conn = conectar_db()
     cursor = conn.cursor(dictionary=True)
@@ -106,10 +75,32 @@ def Notificar(data: NotificacionEnvio = Body(...)):
         raise HTTPException(status_code=400, detail="Segmento no soportado")
 
     cursor.close()
-    conn.close()
 
     if not destinatarios:
+        conn.close()
         raise HTTPException(status_code=404, detail="No se encontraron destinatarios")
 
-    enviar_email(destinatarios, data.mensaje)
-    return {"ok": True, "enviados": len(destinatarios)}
\ No newline at end of file
+    # solo se registra el trabajo; el worker de correo.py envía en paralelo y con límite de ritmo
+    id_envio, total = crear_envio(conn, data.segmento, destinatarios, "AVISO IMPORTANTE", data.mensaje)
+    conn.commit()
+    conn.close()
+    return {"ok": True, "id_envio": id_envio, "encolados": total,
+            "progreso": f"/notificaciones/envios/{id_envio}"}
+
+
+@router.get("/envios/{id_envio}")
+def progreso_notificacion(
+    id_envio: int,
+    limit: int = Query(0, ge=0, le=500, description="Incluye el estado de hasta `limit` destinatarios"),
+    offset: int = Query(0, ge=0),
+    usuario=Depends(get_directiva),
+    cursor=Depends(get_cursor),
+):
+    """Avance de un envío de /Notificar: conteo por estado, porcentaje y, con limit, detalle por destinatario.
+
+    El detalle trae las direcciones de correo, por eso solo para la directiva.
+    """
+    envio = progreso_envio(cursor, id_envio, limit, offset)
+    if envio is None:
+        raise HTTPException(status_code=404, detail="Envío no encontrado")
+    return envio
\ No newline at end of file
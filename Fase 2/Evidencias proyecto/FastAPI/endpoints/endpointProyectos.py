@@ -1,21 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, Body, Header
+from fastapi import APIRouter, HTTPException, Depends, Body, Header, Response
 from pydantic import ValidationError
 from typing import List
 from models.models import Proyecto, ProyectoCrear
-from conexion import conectar_db
-from jwt.deps import get_admin_uv
-from .utils import list_by_uv
+from conexion import conectar_db, get_cursor
+from esquema import tiene_columna
+from jwt.deps import get_admin_uv, get_directiva
+from conexion_async import get_cursor_async
+from exportacion import exportar, parametro_formato
+from .utils import list_by_uv, list_by_uv_async, consulta_por_uv, Pagina, respuesta_listado
 
-from fastapi import BackgroundTasks
-from email.message import EmailMessage
-import smtplib
-import os
-
-from dotenv import load_dotenv
-load_dotenv()
-
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
+from correo import encolar_correo
 
 from datetime import datetime
 
@@ -52,14 +46,7 @@ def crear_proyecto(payload: dict = Body(...), id_uv: int | None = Depends(get_ad
         raise HTTPException(status_code=400, detail="El vecino asociado no existe")
 
     # Comprobar si la tabla proyectos tiene columna id_uv
-    try:
-        cursor.execute(
-            "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'id_uv'",
-            ("proyectos",)
-        )
-        has_id_uv = cursor.fetchone() is not None
-    except Exception:
-        has_id_uv = False
+    has_id_uv = tiene_columna("proyectos")
 
     if has_id_uv:
         query = """
@@ -111,19 +98,10 @@ def crear_proyecto(payload: dict = Body(...), id_uv: int | None = Depends(get_ad
     return proyecto_creado
 
 @router.get("/", response_model=List[Proyecto])
-def listar_proyectos(id_uv: int | None = Depends(get_admin_uv)):
+async def listar_proyectos(response: Response, id_uv: int | None = Depends(get_admin_uv), pagina: Pagina = Depends(), cursor=Depends(get_cursor_async)):
     if id_uv is None:
         return []
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        result = list_by_uv(cursor, 'proyectos', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_postulacion DESC')
-        return result
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    result = await list_by_uv_async(cursor, 'proyectos', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_postulacion DESC', pagina=pagina, response=response)
 
     # Convertir fecha_postulacion a string si es datetime
     for proyecto in result:
@@ -132,44 +110,33 @@ def listar_proyectos(id_uv: int | None = Depends(get_admin_uv)):
         # Si tienes fecha_resolucion y puede ser None o datetime:
         if "fecha_resolucion" in proyecto and isinstance(proyecto["fecha_resolucion"], (datetime, )):
             proyecto["fecha_resolucion"] = proyecto["fecha_resolucion"].strftime("%Y-%m-%d")
-
-    cursor.close()
-    conn.close()
-    return result
+    return respuesta_listado(result, pagina, response)
 
 
 @router.get("/uv/{id_uv}")
-def listar_proyectos_por_uv(id_uv: int):
+def listar_proyectos_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
     """Listado de proyectos filtrado por id_uv (recibe id_uv en el path)."""
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        rows = list_by_uv(cursor, 'proyectos', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_postulacion DESC')
-        # formatear fechas si es necesario
-        from datetime import datetime as _dt
-        for p in rows:
-            if isinstance(p.get('fecha_postulacion'), (_dt,)):
-                p['fecha_postulacion'] = p['fecha_postulacion'].strftime('%Y-%m-%d')
-            if 'fecha_resolucion' in p and isinstance(p.get('fecha_resolucion'), (_dt,)):
-                p['fecha_resolucion'] = p['fecha_resolucion'].strftime('%Y-%m-%d')
-        return rows
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+    rows = list_by_uv(cursor, 'proyectos', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_postulacion DESC', pagina=pagina, response=response)
+    # formatear fechas si es necesario
+    for p in rows:
+        if isinstance(p.get('fecha_postulacion'), (datetime,)):
+            p['fecha_postulacion'] = p['fecha_postulacion'].strftime('%Y-%m-%d')
+        if 'fecha_resolucion' in p and isinstance(p.get('fecha_resolucion'), (datetime,)):
+            p['fecha_resolucion'] = p['fecha_resolucion'].strftime('%Y-%m-%d')
+    return rows
+
+
+@router.get("/uv/{id_uv}/export")
+async def exportar_proyectos_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Exporta todos los proyectos de la UV en streaming (NDJSON, CSV o JSON), sin cargarlas en memoria."""
+    consulta = consulta_por_uv('proyectos', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_postulacion DESC')
+    return await exportar(consulta, formato, f"proyectos_uv{id_uv}")
 
 @router.get("/{proyecto_id}", response_model=Proyecto)
-def obtener_proyecto(proyecto_id: int):
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-
+def obtener_proyecto(proyecto_id: int, cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM proyectos WHERE id_proyecto = %s", (proyecto_id,))
     proyecto = cursor.fetchone()
 
-    cursor.close()
-    conn.close()
-
     if not proyecto:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
     return proyecto
@@ -197,7 +164,7 @@ class EstadoProyecto(BaseModel):
     razon: str = None  # Solo para rechazo
 
 @router.put("/{proyecto_id}/estado", response_model=Proyecto)
-def actualizar_estado_proyecto(proyecto_id: int, estado_data: EstadoProyecto, background_tasks: BackgroundTasks):
+def actualizar_estado_proyecto(proyecto_id: int, estado_data: EstadoProyecto):
     conn = conectar_db()
     cursor = conn.cursor(dictionary=True)
 
@@ -220,7 +187,6 @@ def actualizar_estado_proyecto(proyecto_id: int, estado_data: EstadoProyecto, ba
             "UPDATE proyectos SET estado = %s, fecha_resolucion = NOW(), razon_rechazo = NULL WHERE id_proyecto = %s",
             (estado_data.estado, proyecto_id)
         )
-    conn.commit()
 
     # Obtén los datos actualizados del proyecto
     cursor.execute("SELECT * FROM proyectos WHERE id_proyecto = %s", (proyecto_id,))
@@ -232,19 +198,20 @@ def actualizar_estado_proyecto(proyecto_id: int, estado_data: EstadoProyecto, ba
         (proyecto_id,)
     )
     vecino = cursor.fetchone()
-    cursor.close()
-    conn.close()
 
     if vecino and vecino["correo"]:
         nombre_completo = f"{vecino['nombre']} {vecino['apellido']}"
-        background_tasks.add_task(
-            enviar_correo_estado_proyecto,
+        enviar_correo_estado_proyecto(
             vecino["correo"],
             nombre_completo,
             proyecto_actualizado["titulo"],
             estado_data.estado,
             estado_data.razon
         )
+    # el correo queda en la bandeja en la misma transacción que el cambio de estado
+    conn.commit()
+    cursor.close()
+    conn.close()
 
     # Devuelve el proyecto actualizado usando tu modelo
     return Proyecto(
@@ -261,10 +228,6 @@ def actualizar_estado_proyecto(proyecto_id: int, estado_data: EstadoProyecto, ba
     )
 
 def enviar_correo_estado_proyecto(correo_destino, nombre_vecino, titulo_proyecto, estado, razon=None):
-    remitente = EMAIL_USER
-    password = EMAIL_PASS
-    print("EMAIL_USER:", EMAIL_USER)
-    print("EMAIL_PASS:", EMAIL_PASS)
     if estado == "rechazado":
         asunto = "Proyecto Rechazado"
         cuerpo = f"Estimado/a {nombre_vecino},\n\nSu proyecto '{titulo_proyecto}' ha sido rechazado.\nMotivo: {razon}\n\nAtentamente,\nJunta de Vecinos"
@@ -272,16 +235,5 @@ def enviar_correo_estado_proyecto(correo_destino, nombre_vecino, titulo_proyecto
         asunto = "Proyecto Aprobado"
         cuerpo = f"Estimado/a {nombre_vecino},\n\nSu proyecto '{titulo_proyecto}' ha sido aprobado.\n\nAtentamente,\nJunta de Vecinos"
 
-    msg = EmailMessage()
-    msg["Subject"] = asunto
-    msg["From"] = remitente
-    msg["To"] = correo_destino
-    msg.set_content(cuerpo)
-
-    try:
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(remitente, password)
-            smtp.send_message(msg)
-        print(f"Correo de notificación enviado a {correo_destino}")
-    except Exception as e:
-        print(f"Error al enviar correo de notificación: {e}")
\ No newline at end of file
+    encolar_correo(correo_destino, asunto, cuerpo)
+    print(f"Correo de notificación encolado para {correo_destino}")
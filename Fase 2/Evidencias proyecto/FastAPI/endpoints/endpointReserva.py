@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends, Body, Header
+from fastapi import APIRouter, HTTPException, Depends, Body, Header, Query, Response
 from pydantic import ValidationError
 from typing import List
 from models.models import Reserva, ReservaCreate
-from conexion import conectar_db
-from jwt.deps import get_admin_uv
-from .utils import list_by_uv
-from datetime import datetime
+from conexion import conectar_db, get_cursor
+from jwt.deps import get_admin_uv, get_directiva
+from conexion_async import get_cursor_async
+from exportacion import exportar, parametro_formato
+from .utils import list_by_uv_async, consulta_paginada, listar, Pagina, respuesta_listado
+from disponibilidad import reservar, calendario
+from datetime import date, datetime, timedelta
 
 def formatear_fecha(dt):
     if isinstance(dt, str):
@@ -56,91 +59,20 @@ def crear_reserva(payload: dict = Body(...), id_uv: int | None = Depends(get_adm
     if effective_id_uv is None:
         raise HTTPException(status_code=401, detail="No se pudo derivar id_uv del token")
 
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-
-    # Validar vecino existente
-    cursor.execute("SELECT id_vecino FROM vecinos WHERE id_vecino = %s", (reserva.id_vecino,))
-    if cursor.fetchone() is None:
-        cursor.close()
-        conn.close()
-        raise HTTPException(status_code=400, detail="El vecino asociado no existe")
-
-    # Validar duplicidad por usuario
-    cursor.execute(
-        "SELECT * FROM reservas WHERE id_vecino = %s AND nombreSector = %s AND DATE(fecha_inicio) = DATE(%s)",
-        (reserva.id_vecino, reserva.nombreSector, reserva.fecha_inicio)
-    )
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
-        raise HTTPException(status_code=400, detail="Ya tienes una reserva para este sector y fecha.")
-
-    # Limitar reservas pendientes o aprobadas por usuario
-    cursor.execute(
-        "SELECT COUNT(*) as total FROM reservas WHERE id_vecino = %s AND estado IN ('pendiente', 'aprobado')",
-        (reserva.id_vecino,)
-    )
-    if cursor.fetchone()["total"] >= 2:
-        cursor.close()
-        conn.close()
-        raise HTTPException(status_code=400, detail="No puedes tener más de 2 reservas activas.")
-
-    # Validar si ya existe una reserva para el mismo sector y fecha (por cualquier persona)
-    cursor.execute(
-        "SELECT * FROM reservas WHERE nombreSector = %s AND DATE(fecha_inicio) = DATE(%s)",
-        (reserva.nombreSector, reserva.fecha_inicio)
-    )
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
-        raise HTTPException(status_code=400, detail="Ya existe una reserva para este sector y fecha.")
-
     # Convertir fecha_inicio a datetime para MySQL
-    fecha_inicio_dt = parsear_fecha(reserva.fecha_inicio)
-
-    # Comprobar si la tabla reservas tiene columna id_uv
     try:
-        cursor.execute(
-            "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'id_uv'",
-            ("reservas",)
-        )
-        has_id_uv = cursor.fetchone() is not None
-    except Exception:
-        has_id_uv = False
-
-    print(f"[DEBUG] crear_reserva effective_id_uv={effective_id_uv} has_id_uv={has_id_uv}")
+        fecha_inicio_dt = parsear_fecha(reserva.fecha_inicio)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-    if has_id_uv:
-        query = """
-        INSERT INTO reservas (id_vecino, nombreSector, fecha_inicio, estado, id_uv)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        values = (
-            reserva.id_vecino,
-            reserva.nombreSector,
-            fecha_inicio_dt.strftime("%Y-%m-%d %H:%M:%S"),
-            reserva.estado,
-            effective_id_uv,
-        )
-    else:
-        query = """
-        INSERT INTO reservas (id_vecino, nombreSector, fecha_inicio, estado)
-        VALUES (%s, %s, %s, %s)
-        """
-        values = (
-            reserva.id_vecino,
-            reserva.nombreSector,
-            fecha_inicio_dt.strftime("%Y-%m-%d %H:%M:%S"),
-            reserva.estado,
-        )
+    print(f"[DEBUG] crear_reserva effective_id_uv={effective_id_uv}")
 
-    cursor.execute(query, values)
-    conn.commit()
-    id_reserva = cursor.lastrowid
-
-    cursor.close()
-    conn.close()
+    # Reglas (duplicado propio, máximo de activas, sector/día ocupado) + INSERT en una transacción
+    conn = conectar_db()
+    try:
+        id_reserva = reservar(conn, reserva.id_vecino, reserva.nombreSector, fecha_inicio_dt, reserva.estado, effective_id_uv)
+    finally:
+        conn.close()
 
     return Reserva(
         id_reserva=id_reserva,
@@ -151,63 +83,69 @@ def crear_reserva(payload: dict = Body(...), id_uv: int | None = Depends(get_adm
     )
 
 @router.get("/", response_model=List[Reserva])
-def listar_reservas(id_uv: int | None = Depends(get_admin_uv)):
+async def listar_reservas(response: Response, id_uv: int | None = Depends(get_admin_uv), pagina: Pagina = Depends(), cursor=Depends(get_cursor_async)):
     if id_uv is None:
         return []
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        result = list_by_uv(cursor, 'reservas', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='r.fecha_inicio DESC')
-        # list_by_uv returns rows as dicts; for reservas we may want to add nombre_completo as before
-        for r in result:
-            if 'nombre' in r and 'apellido' in r:
-                r['nombre_completo'] = f"{r.get('nombre')} {r.get('apellido')}"
-        return result
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
-    cursor.close()
-    conn.close()
+    result = await list_by_uv_async(cursor, 'reservas', id_uv, join_table='vecinos', join_on='t.id_vecino = j.id_vecino', order_by='fecha_inicio DESC', pagina=pagina, response=response)
     # Formatear fechas y agregar nombre completo
     for r in result:
-        r["fecha_inicio"] = formatear_fecha(r["fecha_inicio"])
-        r["nombre_completo"] = f"{r['nombre']} {r['apellido']}"
-    return result
+        if r.get("fecha_inicio") is not None:
+            r["fecha_inicio"] = formatear_fecha(r["fecha_inicio"])
+        if 'nombre' in r and 'apellido' in r:
+            r['nombre_completo'] = f"{r.get('nombre')} {r.get('apellido')}"
+    return respuesta_listado(result, pagina, response)
 
 
 @router.get("/uv/{id_uv}")
-def listar_reservas_por_uv(id_uv: int):
+def listar_reservas_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
     """Listado público/administrativo de reservas por id_uv (igual que /reservas pero recibe id_uv por path)."""
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
+    consulta = consulta_paginada(
+        'reservas', "FROM reservas t JOIN vecinos v ON t.id_vecino = v.id_vecino", ["t.id_uv = %s"], (id_uv,),
+        pagina, order_by='fecha_inicio DESC', extra_select=", v.nombre, v.apellido",
+    )
+    rows = listar(cursor, 'reservas', consulta, pagina, response, order_by='fecha_inicio DESC')
+    for r in rows:
+        r['nombre_completo'] = f"{r.get('nombre', '')} {r.get('apellido', '')}".strip()
+    return rows
+
+
+@router.get("/uv/{id_uv}/export")
+async def exportar_reservas_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Exporta todas las reservas de la UV en streaming (NDJSON, CSV o JSON), sin cargarlas en memoria."""
+    consulta = consulta_paginada(
+        'reservas', "FROM reservas t JOIN vecinos v ON t.id_vecino = v.id_vecino", ["t.id_uv = %s"], (id_uv,),
+        order_by='fecha_inicio DESC', extra_select=", CONCAT(v.nombre, ' ', v.apellido) AS nombre_completo",
+    )
+    return await exportar(consulta, formato, f"reservas_uv{id_uv}")
+
+@router.get("/disponibilidad")
+def disponibilidad(
+    sector: str = Query(..., description="nombreSector"),
+    desde: str | None = Query(None, description="Fecha inicial (ISO o DD-MM-YYYY); por defecto hoy"),
+    hasta: str | None = Query(None, description="Fecha final inclusive; por defecto desde + 30 días"),
+    cursor=Depends(get_cursor),
+):
+    """Calendario libre/ocupado del sector día a día, calculado con una sola consulta por rango."""
     try:
-        cursor.execute("""
-            SELECT r.*, v.nombre, v.apellido
-            FROM reservas r
-            JOIN vecinos v ON r.id_vecino = v.id_vecino
-            WHERE r.id_uv = %s
-            ORDER BY r.fecha_inicio DESC
-        """, (id_uv,))
-        rows = cursor.fetchall()
-        for r in rows:
-            r['nombre_completo'] = f"{r.get('nombre', '')} {r.get('apellido', '')}".strip()
-        return rows
-    finally:
-        try: cursor.close()
-        except: pass
-        try: conn.close()
-        except: pass
+        dia_desde = parsear_fecha(desde).date() if desde else date.today()
+        dia_hasta = parsear_fecha(hasta).date() if hasta else dia_desde + timedelta(days=30)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    dias = calendario(cursor, sector, dia_desde, dia_hasta)
+    for d in dias:
+        d["fecha"] = formatear_fecha(d.pop("dia"))
+    return {
+        "sector": sector,
+        "desde": formatear_fecha(dia_desde),
+        "hasta": formatear_fecha(dia_hasta),
+        "libres": sum(d["libre"] for d in dias),
+        "dias": dias,
+    }
 
 @router.get("/{reserva_id}", response_model=Reserva)
-def obtener_reserva(reserva_id: int):
-    conn = conectar_db()
-    cursor = conn.cursor(dictionary=True)
+def obtener_reserva(reserva_id: int, cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM reservas WHERE id_reserva = %s", (reserva_id,))
     reserva = cursor.fetchone()
-    cursor.close()
-    conn.close()
     if not reserva:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
     reserva["fecha_inicio"] = formatear_fecha(reserva["fecha_inicio"])
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, HTTPException, Query
-from conexion import conectar_db, geocode_google
+from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, model_validator
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from geocodificacion import Cancelada, consultar_google, google_configurado, clientes_stats
+import geocodificacion as clientes
+from cache_geocodificacion import geocache, clave as clave_geocache
+from geometria import buscar_uv, indice_uv, indice_info, invalidar_indice_uv
 import os
-import requests
 import traceback
-import math
 import json
 import re
+import threading
 import time  # ⬅️ agregado
 
 # ---------------------------------------------------------
@@ -20,6 +26,19 @@ MAIPU_BBOX = (-70.873, -33.625, -70.683, -33.455)
 GEOAPIFY_KEY = os.getenv("GEOAPIFY_KEY", "")
 OPENCAGE_KEY = os.getenv("OPENCAGE_KEY", "")
 
+# Geocodificación concurrente: hilos compartidos y escalonamiento (hedging) entre consultas
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "16"))
+GEOCODE_HEDGE_MS = int(os.getenv("GEOCODE_HEDGE_MS", "300"))
+_geocode_pool = ThreadPoolExecutor(max_workers=GEOCODE_WORKERS, thread_name_prefix="geocode")
+_latencias: dict[str, dict] = {}
+_latencias_lock = threading.Lock()
+# _geocode_best_proveedores: ningún proveedor respondió (distinto de "no encontrado")
+SIN_RESPUESTA = object()
+
+# Asignación masiva: hilos de geocodificación concurrentes y tope de filas por request
+UV_BATCH_WORKERS = int(os.getenv("UV_BATCH_WORKERS", "8"))
+UV_BATCH_MAX = int(os.getenv("UV_BATCH_MAX", "5000"))
+
 
 # ========= Helpers comunes =========
 def in_bbox(lat: float, lon: float, bbox) -> bool:
@@ -52,52 +71,77 @@ def split_address(direccion: str):
 
 
 # ========= Geocoders (fallbacks) =========
-def geocode_nominatim(direccion: str, comuna: str, pais: str, timeout_sec: float = 6.0):
-    headers = {"User-Agent": "JV-Loader/1.0 (dev@example.com)", "Accept-Language": "es"}
-    url = "https://nominatim.openstreetmap.org/search"
+# Los geocoders devuelven None solo si el proveedor respondió sin resultados;
+# los errores (red, HTTP, LimiteFrecuencia) se propagan para no cachearlos como
+# "no encontrado" (ver _medir y geocode_best).
+def nominatim_estructurado(street: str, number: str, comuna: str, pais: str, timeout_sec: float = 6.0, cancelado=None):
+    """Búsqueda estructurada (calle + número); solo acepta resultados a nivel de casa/edificio."""
+    params = {
+        "street": f"{number} {street}",
+        "city": comuna,
+        "country": pais,
+        "format": "jsonv2",
+        "addressdetails": 1,
+        "limit": 5,
+        "polygon_geojson": 0,
+    }
+    items = clientes.nominatim.get_json(clientes.NOMINATIM_URL, params=params, timeout=timeout_sec, cancelado=cancelado) or []  # ⬅️ timeout dinámico
+
+    def is_house(i):
+        t = (i.get("type") or "").lower()
+        at = (i.get("addresstype") or "").lower()
+        addr = i.get("address") or {}
+        return (
+            t in ("house", "building")
+            or at in ("house", "building")
+            or bool(addr.get("house_number"))
+        )
 
-    street, number = split_address(direccion)
+    candidates = [i for i in items if is_house(i)]
+    if candidates:
+        best = max(candidates, key=lambda i: float(i.get("importance", 0) or 0))
+        return {
+            "lat": float(best["lat"]),
+            "lon": float(best["lon"]),
+            "display_name": best.get("display_name", ""),
+            "source": "nominatim(structured)",
+        }
+    return None
 
-    # (1) estructurado
-    if number:
-        try:
-            params = {
-                "street": f"{number} {street}",
-                "city": comuna,
-                "country": pais,
-                "format": "jsonv2",
-                "addressdetails": 1,
-                "limit": 5,
-                "polygon_geojson": 0,
-            }
-            r = requests.get(url, params=params, headers=headers, timeout=timeout_sec)  # ⬅️ timeout dinámico
-            r.raise_for_status()
-            items = r.json() or []
-
-            def is_house(i):
-                t = (i.get("type") or "").lower()
-                at = (i.get("addresstype") or "").lower()
-                addr = i.get("address") or {}
-                return (
-                    t in ("house", "building")
-                    or at in ("house", "building")
-                    or bool(addr.get("house_number"))
-                )
-
-            candidates = [i for i in items if is_house(i)]
-            if candidates:
-                best = max(candidates, key=lambda i: float(i.get("importance", 0) or 0))
-                return {
-                    "lat": float(best["lat"]),
-                    "lon": float(best["lon"]),
-                    "display_name": best.get("display_name", ""),
-                    "source": "nominatim(structured)",
-                }
-        except Exception:
-            pass
-
-    # (2) libre
-    base_variants = [
+
+def nominatim_libre(q: str, timeout_sec: float = 6.0, cancelado=None):
+    """Búsqueda de texto libre; devuelve el mejor ítem priorizando casas/edificios."""
+    params = {
+        "q": q,
+        "format": "jsonv2",
+        "addressdetails": 1,
+        "limit": 5,
+        "countrycodes": "cl",
+        "polygon_geojson": 0,
+    }
+    items = clientes.nominatim.get_json(clientes.NOMINATIM_URL, params=params, timeout=timeout_sec, cancelado=cancelado) or []  # ⬅️ timeout dinámico
+    if not items:
+        return None
+    best = max(
+        items,
+        key=lambda i: (
+            {"house": 3, "building": 2, "address": 2, "residential": 1}.get(
+                (i.get("type") or ""), 0
+            ),
+            float(i.get("importance", 0) or 0),
+        ),
+    )
+    return {
+        "lat": float(best["lat"]),
+        "lon": float(best["lon"]),
+        "display_name": best.get("display_name", ""),
+        "source": "nominatim",
+    }
+
+
+def nominatim_variantes(direccion: str, comuna: str, pais: str) -> list[str]:
+    street, _ = split_address(direccion)
+    return [
         f"{direccion}, {comuna}, {pais}",
         f"{direccion}, {comuna}, Región Metropolitana de Santiago, {pais}",
         f"{direccion}, {pais}",
@@ -105,46 +149,11 @@ def geocode_nominatim(direccion: str, comuna: str, pais: str, timeout_sec: float
         f"{street}, Maipu, {pais}",
         f"{street}, Maipú, {pais}",
     ]
-    for q in base_variants:
-        try:
-            params = {
-                "q": q,
-                "format": "jsonv2",
-                "addressdetails": 1,
-                "limit": 5,
-                "countrycodes": "cl",
-                "polygon_geojson": 0,
-            }
-            r = requests.get(url, params=params, headers=headers, timeout=timeout_sec)  # ⬅️ timeout dinámico
-            r.raise_for_status()
-            items = r.json() or []
-            if not items:
-                continue
-            best = max(
-                items,
-                key=lambda i: (
-                    {"house": 3, "building": 2, "address": 2, "residential": 1}.get(
-                        (i.get("type") or ""), 0
-                    ),
-                    float(i.get("importance", 0) or 0),
-                ),
-            )
-            return {
-                "lat": float(best["lat"]),
-                "lon": float(best["lon"]),
-                "display_name": best.get("display_name", ""),
-                "source": "nominatim",
-            }
-        except Exception:
-            pass
-
-    return None
 
 
-def geocode_geoapify(direccion: str, comuna: str, pais: str, timeout_sec: float = 5.0):
+def geocode_geoapify(direccion: str, comuna: str, pais: str, timeout_sec: float = 5.0, cancelado=None):
     if not GEOAPIFY_KEY:
         return None
-    url = "https://api.geoapify.com/v1/geocode/search"
     params = {
         "text": f"{direccion}, {comuna}, {pais}",
         "format": "json",
@@ -154,9 +163,7 @@ def geocode_geoapify(direccion: str, comuna: str, pais: str, timeout_sec: float
     }
     minLon, minLat, maxLon, maxLat = MAIPU_BBOX
     params["bias"] = f"rect:{minLon},{minLat},{maxLon},{maxLat}"
-    r = requests.get(url, params=params, timeout=timeout_sec)  # ⬅️ timeout dinámico
-    r.raise_for_status()
-    data = r.json()
+    data = clientes.geoapify.get_json(clientes.GEOAPIFY_URL, params=params, timeout=timeout_sec, cancelado=cancelado)  # ⬅️ timeout dinámico
     feats = data.get("results") or []
     if not feats:
         return None
@@ -169,10 +176,9 @@ def geocode_geoapify(direccion: str, comuna: str, pais: str, timeout_sec: float
     }
 
 
-def geocode_opencage(direccion: str, comuna: str, pais: str, timeout_sec: float = 5.0):
+def geocode_opencage(direccion: str, comuna: str, pais: str, timeout_sec: float = 5.0, cancelado=None):
     if not OPENCAGE_KEY:
         return None
-    url = "https://api.opencagedata.com/geocode/v1/json"
     params = {
         "q": f"{direccion}, {comuna}, {pais}",
         "key": OPENCAGE_KEY,
@@ -180,9 +186,7 @@ def geocode_opencage(direccion: str, comuna: str, pais: str, timeout_sec: float
         "limit": 5,
         "no_annotations": 1,
     }
-    r = requests.get(url, params=params, timeout=timeout_sec)  # ⬅️ timeout dinámico
-    r.raise_for_status()
-    res = r.json()
+    res = clientes.opencage.get_json(clientes.OPENCAGE_URL, params=params, timeout=timeout_sec, cancelado=cancelado)  # ⬅️ timeout dinámico
     items = res.get("results") or []
     if not items:
         return None
@@ -199,78 +203,155 @@ def geocode_opencage(direccion: str, comuna: str, pais: str, timeout_sec: float
 
 def geocode_best(direccion: str, comuna: str, pais: str, timeout_ms: int = 12000):
     """
-    PRIORIDAD:
-      1) Google (si hay clave)
-      2) Nominatim
-      3) Geoapify
-      4) OpenCage
-
-    Respeta un presupuesto total de tiempo (timeout_ms).
+    Igual que _geocode_best_proveedores, pero consulta antes la cache persistente
+    (memoria + SQLite) por dirección normalizada. También cachea los "no encontrado",
+    pero solo si algún proveedor respondió sin resultados: si todos fallaron o no
+    alcanzaron a responder (red, cuota, LimiteFrecuencia, presupuesto) no se cachea.
     """
-    deadline = time.time() + max(timeout_ms, 2000) / 1000.0
+    k = clave_geocache(direccion, comuna, pais)
+    hit, g = geocache.obtener(k)
+    if hit:
+        return dict(g) if g else None
+    g = _geocode_best_proveedores(direccion, comuna, pais, timeout_ms=timeout_ms)
+    if g is SIN_RESPUESTA:
+        print(f"[GEOCODE] ningún proveedor respondió para {direccion!r}; no se cachea")
+        return None
+    geocache.guardar(k, {c: v for c, v in g.items() if c != "latencias_ms"} if g else None)
+    return g
 
-    def left(default_sec: float):
-        t = deadline - time.time()
-        return max(1.0, min(default_sec, t))
 
-    # 1) Google
-    google_outside = None
+def _tareas_geocodificacion(direccion: str, comuna: str, pais: str):
+    """Consultas individuales en orden de prioridad: (nombre, fn(timeout_sec, cancelado), timeout por defecto)."""
+    tareas = []
+    if google_configurado():
+        tareas.append(("google", lambda t, c: consultar_google(direccion, comuna, pais, timeout_sec=t, cancelado=c), 6.0))
+    street, number = split_address(direccion)
+    if number:
+        tareas.append(("nominatim", lambda t, c: nominatim_estructurado(street, number, comuna, pais, timeout_sec=t, cancelado=c), 5.0))
+    for q in nominatim_variantes(direccion, comuna, pais):
+        tareas.append(("nominatim", lambda t, c, q=q: nominatim_libre(q, timeout_sec=t, cancelado=c), 5.0))
+    if GEOAPIFY_KEY:
+        tareas.append(("geoapify", lambda t, c: geocode_geoapify(direccion, comuna, pais, timeout_sec=t, cancelado=c), 4.0))
+    if OPENCAGE_KEY:
+        tareas.append(("opencage", lambda t, c: geocode_opencage(direccion, comuna, pais, timeout_sec=t, cancelado=c), 4.0))
+    return tareas
+
+
+def _medir(nombre: str, fn, timeout_sec: float, cancelado: threading.Event):
+    """(resultado, ms, error): error=True si la consulta falló o se canceló en vez de responder."""
+    inicio = time.monotonic()
+    error = False
     try:
-        g = geocode_google(direccion, comuna, pais, timeout_sec=left(6.0))
-        if g:
-            # si está dentro del bbox, retornamos ya
-            if in_bbox(g["lat"], g["lon"], MAIPU_BBOX):
-                return g
-            google_outside = g
-    except Exception:
-        pass
-
-    # 2-4) Fallbacks con presupuesto restante
-    for fn, def_sec in ((geocode_nominatim, 5.0), (geocode_geoapify, 4.0), (geocode_opencage, 4.0)):
-        try:
-            g = fn(direccion, comuna, pais, timeout_sec=left(def_sec))
-            if not g:
-                continue
-            if in_bbox(g["lat"], g["lon"], MAIPU_BBOX):
-                return g
-            if not google_outside:
-                google_outside = g
-        except Exception:
-            continue
-
-    # si nada cayó dentro del bbox, devolvemos el mejor fuera
-    return google_outside
+        g = fn(timeout_sec, cancelado)
+    except Cancelada:
+        g, error = None, True
+    except Exception as e:
+        print(f"[GEOCODE] {nombre} falló: {type(e).__name__}: {e}")
+        g, error = None, True
+    ms = (time.monotonic() - inicio) * 1000.0
+    with _latencias_lock:
+        st = _latencias.setdefault(nombre, {"llamadas": 0, "con_resultado": 0, "errores": 0, "total_ms": 0.0, "max_ms": 0.0})
+        st["llamadas"] += 1
+        st["con_resultado"] += 1 if g else 0
+        st["errores"] += 1 if error else 0
+        st["total_ms"] += ms
+        st["max_ms"] = max(st["max_ms"], ms)
+    return g, ms, error
+
+
+def latencias_geocodificacion() -> dict:
+    with _latencias_lock:
+        return {
+            nombre: {**st, "prom_ms": round(st["total_ms"] / st["llamadas"], 1) if st["llamadas"] else None}
+            for nombre, st in _latencias.items()
+        }
 
 
-# ========= Distancias (Haversine) =========
-def haversine_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    p1, p2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlmb = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlmb / 2) ** 2
-    return 2 * R * math.asin(math.sqrt(a))
+def _geocode_best_proveedores(direccion: str, comuna: str, pais: str, timeout_ms: int = 12000):
+    """
+    PRIORIDAD:
+      1) Google (si hay clave)
+      2) Nominatim (estructurado y luego variantes de texto libre)
+      3) Geoapify
+      4) OpenCage
 
+    Las consultas se lanzan escalonadas cada GEOCODE_HEDGE_MS (o apenas una
+    termina sin éxito) y corren en paralelo. Gana la de mayor prioridad que
+    cae dentro de MAIPU_BBOX una vez que todas las anteriores terminaron; las
+    pendientes se cancelan, y las que ya corren ven el evento `cancelado` y
+    dejan de esperar turno o backoff sin llegar a consultar al proveedor. Respeta un presupuesto total de tiempo (timeout_ms):
+    al vencer se devuelve lo mejor disponible.
+    El resultado incluye 'latencias_ms' por consulta.
+    Sin resultado: None si al menos un proveedor respondió sin resultados, o
+    SIN_RESPUESTA si ninguno llegó a responder (todos fallaron o no alcanzaron).
+    """
+    inicio = time.monotonic()
+    deadline = inicio + max(timeout_ms, 2000) / 1000.0
+    hedge = GEOCODE_HEDGE_MS / 1000.0
+    tareas = _tareas_geocodificacion(direccion, comuna, pais)
+    n = len(tareas)
+    resultados = [None] * n
+    terminadas = [False] * n
+    respondieron = 0
+    latencias = {}
+    futuros = {}
+    siguiente = 0
+    proximo = inicio
+    cancelado = threading.Event()
+
+    def dentro(g):
+        return bool(g) and in_bbox(g["lat"], g["lon"], MAIPU_BBOX)
+
+    def con_latencias(g):
+        return {**g, "latencias_ms": latencias}
 
-def min_vertex_distance(gj_str, p_lat, p_lon):
     try:
-        gjson = json.loads(gj_str or "{}")
-    except Exception:
-        return float("inf")
-    t = gjson.get("type")
-    if t not in ("Polygon", "MultiPolygon"):
-        return float("inf")
-    dmin = float("inf")
-    if t == "Polygon":
-        for ring in gjson.get("coordinates", []):
-            for lonv, latv in ring:
-                dmin = min(dmin, haversine_m(p_lat, p_lon, latv, lonv))
-    else:
-        for poly in gjson.get("coordinates", []):
-            for ring in poly:
-                for lonv, latv in ring:
-                    dmin = min(dmin, haversine_m(p_lat, p_lon, latv, lonv))
-    return dmin
+        while True:
+            ahora = time.monotonic()
+            # lanzar la siguiente consulta si toca (hedge) o si no hay ninguna en vuelo
+            while siguiente < n and (ahora >= proximo or not futuros):
+                nombre, fn, def_sec = tareas[siguiente]
+                t = max(1.0, min(def_sec, deadline - ahora))
+                futuros[_geocode_pool.submit(_medir, nombre, fn, t, cancelado)] = siguiente
+                siguiente += 1
+                proximo = ahora + hedge
+
+            # ganador: primera en prioridad dentro del bbox, con todas las anteriores resueltas
+            for i in range(n):
+                if not terminadas[i]:
+                    break
+                if dentro(resultados[i]):
+                    return con_latencias(resultados[i])
+
+            if ahora >= deadline or (siguiente >= n and not futuros):
+                break
+
+            limite = deadline if siguiente >= n else min(deadline, proximo)
+            hechos, _ = wait(futuros, timeout=max(0.01, limite - ahora), return_when=FIRST_COMPLETED)
+            for f in hechos:
+                i = futuros.pop(f)
+                g, ms, error = f.result()
+                respondieron += 0 if error else 1
+                terminadas[i] = True
+                resultados[i] = g
+                latencias[f"{tareas[i][0]}#{i}"] = round(ms, 1)
+                if not dentro(g):
+                    # sin éxito: adelantar la siguiente consulta
+                    proximo = time.monotonic()
+    finally:
+        cancelado.set()
+        for f in futuros:
+            f.cancel()
+
+    # presupuesto vencido: la de mayor prioridad dentro del bbox, aunque falten anteriores
+    for g in resultados:
+        if dentro(g):
+            return con_latencias(g)
+    # si nada cayó dentro del bbox, devolvemos el mejor fuera (Google primero)
+    for g in resultados:
+        if g:
+            return con_latencias(g)
+    return None if respondieron else SIN_RESPUESTA
 
 
 # ========= Endpoints =========
@@ -284,7 +365,7 @@ def assign_uv(
     """
     1) Geocodifica con presupuesto de tiempo total.
     2) Si el punto cae dentro de una UV => esa UV.
-    3) Si no, devuelve la UV más cercana por distancia a vértices (Haversine).
+    3) Si no, devuelve la UV más cercana por distancia al borde del polígono.
     """
     try:
         print(">>> /uv/assign", {"direccion": direccion, "comuna": comuna, "pais": pais, "timeout_ms": timeout_ms})
@@ -297,70 +378,16 @@ def assign_uv(
         lon = float(g["lon"])
         print(f">>> GEOCODED lat={lat}, lon={lon}, src={g.get('source')}")
 
-        db = conectar_db()
-        if db is None:
-            raise HTTPException(status_code=500, detail="No se pudo conectar a la base de datos")
-        cur = db.cursor(dictionary=True)
-        try:
-            # 1) Contención exacta con SRID nativo de la tabla
-            cur.execute(
-                """
-                SELECT id_uv, nombre
-                FROM juntas_vecinos
-                WHERE ST_Contains(
-                    geom,
-                    ST_GeomFromText(CONCAT('POINT(', %s, ' ', %s, ')'), ST_SRID(geom))
-                )
-                LIMIT 1
-                """,
-                (lon, lat),
-            )
-            row = cur.fetchone()
-            if row:
-                return {
-                    "ok": True,
-                    "geocoding": {**g},
-                    "uv": {
-                        "id_uv": row["id_uv"],
-                        "nombre": row["nombre"],
-                        "inside": True,
-                        "dist_m": 0.0,
-                    },
-                    "edge": False,
-                }
-
-            # 2) Más cercana por distancia mínima a vértices (Haversine)
-            cur.execute("""SELECT id_uv, nombre, ST_AsGeoJSON(geom) AS gj FROM juntas_vecinos""")
-            polys = cur.fetchall() or []
-            if not polys:
-                raise HTTPException(status_code=404, detail="No hay UV cargadas")
-
-            best_row, best_d = None, float("inf")
-            for r in polys:
-                d = min_vertex_distance(r["gj"], lat, lon)
-                if d < best_d:
-                    best_d, best_row = d, r
-
-            return {
-                "ok": True,
-                "geocoding": {**g},
-                "uv": {
-                    "id_uv": best_row["id_uv"],
-                    "nombre": best_row["nombre"],
-                    "inside": False,
-                    "dist_m": float(best_d),
-                },
-                "edge": float(best_d) < 30.0,
-            }
-        finally:
-            try:
-                cur.close()
-            except Exception:
-                pass
-            try:
-                db.close()
-            except Exception:
-                pass
+        # 1) contención exacta y 2) más cercana, contra el índice en memoria
+        uv = buscar_uv(lat, lon)
+        if uv is None:
+            raise HTTPException(status_code=404, detail="No hay UV cargadas")
+        return {
+            "ok": True,
+            "geocoding": {**g},
+            "uv": uv,
+            "edge": (not uv["inside"]) and uv["dist_m"] < 30.0,
+        }
 
     except HTTPException:
         raise
@@ -371,56 +398,121 @@ def assign_uv(
 
 @router.get("/by_point", summary="Devuelve UV que contiene el punto o la más cercana")
 def uv_by_point(lat: float = Query(...), lon: float = Query(...)):
-    db = conectar_db()
-    if db is None:
-        raise HTTPException(status_code=500, detail="No se pudo conectar a la base de datos")
-    cur = db.cursor(dictionary=True)
     try:
-        wkt = f"POINT({lon} {lat})"
-        # 1) Contención exacta en SRID nativo
-        cur.execute(
-            """
-            SELECT id_uv, nombre
-            FROM juntas_vecinos
-            WHERE ST_Contains(geom, ST_GeomFromText(%s, ST_SRID(geom)))
-            LIMIT 1
-            """,
-            (wkt,),
-        )
-        row = cur.fetchone()
-        if row:
-            return {
-                "ok": True,
-                "uv": {"id_uv": row["id_uv"], "nombre": row["nombre"], "inside": True, "dist_m": 0.0},
-                "edge": False,
-            }
-
-        # 2) Más cercana por vértices (Haversine)
-        cur.execute("""SELECT id_uv, nombre, ST_AsGeoJSON(geom) AS gj FROM juntas_vecinos""")
-        polys = cur.fetchall() or []
-        if not polys:
+        # 1) Contención exacta y 2) más cercana por borde, en el índice en memoria
+        uv = buscar_uv(lat, lon)
+        if uv is None:
             raise HTTPException(status_code=404, detail="No hay UV cargadas")
+        return {
+            "ok": True,
+            "uv": uv,
+            "edge": (not uv["inside"]) and uv["dist_m"] < 30.0,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/geocache", summary="Contadores de la cache de geocodificación")
+def uv_geocache():
+    return geocache.stats()
+
+
+@router.get("/geocoders", summary="Latencia y uso de clientes HTTP por proveedor de geocodificación")
+def uv_geocoders():
+    return {"latencias": latencias_geocodificacion(), "clientes": clientes_stats()}
 
-        best_row, best_d = None, float("inf")
-        for r in polys:
-            d = min_vertex_distance(r["gj"], lat, lon)
-            if d < best_d:
-                best_d, best_row = d, r
 
+@router.get("/indice", summary="Estado del índice espacial de UV")
+def uv_indice():
+    return indice_info()
+
+
+@router.post("/indice/refrescar", summary="Fuerza la recarga del índice espacial de UV")
+def uv_indice_refrescar():
+    invalidar_indice_uv()
+    indice_uv()
+    return indice_info()
+
+
+# ========= Asignación masiva =========
+class FilaAsignacion(BaseModel):
+    ref: Optional[str] = None  # identificador libre del cliente (fila de la planilla, rut, etc.)
+    direccion: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+    @model_validator(mode="after")
+    def direccion_o_coordenadas(self):
+        if (self.lat is None or self.lon is None) and not (self.direccion or "").strip():
+            raise ValueError("Cada fila necesita 'direccion' o 'lat' y 'lon'")
+        return self
+
+
+class AsignacionMasiva(BaseModel):
+    filas: List[FilaAsignacion]
+    comuna: str = "Maipú"
+    pais: str = "Chile"
+    timeout_ms: int = 12000  # presupuesto de geocodificación por fila
+
+
+def _asignar_fila(i: int, fila: FilaAsignacion, comuna: str, pais: str, timeout_ms: int) -> dict:
+    res = {"i": i, "ref": fila.ref}
+    try:
+        g = None
+        if fila.lat is not None and fila.lon is not None:
+            lat, lon = fila.lat, fila.lon
+        else:
+            g = geocode_best(fila.direccion, comuna, pais, timeout_ms=timeout_ms)
+            if not g:
+                return {**res, "ok": False, "error": "Dirección no encontrada"}
+            lat, lon = float(g["lat"]), float(g["lon"])
+        uv = buscar_uv(lat, lon)
+        if uv is None:
+            return {**res, "ok": False, "error": "No hay UV cargadas"}
         return {
+            **res,
             "ok": True,
-            "uv": {"id_uv": best_row["id_uv"], "nombre": best_row["nombre"], "inside": False, "dist_m": float(best_d)},
-            "edge": float(best_d) < 30.0,
+            "geocoding": g,
+            "uv": uv,
+            "edge": (not uv["inside"]) and uv["dist_m"] < 30.0,
         }
+    except Exception as e:
+        return {**res, "ok": False, "error": str(e)}
+
+
+@router.post("/assign/batch", summary="Asigna UV a muchas direcciones o coordenadas (NDJSON)")
+def assign_uv_batch(data: AsignacionMasiva = Body(...)):
+    """
+    Geocodifica las filas en paralelo (UV_BATCH_WORKERS hilos) y resuelve la UV
+    contra el índice en memoria. La respuesta es NDJSON: una línea por fila, en
+    el orden en que terminan; 'i' es la posición de la fila en la solicitud.
+    """
+    if len(data.filas) > UV_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {UV_BATCH_MAX} filas por solicitud")
+    timeout_ms = max(2000, min(data.timeout_ms, 60000))
+    try:
+        # cargar el índice antes de empezar a transmitir, para fallar con un 500 limpio
+        indice_uv()
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
+
+    def generar():
+        if not data.filas:
+            return
+        pool = ThreadPoolExecutor(max_workers=max(1, min(UV_BATCH_WORKERS, len(data.filas))))
         try:
-            db.close()
-        except Exception:
-            pass
\ No newline at end of file
+            futuros = [
+                pool.submit(_asignar_fila, i, fila, data.comuna, data.pais, timeout_ms)
+                for i, fila in enumerate(data.filas)
+            ]
+            for f in as_completed(futuros):
+                yield json.dumps(f.result(), ensure_ascii=False) + "\n"
+        finally:
+            # si el cliente corta la conexión, no seguir geocodificando
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
@@ -1,42 +1,248 @@
+import base64
+import json
+import os
+from datetime import date, datetime
 from typing import Optional, List, Any
 
-def list_by_uv(cursor, table: str, id_uv: Optional[int], join_table: Optional[str] = None, join_on: Optional[str] = None, order_by: Optional[str] = None) -> List[Any]:
-    """Return rows from `table` filtered by `id_uv`.
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
-    Logic:
-    - If id_uv is None return empty list.
-    - If `table` has column `id_uv` -> SELECT * FROM table WHERE id_uv=%s
-    - Else, if join_table and join_on provided -> SELECT t.* FROM table t JOIN join_table j ON <join_on> WHERE j.id_uv=%s
-    - Else -> return empty list
+from esquema import tiene_columna, columnas
 
-    NOTE: table/join_table names are expected to be constant strings (no user input) to avoid SQL injection.
+LISTADO_LIMITE_MAX = int(os.getenv("LISTADO_LIMITE_MAX", "500"))
+
+# Nunca salen en los listados, ni pidiéndolas con ?fields=
+COLUMNAS_OCULTAS = frozenset({"contrasena", "password_hash"})
+
+# Clave primaria de cada tabla listada (desempate del keyset)
+CLAVES = {
+    "vecinos": "id_vecino",
+    "noticias": "id_noticia",
+    "proyectos": "id_proyecto",
+    "reservas": "id_reserva",
+    "certificados": "id_certificado",
+    "notificaciones": "id_notificacion",
+    "actividades": "id_actividad",
+    "usuarios_en_actividades": "id",
+}
+
+
+class Pagina:
+    """Parámetros comunes de los listados (dependencia de FastAPI).
+
+    - limit: tamaño de página; sin él se devuelve la lista completa, como antes.
+    - after: cursor opaco de la cabecera X-Next-Cursor de la página anterior.
+    - fields: columnas separadas por coma; se piden así en el SELECT.
+    - total: si es true, X-Total-Count trae el conteo sin considerar limit/after.
     """
-    if id_uv is None:
-        return []
 
-    # Check if table has id_uv column
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=LISTADO_LIMITE_MAX, description="Tamaño de página"),
+        after: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+        fields: Optional[str] = Query(None, description="Columnas separadas por coma"),
+        total: bool = Query(False, description="Incluir X-Total-Count"),
+    ):
+        self.limit = limit
+        self.after = after
+        self.campos = [c.strip() for c in fields.split(",") if c.strip()] if fields else None
+        self.total = total
+
+
+def _valor_cursor(v):
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
+
+
+def codificar_cursor(valor_orden, clave) -> str:
+    crudo = json.dumps([_valor_cursor(valor_orden), clave], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
     try:
-        cursor.execute(
-            "SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'id_uv'",
-            (table,)
-        )
-        has_col = cursor.fetchone() is not None
+        relleno = "=" * (-len(cursor) % 4)
+        valor_orden, clave = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return valor_orden, clave
     except Exception:
-        has_col = False
+        raise HTTPException(status_code=400, detail="Cursor 'after' inválido")
+
+
+def _orden(order_by: Optional[str], clave: str):
+    """'fecha_publicacion DESC' -> ('fecha_publicacion', True); None -> (clave, False)."""
+    if not order_by:
+        return clave, False
+    col, _, direccion = order_by.strip().partition(" ")
+    return col.split(".")[-1], direccion.strip().upper() == "DESC"
+
+
+def proyeccion(table: str, campos: Optional[List[str]], obligatorias=()) -> str:
+    """Columnas del SELECT para el alias t: las pedidas (validadas contra el registro
+    de esquema) más `obligatorias`, nunca COLUMNAS_OCULTAS."""
+    conocidas = columnas(table) - COLUMNAS_OCULTAS
+    if campos:
+        desconocidas = [c for c in campos if c not in conocidas]
+        if desconocidas or not conocidas:
+            raise HTTPException(status_code=400, detail=f"Campos no válidos para {table}: {', '.join(desconocidas or campos)}")
+        elegidas = list(dict.fromkeys([*campos, *obligatorias]))
+    elif columnas(table) & COLUMNAS_OCULTAS:
+        elegidas = sorted(conocidas)
+    else:
+        # sin columnas ocultas: t.*; si aparecen, cerrar_pagina() las quita igual al leer
+        return "t.*"
+    return ", ".join(f"t.{c}" for c in elegidas)
+
+
+def _condicion_cursor(col: str, clave: str, op: str, valor, desc: bool) -> str:
+    """Filas después del cursor (valor, clave); NULL cuenta como menor que todo, como en MySQL."""
+    if valor is None:
+        # el cursor está entre los NULL: siguen los NULL restantes y, en ASC, todos los no NULL
+        nulos = f"(t.{col} IS NULL AND t.{clave} {op} %s)"
+        return nulos if desc else f"({nulos} OR t.{col} IS NOT NULL)"
+    siguientes = f"t.{col} {op} %s OR (t.{col} = %s AND t.{clave} {op} %s)"
+    # en DESC los NULL van al final, después de cualquier valor
+    return f"({siguientes} OR t.{col} IS NULL)" if desc else f"({siguientes})"
+
+
+def consulta_paginada(table: str, desde: str, condiciones, params, pagina: Optional[Pagina] = None,
+                      order_by: Optional[str] = None, extra_select: str = "", group_by: Optional[str] = None,
+                      extra_params=()):
+    """Arma un SELECT paginado por keyset sobre `table` con alias t.
+
+    `desde` es el FROM/JOIN y `condiciones` los términos del WHERE (con `params`).
+    `extra_params` llenan los %s de `extra_select` (p. ej. subconsultas correlacionadas).
+    Devuelve (sql, params, sql_total, params_total); sql_total es None salvo con pagina.total.
+    Con pagina.limit se piden limit + 1 filas para saber si hay página siguiente.
+
+    Los NULL de la columna de orden van donde los pone MySQL (primero en ASC,
+    al final en DESC), y la condición del cursor los cubre con ramas IS NULL:
+    una página que termina en NULL no corta las siguientes. El ORDER BY no se
+    toca, así sigue usando el índice (id_uv, fecha).
+    """
+    clave = CLAVES[table]
+    col_orden, desc = _orden(order_by, clave)
+    conds = list(condiciones)
+    ps = list(params)
 
-    if has_col:
-        sql = f"SELECT * FROM {table} WHERE id_uv = %s"
-        if order_by:
-            sql += f" ORDER BY {order_by}"
-        cursor.execute(sql, (id_uv,))
-        return cursor.fetchall() or []
+    sql_total = params_total = None
+    if pagina and pagina.total:
+        sql_total = f"SELECT COUNT(DISTINCT t.{clave}) AS total {desde}" + (f" WHERE {' AND '.join(conds)}" if conds else "")
+        params_total = tuple(ps)
 
-    # If no id_uv column, try join
+    if pagina and pagina.after:
+        valor, k = decodificar_cursor(pagina.after)
+        op = "<" if desc else ">"
+        if col_orden == clave:
+            conds.append(f"t.{clave} {op} %s")
+            ps.append(k)
+        else:
+            conds.append(_condicion_cursor(col_orden, clave, op, valor, desc))
+            ps += [k] if valor is None else [valor, valor, k]
+
+    cols = proyeccion(table, pagina.campos if pagina else None, obligatorias=(clave, col_orden))
+    sql = f"SELECT {cols}{extra_select} {desde}"
+    if conds:
+        sql += f" WHERE {' AND '.join(conds)}"
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    direccion = "DESC" if desc else "ASC"
+    sql += f" ORDER BY t.{col_orden} {direccion}"
+    if col_orden != clave:
+        sql += f", t.{clave} {direccion}"
+    if pagina and pagina.limit:
+        sql += " LIMIT %s"
+        ps.append(pagina.limit + 1)
+    return sql, tuple(extra_params) + tuple(ps), sql_total, params_total
+
+
+def cerrar_pagina(filas, table: str, pagina: Optional[Pagina], response: Optional[Response],
+                  order_by: Optional[str] = None, total: Optional[int] = None) -> List[Any]:
+    """Quita las columnas ocultas, descarta la fila extra y fija X-Next-Cursor / X-Total-Count."""
+    filas = [{k: v for k, v in f.items() if k not in COLUMNAS_OCULTAS} for f in (filas or [])]
+    if pagina is None:
+        return filas
+    siguiente = None
+    if pagina.limit and len(filas) > pagina.limit:
+        filas = filas[: pagina.limit]
+        clave = CLAVES[table]
+        col_orden, _ = _orden(order_by, clave)
+        siguiente = codificar_cursor(filas[-1].get(col_orden), filas[-1].get(clave))
+    if response is not None:
+        if siguiente:
+            response.headers["X-Next-Cursor"] = siguiente
+        if total is not None:
+            response.headers["X-Total-Count"] = str(total)
+    return filas
+
+
+def respuesta_listado(filas, pagina: Optional[Pagina], response: Optional[Response]):
+    """Para rutas con response_model: una proyección con ?fields= no cumple el modelo,
+    así que las filas van tal cual en un JSONResponse (con las cabeceras de página)."""
+    if pagina is None or not pagina.campos:
+        return filas
+    cabeceras = {k: response.headers[k] for k in ("X-Next-Cursor", "X-Total-Count") if response is not None and k in response.headers}
+    return JSONResponse(jsonable_encoder(filas), headers=cabeceras)
+
+
+def listar(cursor, table: str, consulta, pagina: Optional[Pagina] = None, response: Optional[Response] = None, order_by: Optional[str] = None) -> List[Any]:
+    sql, params, sql_total, params_total = consulta
+    cursor.execute(sql, params)
+    filas = cursor.fetchall() or []
+    total = None
+    if sql_total:
+        cursor.execute(sql_total, params_total)
+        total = (cursor.fetchone() or {}).get("total")
+    return cerrar_pagina(filas, table, pagina, response, order_by, total)
+
+
+async def listar_async(cursor, table: str, consulta, pagina: Optional[Pagina] = None, response: Optional[Response] = None, order_by: Optional[str] = None) -> List[Any]:
+    sql, params, sql_total, params_total = consulta
+    await cursor.execute(sql, params)
+    filas = list(await cursor.fetchall() or [])
+    total = None
+    if sql_total:
+        await cursor.execute(sql_total, params_total)
+        total = (await cursor.fetchone() or {}).get("total")
+    return cerrar_pagina(filas, table, pagina, response, order_by, total)
+
+
+def consulta_por_uv(table: str, id_uv: int, join_table: Optional[str] = None, join_on: Optional[str] = None, order_by: Optional[str] = None, pagina: Optional[Pagina] = None):
+    """Consulta de las filas de `table` de la UV `id_uv` (None si no se puede filtrar).
+
+    - Si `table` tiene la columna `id_uv` (según el registro de esquema) -> WHERE t.id_uv=%s
+    - Si no, con join_table y join_on -> JOIN join_table j ON <join_on> WHERE j.id_uv=%s
+    - Si no -> None
+
+    OJO: table/join_table deben ser constantes (nunca entrada del usuario) para evitar inyección SQL.
+    """
+    if tiene_columna(table, 'id_uv'):
+        return consulta_paginada(table, f"FROM {table} t", ["t.id_uv = %s"], (id_uv,), pagina, order_by)
     if join_table and join_on:
-        sql = f"SELECT t.* FROM {table} t JOIN {join_table} j ON {join_on} WHERE j.id_uv = %s"
-        if order_by:
-            sql += f" ORDER BY {order_by}"
-        cursor.execute(sql, (id_uv,))
-        return cursor.fetchall() or []
+        return consulta_paginada(table, f"FROM {table} t JOIN {join_table} j ON {join_on}", ["j.id_uv = %s"], (id_uv,), pagina, order_by)
+    return None
+
 
-    return []
+def list_by_uv(cursor, table: str, id_uv: Optional[int], join_table: Optional[str] = None, join_on: Optional[str] = None, order_by: Optional[str] = None,
+               pagina: Optional[Pagina] = None, response: Optional[Response] = None) -> List[Any]:
+    """Filas de `table` filtradas por `id_uv` (lista vacía si id_uv es None). Ver consulta_por_uv."""
+    if id_uv is None:
+        return []
+    consulta = consulta_por_uv(table, id_uv, join_table, join_on, order_by, pagina)
+    if consulta is None:
+        return []
+    return listar(cursor, table, consulta, pagina, response, order_by)
+
+
+async def list_by_uv_async(cursor, table: str, id_uv: Optional[int], join_table: Optional[str] = None, join_on: Optional[str] = None, order_by: Optional[str] = None,
+                           pagina: Optional[Pagina] = None, response: Optional[Response] = None) -> List[Any]:
+    """Igual que list_by_uv, con un DictCursor de aiomysql (ver conexion_async)."""
+    if id_uv is None:
+        return []
+    consulta = consulta_por_uv(table, id_uv, join_table, join_on, order_by, pagina)
+    if consulta is None:
+        return []
+    return await listar_async(cursor, table, consulta, pagina, response, order_by)
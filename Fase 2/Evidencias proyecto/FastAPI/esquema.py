@@ -0,0 +1,138 @@
+"""Registro en memoria de las columnas de cada tabla de bd_sut.
+
+Se carga una vez al iniciar la API (ver main.py) y se refresca por TTL o con
+POST /__esquema/refrescar. Reemplaza las consultas a INFORMATION_SCHEMA que
+antes se hacían en cada request para saber si una tabla tiene id_uv.
+
+Desde un handler async (event loop) la recarga por TTL nunca bloquea: se lanza
+en un hilo aparte y mientras tanto se responde con las columnas ya cargadas.
+
+Si el registro nunca llegó a cargarse (BD caída al arrancar), tiene_columna()
+y columnas() no responden "no está": fuera del event loop cargan bloqueando y,
+si tampoco se puede, responden 503. Así un INSERT no pierde id_uv en silencio.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from conexion import conectar_db
+
+ESQUEMA_TTL = float(os.getenv("ESQUEMA_TTL", "600"))
+# si la carga falla (p. ej. BD caída al arrancar) se reintenta antes del TTL
+_REINTENTO_SEG = 30.0
+
+_lock = threading.Lock()
+_recarga = threading.Lock()  # un solo hilo recarga a la vez
+_columnas: dict[str, frozenset[str]] = {}
+_cargado_en = 0.0
+_vence_en = 0.0
+
+
+def cargar_esquema() -> bool:
+    """Lee INFORMATION_SCHEMA.COLUMNS de la BD actual. Devuelve True si cargó."""
+    global _columnas, _cargado_en, _vence_en
+    db = conectar_db()
+    if db is None:
+        with _lock:
+            _vence_en = time.monotonic() + _REINTENTO_SEG
+        return False
+    cur = db.cursor()
+    try:
+        cur.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+        )
+        tablas: dict[str, set[str]] = {}
+        for tabla, columna in cur.fetchall():
+            tablas.setdefault(tabla, set()).add(columna)
+    except Exception as e:
+        print(f"[ESQUEMA] error al cargar: {e}")
+        with _lock:
+            _vence_en = time.monotonic() + _REINTENTO_SEG
+        return False
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+        try:
+            db.close()
+        except Exception:
+            pass
+
+    with _lock:
+        _columnas = {t: frozenset(c) for t, c in tablas.items()}
+        _cargado_en = time.monotonic()
+        _vence_en = _cargado_en + ESQUEMA_TTL
+    print(f"[ESQUEMA] {len(tablas)} tablas cargadas")
+    return True
+
+
+def vencido() -> bool:
+    return time.monotonic() >= _vence_en
+
+
+def _en_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def refrescar_si_vencio() -> None:
+    """Recarga si venció el TTL. Mientras un hilo recarga, los demás siguen con
+    las columnas ya cargadas; solo esperan si todavía no hay ninguna."""
+    if not vencido():
+        return
+    if _en_event_loop():
+        # mysql.connector bloquearía el event loop: recarga en segundo plano
+        if not _recarga.locked():
+            threading.Thread(target=refrescar_si_vencio, name="esquema", daemon=True).start()
+        return
+    if not _recarga.acquire(blocking=not _columnas):
+        return
+    try:
+        if vencido():
+            cargar_esquema()
+    finally:
+        _recarga.release()
+
+
+def _registro() -> dict[str, frozenset[str]]:
+    """Columnas vigentes; 503 si nunca se pudieron cargar."""
+    if _cargado_en:
+        refrescar_si_vencio()
+    elif _en_event_loop():
+        if not _recarga.locked():
+            threading.Thread(target=_cargar_primera_vez, name="esquema", daemon=True).start()
+    else:
+        _cargar_primera_vez()
+    if not _cargado_en:
+        raise HTTPException(status_code=503, detail="Esquema de la base de datos no disponible; intente nuevamente")
+    return _columnas
+
+
+def _cargar_primera_vez() -> None:
+    # sin registro no se espera el reintento por TTL: cada request lo intenta
+    with _recarga:
+        if not _cargado_en:
+            cargar_esquema()
+
+
+def tiene_columna(tabla: str, columna: str = "id_uv") -> bool:
+    return columna in _registro().get(tabla, ())
+
+
+def columnas(tabla: str) -> frozenset[str]:
+    return _registro().get(tabla, frozenset())
+
+
+def esquema_info() -> dict:
+    return {
+        "tablas": {t: sorted(c) for t, c in sorted(_columnas.items())},
+        "edad_s": round(time.monotonic() - _cargado_en, 1) if _cargado_en else None,
+        "ttl_s": ESQUEMA_TTL,
+    }
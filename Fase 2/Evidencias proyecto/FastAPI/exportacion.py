@@ -0,0 +1,139 @@
+"""Exportación en streaming de listados completos (NDJSON, CSV o JSON).
+
+Las filas se leen con un cursor del lado del servidor (aiomysql SSDictCursor)
+en lotes de EXPORT_LOTE y se envían con transferencia chunked a medida que
+llegan: la memoria queda acotada a un lote sin importar el tamaño de la tabla
+y el primer byte sale apenas MySQL entrega las primeras filas.
+
+Cada exportación usa su propia conexión del pool async, no la sesión del
+request (que se cierra antes de que termine el streaming). Las rutas de
+exportación exigen jwt.deps.get_directiva.
+"""
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+import aiomysql
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from conexion_async import obtener_pool
+
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", "500"))
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+}
+
+
+def parametro_formato(formato: str = Query("ndjson", description="ndjson, csv o json")) -> str:
+    return formato
+
+
+def _valor(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    if isinstance(v, (bytes, bytearray)):
+        return v.decode("utf-8", errors="replace")
+    return v
+
+
+def _json(fila: dict) -> str:
+    return json.dumps({k: _valor(v) for k, v in fila.items()}, ensure_ascii=False)
+
+
+async def _abrir(sql: str, params):
+    """Conexión propia del pool async y cursor sin buffer ya ejecutado."""
+    try:
+        pool = await obtener_pool()
+        conn = await pool.acquire()
+    except Exception as e:
+        print(f"[EXPORT] Error al conectar: {e}")
+        raise HTTPException(status_code=500, detail="Error al conectar a la base de datos")
+    try:
+        cur = await conn.cursor(aiomysql.SSDictCursor)
+        await cur.execute(sql, params)
+    except Exception as e:
+        conn.close()
+        pool.release(conn)
+        print(f"[EXPORT] Error en la consulta: {e}")
+        raise HTTPException(status_code=500, detail="Error al exportar")
+    return pool, conn, cur
+
+
+async def _lotes(cur, ocultas):
+    while True:
+        lote = await cur.fetchmany(EXPORT_LOTE)
+        if not lote:
+            return
+        yield [{k: v for k, v in f.items() if k not in ocultas} for f in lote]
+
+
+async def _ndjson(filas, columnas):
+    async for lote in filas:
+        yield "".join(_json(f) + "\n" for f in lote)
+
+
+async def _json_arreglo(filas, columnas):
+    yield "["
+    primero = True
+    async for lote in filas:
+        trozo = ",".join(_json(f) for f in lote)
+        yield trozo if primero else "," + trozo
+        primero = False
+    yield "]"
+
+
+async def _csv(filas, columnas):
+    buf = io.StringIO()
+    escritor = csv.DictWriter(buf, fieldnames=columnas, extrasaction="ignore")
+    buf.write("\ufeff")  # BOM para que Excel detecte UTF-8
+    escritor.writeheader()
+    yield buf.getvalue()
+    async for lote in filas:
+        buf.seek(0)
+        buf.truncate()
+        for f in lote:
+            escritor.writerow({k: _valor(v) for k, v in f.items()})
+        yield buf.getvalue()
+
+
+async def exportar(consulta, formato: str, nombre: str, ocultas=frozenset()) -> StreamingResponse:
+    """StreamingResponse para `consulta` = (sql, params, ...) como la de endpoints.utils.consulta_paginada."""
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato} (use {', '.join(FORMATOS)})")
+    if consulta is None:
+        raise HTTPException(status_code=404, detail="La tabla no se puede filtrar por UV")
+    pool, conn, cur = await _abrir(consulta[0], consulta[1])
+    columnas = [d[0] for d in (cur.description or ()) if d[0] not in ocultas]
+    serializar = {"ndjson": _ndjson, "csv": _csv, "json": _json_arreglo}[formato]
+
+    async def cuerpo():
+        completo = False
+        try:
+            async for trozo in serializar(_lotes(cur, ocultas), columnas):
+                yield trozo
+            await cur.close()
+            completo = True
+        finally:
+            if not completo:
+                # cliente desconectado o error a mitad: quedan filas sin leer en el
+                # socket, la conexión no se puede reutilizar
+                conn.close()
+            pool.release(conn)
+
+    return StreamingResponse(
+        cuerpo(),
+        media_type=FORMATOS[formato],
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre}.{formato}"',
+            "Cache-Control": "no-store",
+        },
+    )
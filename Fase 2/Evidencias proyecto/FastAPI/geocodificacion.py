@@ -0,0 +1,230 @@
+"""Clientes HTTP compartidos para los proveedores de geocodificación.
+
+Cada proveedor tiene su propio requests.Session con pool de conexiones
+keep-alive (se evita repetir DNS + TCP + TLS en cada consulta), reintentos con
+backoff exponencial ante 429/5xx y errores de conexión (respetando
+Retry-After), y un límite de frecuencia propio. Nominatim exige como máximo
+1 request por segundo, por eso su intervalo mínimo por defecto es 1 s.
+
+Los reintentos los hace ClienteHTTP.get (no el adapter de urllib3) para que
+cada intento vuelva a pedir turno al limitador y para que espera de turno,
+intentos y backoff quepan juntos en el timeout del llamador. get() acepta
+además un threading.Event `cancelado`: con las consultas escalonadas de
+endpointUV, las que pierden dejan de esperar turno o backoff apenas hay un
+ganador y no consumen turnos del proveedor.
+
+Las URL base se pueden cambiar por variables de entorno (útil para pruebas
+contra un servidor local).
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "JV-Loader/1.0 (dev@example.com)"
+
+GOOGLE_URL = os.getenv("GOOGLE_GEOCODE_URL", "https://maps.googleapis.com/maps/api/geocode/json")
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+GEOAPIFY_URL = os.getenv("GEOAPIFY_URL", "https://api.geoapify.com/v1/geocode/search")
+OPENCAGE_URL = os.getenv("OPENCAGE_URL", "https://api.opencagedata.com/geocode/v1/json")
+
+GEOCODE_REINTENTOS = int(os.getenv("GEOCODE_REINTENTOS", "2"))
+GEOCODE_BACKOFF = float(os.getenv("GEOCODE_BACKOFF", "0.3"))
+GEOCODE_CONEXIONES = int(os.getenv("GEOCODE_CONEXIONES", "16"))
+
+REINTENTAR_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class LimiteFrecuencia(Exception):
+    """El próximo turno libre del proveedor llega después del timeout del llamador."""
+
+
+class Cancelada(Exception):
+    """El llamador ya no necesita la respuesta (otra consulta ganó)."""
+
+
+class ErrorProveedor(Exception):
+    """El proveedor respondió con un error (cuota, clave inválida...), no con "sin resultados"."""
+
+
+class ClienteHTTP:
+    def __init__(
+        self,
+        nombre: str,
+        intervalo_min: float = 0.0,
+        reintentos: int = GEOCODE_REINTENTOS,
+        backoff: float = GEOCODE_BACKOFF,
+        conexiones: int = GEOCODE_CONEXIONES,
+        headers: dict | None = None,
+    ):
+        self.nombre = nombre
+        self.intervalo_min = intervalo_min
+        self.reintentos = max(0, reintentos)
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._proximo = 0.0
+        self.stats = {"requests": 0, "esperas": 0, "rechazados": 0, "errores": 0, "reintentos": 0}
+
+        # sin reintentos en el adapter: los hace get() pasando por _turno
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=conexiones, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, **(headers or {})})
+
+    def _turno(self, timeout: float, cancelado: threading.Event | None = None):
+        """Reserva el próximo turno según intervalo_min y espera hasta él.
+
+        Si `cancelado` se activa durante la espera lanza Cancelada y, si nadie
+        reservó después, devuelve el turno.
+        """
+        if cancelado is not None and cancelado.is_set():
+            raise Cancelada(self.nombre)
+        if self.intervalo_min <= 0:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            espera = max(0.0, self._proximo - ahora)
+            if espera > timeout:
+                self.stats["rechazados"] += 1
+                raise LimiteFrecuencia(f"{self.nombre}: sin turno libre antes de {timeout:.1f}s")
+            self._proximo = max(ahora, self._proximo) + self.intervalo_min
+            reservado = self._proximo
+            if espera:
+                self.stats["esperas"] += 1
+        if not espera:
+            return
+        if cancelado is None:
+            time.sleep(espera)
+        elif cancelado.wait(espera):
+            with self._lock:
+                if self._proximo == reservado:
+                    self._proximo -= self.intervalo_min
+            raise Cancelada(self.nombre)
+
+    def _espera(self, intento: int, r: requests.Response | None) -> float:
+        """Backoff exponencial, o Retry-After (en segundos) si el proveedor lo indica."""
+        if r is not None:
+            try:
+                return max(0.0, float(r.headers.get("Retry-After", "")))
+            except ValueError:
+                pass
+        return self.backoff * (2 ** intento)
+
+    def get(self, url: str, params: dict | None = None, timeout: float = 5.0,
+            cancelado: threading.Event | None = None) -> requests.Response:
+        """GET con reintentos ante 429/5xx y errores de conexión; todo dentro de timeout.
+
+        Si ya no queda tiempo (o intentos) devuelve la última respuesta o relanza el último error.
+        Con `cancelado` activado no empieza más intentos (lanza Cancelada).
+        """
+        limite = time.monotonic() + timeout
+        intento = 0
+        while True:
+            self._turno(max(0.0, limite - time.monotonic()), cancelado)
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise requests.Timeout(f"{self.nombre}: timeout de {timeout:.1f}s agotado esperando turno")
+            self.stats["requests"] += 1
+            try:
+                r = self.session.get(url, params=params, timeout=restante)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.stats["errores"] += 1
+                r, error = None, e
+            except requests.RequestException:
+                self.stats["errores"] += 1
+                raise
+            else:
+                if r.status_code not in REINTENTAR_STATUS:
+                    return r
+            espera = self._espera(intento, r)
+            if intento >= self.reintentos or time.monotonic() + espera >= limite:
+                if r is None:
+                    raise error
+                return r
+            self.stats["reintentos"] += 1
+            if cancelado is None:
+                time.sleep(espera)
+            elif cancelado.wait(espera):
+                raise Cancelada(self.nombre)
+            intento += 1
+
+    def get_json(self, url: str, params: dict | None = None, timeout: float = 5.0,
+                 cancelado: threading.Event | None = None):
+        r = self.get(url, params=params, timeout=timeout, cancelado=cancelado)
+        r.raise_for_status()
+        return r.json()
+
+
+google = ClienteHTTP("google")
+nominatim = ClienteHTTP(
+    "nominatim",
+    intervalo_min=float(os.getenv("NOMINATIM_INTERVALO_SEG", "1.0")),
+    conexiones=2,
+    headers={"Accept-Language": "es"},
+)
+geoapify = ClienteHTTP("geoapify", intervalo_min=float(os.getenv("GEOAPIFY_INTERVALO_SEG", "0.2")))
+opencage = ClienteHTTP("opencage", intervalo_min=float(os.getenv("OPENCAGE_INTERVALO_SEG", "1.0")))
+
+CLIENTES = {c.nombre: c for c in (google, nominatim, geoapify, opencage)}
+
+
+def clientes_stats() -> dict:
+    return {
+        nombre: {**c.stats, "intervalo_min_s": c.intervalo_min}
+        for nombre, c in CLIENTES.items()
+    }
+
+
+# -------------------------------
+# Google Maps Geocoding
+# -------------------------------
+_GOOGLE_MAPS_KEY = (os.getenv("GOOGLE_MAPS_KEY") or "").strip()
+
+
+def google_configurado() -> bool:
+    return bool(_GOOGLE_MAPS_KEY)
+
+
+def consultar_google(direccion: str, comuna: str = "Maipú", pais: str = "Chile", timeout_sec: float = 8.0,
+                     cancelado: threading.Event | None = None):
+    """
+    Geocodifica con Google Maps (dirección -> lat/lon): dict con lat, lon,
+    display_name y source='google', o None si no hay resultados. Los errores de
+    red y los status distintos de OK/ZERO_RESULTS se propagan.
+    """
+    if not _GOOGLE_MAPS_KEY:
+        raise ErrorProveedor("Falta GOOGLE_MAPS_KEY")
+
+    # limpiamos espacios extra y evitamos repetir comuna/pais
+    q = f"{(direccion or '').strip()}, {comuna}, {pais}".strip(", ")
+
+    params = {
+        "address": q,
+        # región para sesgo a Chile
+        "region": "cl",
+        # componentes para sesgo fuerte a Maipú/Chile
+        # Nota: 'administrative_area' no siempre matchea; 'locality' Maipú ayuda bastante
+        "components": "country:CL|locality:Maipú",
+        "key": _GOOGLE_MAPS_KEY,
+    }
+
+    data = google.get_json(GOOGLE_URL, params=params, timeout=timeout_sec, cancelado=cancelado)  # ⬅️ usa timeout paramétrico
+
+    status = data.get("status")
+    if status == "OK" and data.get("results"):
+        # Tomamos el 1º resultado; si quieres, filtra por 'types'
+        res0 = data["results"][0]
+        loc = res0["geometry"]["location"]
+        return {
+            "lat": float(loc["lat"]),
+            "lon": float(loc["lng"]),
+            "display_name": res0.get("formatted_address", q),
+            "source": "google",
+        }
+    if status in ("OK", "ZERO_RESULTS"):
+        return None
+    raise ErrorProveedor(f"google: {status} {data.get('error_message') or ''}".strip())
+
@@ -0,0 +1,276 @@
+"""Índice espacial en memoria de las unidades vecinales (tabla juntas_vecinos).
+
+Los polígonos se leen una vez como GeoJSON y quedan como listas de vértices
+(lon, lat) con su bounding box, indexados en una grilla regular. Así
+/uv/by_point, /uv/assign y el registro de vecinos resuelven la UV sin
+escanear la tabla en cada request.
+
+Para la UV más cercana, todos los vértices y bordes de todas las UV se guardan
+en arreglos NumPy en radianes y las distancias se calculan en una sola pasada
+vectorizada. La distancia es al borde (punto-segmento), no solo a los vértices.
+
+El índice se revalida cada UV_INDICE_REVISION_SEG con CHECKSUM TABLE y se
+reconstruye si juntas_vecinos cambió; invalidar_indice_uv() fuerza la recarga.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from conexion import conectar_db
+
+UV_INDICE_REVISION_SEG = float(os.getenv("UV_INDICE_REVISION_SEG", "60"))
+# tamaño de celda de la grilla (~1.1 km en latitud)
+_CELDA_GRADOS = 0.01
+R_TIERRA_M = 6371000.0
+
+
+def _haversine_rad(lat1, lon1, lat2, lon2):
+    dphi = lat2 - lat1
+    dlmb = lon2 - lon1
+    a = np.sin(dphi / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlmb / 2) ** 2
+    return 2 * R_TIERRA_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros; acepta escalares o arreglos (en grados)."""
+    return _haversine_rad(np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2))
+
+
+def _poligonos_geojson(gj_str):
+    """GeoJSON (Polygon/MultiPolygon) -> lista de polígonos, cada uno lista de anillos [(lon, lat), ...]."""
+    try:
+        gjson = json.loads(gj_str or "{}")
+    except Exception:
+        return []
+    t = gjson.get("type")
+    coords = gjson.get("coordinates") or []
+    if t == "Polygon":
+        coords = [coords]
+    elif t != "MultiPolygon":
+        return []
+    return [
+        [[(float(lon), float(lat)) for lon, lat in anillo] for anillo in poly if anillo]
+        for poly in coords
+        if poly
+    ]
+
+
+def _en_anillo(x, y, anillo) -> bool:
+    # ray casting sobre (lon, lat)
+    dentro = False
+    j = len(anillo) - 1
+    for i in range(len(anillo)):
+        xi, yi = anillo[i]
+        xj, yj = anillo[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            dentro = not dentro
+        j = i
+    return dentro
+
+
+class UV:
+    __slots__ = ("id_uv", "nombre", "poligonos", "bbox")
+
+    def __init__(self, id_uv, nombre, poligonos):
+        self.id_uv = id_uv
+        self.nombre = nombre
+        self.poligonos = poligonos
+        lons = [p[0] for poly in poligonos for anillo in poly for p in anillo]
+        lats = [p[1] for poly in poligonos for anillo in poly for p in anillo]
+        self.bbox = (min(lons), min(lats), max(lons), max(lats)) if lons else None
+
+    def contiene(self, lat, lon) -> bool:
+        minLon, minLat, maxLon, maxLat = self.bbox
+        if not (minLat <= lat <= maxLat and minLon <= lon <= maxLon):
+            return False
+        for exterior, *huecos in self.poligonos:
+            if _en_anillo(lon, lat, exterior) and not any(_en_anillo(lon, lat, h) for h in huecos):
+                return True
+        return False
+
+
+class IndiceUV:
+    def __init__(self, filas):
+        self.uvs = []
+        for r in filas:
+            poligonos = _poligonos_geojson(r["gj"])
+            if poligonos:
+                uv = UV(r["id_uv"], r["nombre"], poligonos)
+                if uv.bbox:
+                    self.uvs.append(uv)
+        self._grilla: dict[tuple[int, int], list[UV]] = {}
+        for uv in self.uvs:
+            minLon, minLat, maxLon, maxLat = uv.bbox
+            for cx in range(self._celda(minLon), self._celda(maxLon) + 1):
+                for cy in range(self._celda(minLat), self._celda(maxLat) + 1):
+                    self._grilla.setdefault((cx, cy), []).append(uv)
+        self._armar_arreglos()
+
+    def _armar_arreglos(self):
+        """Vértices y segmentos de todas las UV, contiguos por UV, en radianes."""
+        lats, lons, ini_v = [], [], []
+        a_lat, a_lon, b_lat, b_lon, ini_s = [], [], [], [], []
+        for uv in self.uvs:
+            ini_v.append(len(lats))
+            ini_s.append(len(a_lat))
+            for poly in uv.poligonos:
+                for anillo in poly:
+                    for lon, lat in anillo:
+                        lats.append(lat)
+                        lons.append(lon)
+                    # si el anillo viene abierto, cerrarlo para incluir el último borde
+                    cerrado = anillo if anillo[0] == anillo[-1] else anillo + anillo[:1]
+                    for (lon1, lat1), (lon2, lat2) in zip(cerrado, cerrado[1:]):
+                        a_lat.append(lat1)
+                        a_lon.append(lon1)
+                        b_lat.append(lat2)
+                        b_lon.append(lon2)
+            if len(a_lat) == ini_s[-1]:
+                # UV de un solo punto: segmento degenerado para no dejar el tramo vacío
+                a_lat.append(lats[-1])
+                a_lon.append(lons[-1])
+                b_lat.append(lats[-1])
+                b_lon.append(lons[-1])
+        self._v_lat = np.radians(np.asarray(lats, dtype=np.float64))
+        self._v_lon = np.radians(np.asarray(lons, dtype=np.float64))
+        self._ini_v = np.asarray(ini_v, dtype=np.intp)
+        self._a_lat = np.radians(np.asarray(a_lat, dtype=np.float64))
+        self._a_lon = np.radians(np.asarray(a_lon, dtype=np.float64))
+        self._b_lat = np.radians(np.asarray(b_lat, dtype=np.float64))
+        self._b_lon = np.radians(np.asarray(b_lon, dtype=np.float64))
+        self._ini_s = np.asarray(ini_s, dtype=np.intp)
+
+    @staticmethod
+    def _celda(v: float) -> int:
+        return math.floor(v / _CELDA_GRADOS)
+
+    def que_contiene(self, lat, lon):
+        for uv in self._grilla.get((self._celda(lon), self._celda(lat)), ()):
+            if uv.contiene(lat, lon):
+                return uv
+        return None
+
+    def distancias_vertices(self, lat, lon):
+        """Distancia (m) del punto al vértice más cercano de cada UV, en orden de self.uvs."""
+        if not self.uvs:
+            return np.empty(0)
+        d = _haversine_rad(math.radians(lat), math.radians(lon), self._v_lat, self._v_lon)
+        return np.minimum.reduceat(d, self._ini_v)
+
+    def distancias_bordes(self, lat, lon):
+        """Distancia (m) del punto al borde más cercano de cada UV, en orden de self.uvs.
+
+        Proyecta los segmentos a un plano equirectangular centrado en el punto,
+        exacto de sobra a escala comunal.
+        """
+        if not self.uvs:
+            return np.empty(0)
+        lat0, lon0 = math.radians(lat), math.radians(lon)
+        k = math.cos(lat0) * R_TIERRA_M
+        ax = (self._a_lon - lon0) * k
+        ay = (self._a_lat - lat0) * R_TIERRA_M
+        dx = (self._b_lon - lon0) * k - ax
+        dy = (self._b_lat - lat0) * R_TIERRA_M - ay
+        largo2 = dx * dx + dy * dy
+        t = np.divide(-(ax * dx + ay * dy), largo2, out=np.zeros_like(largo2), where=largo2 > 0)
+        np.clip(t, 0.0, 1.0, out=t)
+        d = np.hypot(ax + t * dx, ay + t * dy)
+        return np.minimum.reduceat(d, self._ini_s)
+
+    def mas_cercana(self, lat, lon):
+        d = self.distancias_bordes(lat, lon)
+        if d.size == 0:
+            return None, float("inf")
+        i = int(np.argmin(d))
+        return self.uvs[i], float(d[i])
+
+    def buscar(self, lat, lon):
+        """UV que contiene el punto o, si ninguna, la más cercana. None si no hay UV cargadas."""
+        uv = self.que_contiene(lat, lon)
+        if uv is not None:
+            return {"id_uv": uv.id_uv, "nombre": uv.nombre, "inside": True, "dist_m": 0.0}
+        uv, d = self.mas_cercana(lat, lon)
+        if uv is None:
+            return None
+        return {"id_uv": uv.id_uv, "nombre": uv.nombre, "inside": False, "dist_m": float(d)}
+
+
+_lock = threading.Lock()
+_indice: IndiceUV | None = None
+_huella = None
+_revisado_en = 0.0
+
+
+def _leer_huella(cur):
+    cur.execute("CHECKSUM TABLE juntas_vecinos")
+    row = cur.fetchone()
+    return row.get("Checksum") if row else None
+
+
+def _cargar() -> IndiceUV:
+    global _indice, _huella, _revisado_en
+    db = conectar_db()
+    if db is None:
+        raise RuntimeError("No se pudo conectar a la base de datos")
+    cur = db.cursor(dictionary=True)
+    try:
+        huella = _leer_huella(cur)
+        if _indice is not None and huella is not None and huella == _huella:
+            _revisado_en = time.monotonic()
+            return _indice
+        cur.execute("SELECT id_uv, nombre, ST_AsGeoJSON(geom) AS gj FROM juntas_vecinos")
+        indice = IndiceUV(cur.fetchall() or [])
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+        try:
+            db.close()
+        except Exception:
+            pass
+    _indice, _huella, _revisado_en = indice, huella, time.monotonic()
+    print(f"[UV] índice espacial cargado: {len(indice.uvs)} UV")
+    return indice
+
+
+def indice_uv() -> IndiceUV:
+    """Índice vigente; lo carga o revalida contra la BD si corresponde."""
+    if _indice is not None and time.monotonic() - _revisado_en < UV_INDICE_REVISION_SEG:
+        return _indice
+    with _lock:
+        if _indice is not None and time.monotonic() - _revisado_en < UV_INDICE_REVISION_SEG:
+            return _indice
+        try:
+            return _cargar()
+        except Exception as e:
+            # si la BD falla pero ya hay índice, seguimos sirviendo el anterior
+            if _indice is None:
+                raise
+            print(f"[UV] no se pudo revalidar el índice: {e}")
+            return _indice
+
+
+def invalidar_indice_uv():
+    global _revisado_en, _huella
+    with _lock:
+        _revisado_en = 0.0
+        _huella = None
+
+
+def buscar_uv(lat: float, lon: float):
+    return indice_uv().buscar(lat, lon)
+
+
+def indice_info() -> dict:
+    return {
+        "cargado": _indice is not None,
+        "uvs": len(_indice.uvs) if _indice else 0,
+        "celdas": len(_indice._grilla) if _indice else 0,
+        "huella": _huella,
+        "edad_s": round(time.monotonic() - _revisado_en, 1) if _indice else None,
+    }
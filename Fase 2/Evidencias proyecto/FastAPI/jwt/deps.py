@@ -2,11 +2,58 @@
 
 Contiene helpers ligeros que no dependen de la aplicación FastAPI para evitar
 import cycles entre `main.py` y los routers en `endpoints/`.
+
+Dentro de un request, conectar_db() devuelve la sesión compartida (ver
+conexion.SesionDB), así que estas dependencias reutilizan la misma conexión
+que luego usa el handler.
+
+La verificación del token se cachea en jwt_utils. Aquí se cachean además la
+fila del usuario (get_current_user) y la UV resuelta por usuario
+(get_admin_uv), por AUTH_CACHE_TTL segundos, para que las ráfagas de requests
+de un mismo usuario no consulten la BD solo para autorizar. Quien modifique
+usuarios o vecinos debe llamar a invalidar_usuario().
+
+invalidar_usuario() solo limpia la cache del proceso actual: con varios workers
+de uvicorn, los demás siguen viendo el rol o la UV anterior hasta que vence la
+entrada. Por eso el TTL por defecto es de pocos segundos; subirlo alarga la
+ventana en que un usuario borrado o con el rol revocado mantiene el acceso.
 """
+import os
+
 from fastapi import Depends, Header, HTTPException, status
+from cache import CacheLRU
 from conexion import conectar_db
 from .jwt_utils import verificar_access_token
 
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "5"))
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "4096"))
+
+# sub -> fila de usuarios (id_usuario, rol, id_uv, rut, nombre, id_vecino)
+_usuarios = CacheLRU(maxsize=AUTH_CACHE_MAX, ttl=AUTH_CACHE_TTL)
+# sub -> {"id_uv": ..., "id_usuario": ..., "id_vecino": ..., "rut": ...}; id_uv None también se cachea
+_uv_por_usuario = CacheLRU(maxsize=AUTH_CACHE_MAX, ttl=AUTH_CACHE_TTL)
+
+
+def invalidar_usuario(id_usuario=None, id_vecino=None, rut=None):
+    """Quita de las caches de autorización las entradas que coinciden con cualquiera de los datos."""
+    if id_usuario is None and id_vecino is None and rut is None:
+        return
+
+    def coincide(sub, valor):
+        valor = valor or {}
+        return (
+            (id_usuario is not None and (str(sub) == str(id_usuario) or valor.get("id_usuario") == id_usuario))
+            or (id_vecino is not None and valor.get("id_vecino") == id_vecino)
+            or (rut is not None and valor.get("rut") == rut)
+        )
+
+    _usuarios.borrar_si(coincide)
+    _uv_por_usuario.borrar_si(coincide)
+
+
+def auth_cache_stats() -> dict:
+    return {"usuarios": _usuarios.stats(), "uv_por_usuario": _uv_por_usuario.stats()}
+
 
 def get_bearer_token(authorization: str | None = Header(None)) -> str:
     if not authorization or not authorization.startswith("Bearer "):
@@ -18,28 +65,20 @@ def get_bearer_token(authorization: str | None = Header(None)) -> str:
     return authorization.split(" ", 1)[1]
 
 
-def get_current_user(token: str = Depends(get_bearer_token)) -> dict:
-    payload = verificar_access_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token inválido")
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token sin 'sub'")
+def _usuario_por_sub(user_id):
+    hit, user = _usuarios.obtener(str(user_id))
+    if hit:
+        return dict(user) if user else None
     db = conectar_db()
     if db is None:
         raise HTTPException(status_code=500, detail="No hay conexión a la base de datos")
     cur = db.cursor(dictionary=True)
     try:
         cur.execute(
-            "SELECT id_usuario, rol, id_uv, rut, nombre FROM usuarios WHERE id_usuario=%s",
+            "SELECT id_usuario, rol, id_uv, rut, nombre, id_vecino FROM usuarios WHERE id_usuario=%s",
             (user_id,),
         )
         user = cur.fetchone()
-        if not user:
-            raise HTTPException(status_code=401, detail="Usuario no encontrado")
-        user["id_uv_from_token"] = payload.get("id_uv")
-        user["rol_from_token"] = payload.get("rol")
-        return user
     finally:
         try:
             cur.close()
@@ -49,25 +88,88 @@ def get_current_user(token: str = Depends(get_bearer_token)) -> dict:
             db.close()
         except Exception:
             pass
+    _usuarios.guardar(str(user_id), dict(user) if user else None)
+    return user
 
 
-def get_admin_uv(authorization: str | None = Header(None)) -> int | None:
-    """Deriva id_uv del usuario actual de forma tolerante.
+def get_current_user(token: str = Depends(get_bearer_token)) -> dict:
+    payload = verificar_access_token(token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Token inválido")
+    user_id = payload.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token sin 'sub'")
+    user = _usuario_por_sub(user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    user.pop("id_vecino", None)
+    user["id_uv_from_token"] = payload.get("id_uv")
+    user["rol_from_token"] = payload.get("rol")
+    return user
 
-    - Si no hay Authorization o el token es inválido, devuelve None (no 401).
-    - Intenta primero id_uv en el token; si no, recurre a la BD (usuarios → vecinos por id_vecino o rut).
-    - En cualquier error de BD o formato, devuelve None.
-    """
-    if not authorization or not authorization.startswith("Bearer "):
+
+def get_directiva(usuario: dict = Depends(get_current_user)) -> dict:
+    """Solo la directiva (cualquier rol distinto de 'vecino'): datos personales de otros vecinos, exportaciones."""
+    if usuario.get("rol") == "vecino":
+        raise HTTPException(status_code=403, detail="No autorizado")
+    return usuario
+
+
+def _resolver_uv_bd(user_id, rut_token):
+    """Como /me/id_uv antes de la cache: por sub (usuarios → vecinos por id_vecino) y,
+    si no alcanza, por rut (usuarios → vecinos, y por último vecinos directo).
+    Devuelve el dict a cachear."""
+    db = conectar_db()
+    if db is None:
         return None
+    cur = db.cursor(dictionary=True)
     try:
-        token = authorization.split(" ", 1)[1]
-        payload = verificar_access_token(token)
-        if not payload:
+        cur.execute("SELECT id_usuario, id_uv, id_vecino, rut FROM usuarios WHERE id_usuario = %s", (user_id,))
+        row = cur.fetchone() or {}
+        res = {"id_uv": None, "id_usuario": row.get("id_usuario"), "id_vecino": row.get("id_vecino"), "rut": row.get("rut") or rut_token}
+
+        def por_usuario(u):
+            if u.get("id_uv") is not None:
+                return int(u["id_uv"])
+            if u.get("id_vecino") is not None:
+                cur.execute("SELECT id_uv FROM vecinos WHERE id_vecino = %s", (u["id_vecino"],))
+                v = cur.fetchone()
+                if v and v.get("id_uv") is not None:
+                    return int(v["id_uv"])
             return None
+
+        res["id_uv"] = por_usuario(row)
+        if res["id_uv"] is not None or not res["rut"]:
+            return res
+        # el sub no corresponde a un id_usuario (o no tiene UV): buscar el usuario por rut
+        cur.execute("SELECT id_usuario, id_uv, id_vecino FROM usuarios WHERE rut = %s", (res["rut"],))
+        por_rut = cur.fetchone() or {}
+        if por_rut:
+            res["id_usuario"] = res["id_usuario"] or por_rut.get("id_usuario")
+            res["id_vecino"] = res["id_vecino"] or por_rut.get("id_vecino")
+            res["id_uv"] = por_usuario(por_rut)
+            if res["id_uv"] is not None:
+                return res
+        cur.execute("SELECT id_uv FROM vecinos WHERE rut = %s LIMIT 1", (res["rut"],))
+        v2 = cur.fetchone()
+        if v2 and v2.get("id_uv") is not None:
+            res["id_uv"] = int(v2["id_uv"])
+        return res
     except Exception:
         return None
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+        try:
+            db.close()
+        except Exception:
+            pass
+
 
+def id_uv_de_payload(payload: dict) -> int | None:
+    """UV del usuario del token: claim id_uv si viene; si no, la resolución cacheada por 'sub'."""
     uv_claim = payload.get("id_uv")
     if uv_claim is not None:
         try:
@@ -78,35 +180,31 @@ def get_admin_uv(authorization: str | None = Header(None)) -> int | None:
     user_id = payload.get("sub")
     if not user_id:
         return None
-    db = conectar_db()
-    if db is None:
+    hit, res = _uv_por_usuario.obtener(str(user_id))
+    if not hit:
+        res = _resolver_uv_bd(user_id, payload.get("rut"))
+        if res is None:
+            # error de BD: no se cachea
+            return None
+        _uv_por_usuario.guardar(str(user_id), res)
+    return res.get("id_uv")
+
+
+def get_admin_uv(authorization: str | None = Header(None)) -> int | None:
+    """Deriva id_uv del usuario actual de forma tolerante.
+
+    - Si no hay Authorization o el token es inválido, devuelve None (no 401).
+    - Intenta primero id_uv en el token; si no, recurre a la BD (usuarios → vecinos por id_vecino o rut),
+      con el resultado cacheado por usuario.
+    - En cualquier error de BD o formato, devuelve None.
+    """
+    if not authorization or not authorization.startswith("Bearer "):
         return None
-    cur = db.cursor(dictionary=True)
     try:
-        cur.execute("SELECT id_uv, id_vecino, rut FROM usuarios WHERE id_usuario = %s", (user_id,))
-        row = cur.fetchone() or {}
-        if row.get("id_uv") is not None:
-            return int(row["id_uv"])
-        if row.get("id_vecino") is not None:
-            cur.execute("SELECT id_uv FROM vecinos WHERE id_vecino = %s", (row["id_vecino"],))
-            v = cur.fetchone()
-            if v and v.get("id_uv") is not None:
-                return int(v["id_uv"])
-        rut = row.get("rut") or payload.get("rut")
-        if rut:
-            cur.execute("SELECT id_uv FROM vecinos WHERE rut = %s LIMIT 1", (rut,))
-            v2 = cur.fetchone()
-            if v2 and v2.get("id_uv") is not None:
-                return int(v2["id_uv"])
-        return None
+        token = authorization.split(" ", 1)[1]
+        payload = verificar_access_token(token)
+        if not payload:
+            return None
     except Exception:
         return None
-    finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
-        try:
-            db.close()
-        except Exception:
-            pass
+    return id_uv_de_payload(payload)
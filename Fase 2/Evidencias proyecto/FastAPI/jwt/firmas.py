@@ -0,0 +1,253 @@
+"""Backends de firma JWT y llavero con rotación por `kid`.
+
+jwt_utils elige el backend con JWT_BACKEND:
+
+- "nativo" (por defecto): codifica/decodifica el JWT aquí mismo. HS256/384/512
+  con hmac de la stdlib; EdDSA (Ed25519) con `cryptography` si está instalado.
+  Evita la capa genérica de python-jose (jwk, validaciones por reflexión), que
+  es la mayor parte del costo por token.
+- "jose": python-jose, como antes. Sirve para comparar o para algoritmos que
+  el backend nativo no implementa (RS256, ES256...).
+
+Los dos producen tokens estándar e intercambiables para el mismo algoritmo y
+clave, y validan los mismos claims registrados que python-jose (exp, nbf, iat,
+sub, jti, aud), así que cambiar de backend no invalida sesiones ni cambia qué
+tokens se aceptan.
+
+(PyJWT no se puede usar en este proyecto: el paquete local `jwt/` lo tapa.)
+
+Llavero: JWT_KEYS="kid1=valor1,kid2=valor2" y JWT_KID = kid con el que se
+firma (por defecto el primero). Para HS* el valor es el secreto; para EdDSA la
+ruta a un PEM (privado para la llave activa; público o privado para las que
+solo verifican). Los tokens se firman con `kid` en el header y se verifican con
+la llave de ese kid, así que rotar es: agregar la llave nueva, moverle JWT_KID
+y retirar la anterior cuando venzan sus tokens. SECRET_KEY sigue aceptándose
+para tokens sin `kid` (los emitidos antes de configurar el llavero).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def _b64(datos: bytes) -> bytes:
+    return base64.urlsafe_b64encode(datos).rstrip(b"=")
+
+
+def _deb64(datos: bytes) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(datos + b"=" * (-len(datos) % 4))
+    except Exception:
+        raise TokenInvalido("Segmento base64 inválido")
+
+
+def _json(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+def validar_claims(claims: dict, ahora: float | None = None):
+    """Mismas reglas que jose.jwt.decode con sus opciones por defecto (sin leeway ni audience)."""
+    ahora = time.time() if ahora is None else ahora
+    for nombre in ("exp", "nbf", "iat"):
+        if nombre in claims and not isinstance(claims[nombre], (int, float)):
+            raise TokenInvalido(f"'{nombre}' debe ser numérico")
+    if "exp" in claims and claims["exp"] < ahora:
+        raise TokenInvalido("Token vencido")
+    if "nbf" in claims and claims["nbf"] > ahora:
+        raise TokenInvalido("Token aún no válido")
+    for nombre in ("sub", "jti"):
+        if nombre in claims and not isinstance(claims[nombre], str):
+            raise TokenInvalido(f"'{nombre}' debe ser string")
+    if "aud" in claims:
+        raise TokenInvalido("Audience no esperada")
+
+
+# ---------- Algoritmos del backend nativo ----------
+
+class FirmaHMAC:
+    HASHES = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+    def __init__(self, algoritmo: str):
+        self.algoritmo = algoritmo
+        self._hash = self.HASHES[algoritmo]
+
+    def preparar(self, valor: str):
+        """(llave de firma, llave de verificación) a partir del valor configurado."""
+        clave = valor.encode() if isinstance(valor, str) else valor
+        return clave, clave
+
+    def firmar(self, clave, datos: bytes) -> bytes:
+        return hmac.new(clave, datos, self._hash).digest()
+
+    def verificar(self, clave, datos: bytes, firma: bytes) -> bool:
+        return hmac.compare_digest(hmac.new(clave, datos, self._hash).digest(), firma)
+
+
+class FirmaEdDSA:
+    def __init__(self, algoritmo: str = "EdDSA"):
+        try:
+            from cryptography.hazmat.primitives import serialization
+            from cryptography.exceptions import InvalidSignature
+        except ImportError:
+            raise RuntimeError("JWT_ALGORITHM=EdDSA requiere el paquete 'cryptography'")
+        self.algoritmo = algoritmo
+        self._serializacion = serialization
+        self._firma_invalida = InvalidSignature
+
+    def preparar(self, valor: str):
+        """`valor` es la ruta a un PEM Ed25519 (privado o público)."""
+        with open(valor, "rb") as f:
+            pem = f.read()
+        if b"PRIVATE KEY" in pem:
+            privada = self._serializacion.load_pem_private_key(pem, password=None)
+            return privada, privada.public_key()
+        return None, self._serializacion.load_pem_public_key(pem)
+
+    def firmar(self, clave, datos: bytes) -> bytes:
+        if clave is None:
+            raise RuntimeError("La llave activa de EdDSA debe ser privada")
+        return clave.sign(datos)
+
+    def verificar(self, clave, datos: bytes, firma: bytes) -> bool:
+        try:
+            clave.verify(firma, datos)
+            return True
+        except self._firma_invalida:
+            return False
+
+
+# ---------- Backends ----------
+
+class BackendNativo:
+    nombre = "nativo"
+
+    def __init__(self, algoritmo: str):
+        if algoritmo in FirmaHMAC.HASHES:
+            self._firma = FirmaHMAC(algoritmo)
+        elif algoritmo == "EdDSA":
+            self._firma = FirmaEdDSA(algoritmo)
+        else:
+            raise RuntimeError(f"El backend nativo no implementa {algoritmo}; use JWT_BACKEND=jose")
+        self.algoritmo = algoritmo
+        self._headers = {}
+
+    def preparar(self, valor):
+        return self._firma.preparar(valor)
+
+    def _header(self, kid) -> bytes:
+        # el header codificado es fijo por kid: se arma una sola vez
+        h = self._headers.get(kid)
+        if h is None:
+            header = {"alg": self.algoritmo, "typ": "JWT"}
+            if kid is not None:
+                header["kid"] = kid
+            h = self._headers[kid] = _b64(_json(header))
+        return h
+
+    def codificar(self, claims: dict, kid, llave) -> str:
+        datos = self._header(kid) + b"." + _b64(_json(claims))
+        return (datos + b"." + _b64(self._firma.firmar(llave, datos))).decode()
+
+    def decodificar(self, token: str, llavero: "Llavero") -> dict:
+        try:
+            crudo = token.encode("ascii")
+        except (UnicodeEncodeError, AttributeError):
+            raise TokenInvalido("Token no ASCII")
+        partes = crudo.split(b".")
+        if len(partes) != 3:
+            raise TokenInvalido("Token mal formado")
+        try:
+            header = json.loads(_deb64(partes[0]))
+        except ValueError:
+            raise TokenInvalido("Header inválido")
+        if not isinstance(header, dict) or header.get("alg") != self.algoritmo:
+            raise TokenInvalido("Algoritmo no permitido")
+        llave = llavero.para_verificar(header.get("kid"))
+        if not self._firma.verificar(llave, partes[0] + b"." + partes[1], _deb64(partes[2])):
+            raise TokenInvalido("Firma inválida")
+        try:
+            claims = json.loads(_deb64(partes[1]))
+        except ValueError:
+            raise TokenInvalido("Payload inválido")
+        if not isinstance(claims, dict):
+            raise TokenInvalido("Payload inválido")
+        validar_claims(claims)
+        return claims
+
+
+class BackendJose:
+    nombre = "jose"
+
+    def __init__(self, algoritmo: str):
+        from jose import jwt as jose_jwt, JWTError
+        self._jwt = jose_jwt
+        self._error = JWTError
+        self.algoritmo = algoritmo
+
+    def preparar(self, valor):
+        if self.algoritmo.startswith("HS"):
+            return valor, valor
+        with open(valor, "rb") as f:
+            pem = f.read().decode()
+        return pem, pem
+
+    def codificar(self, claims: dict, kid, llave) -> str:
+        headers = {"kid": kid} if kid is not None else None
+        return self._jwt.encode(claims, llave, algorithm=self.algoritmo, headers=headers)
+
+    def decodificar(self, token: str, llavero: "Llavero") -> dict:
+        try:
+            kid = self._jwt.get_unverified_header(token).get("kid")
+            return self._jwt.decode(token, llavero.para_verificar(kid), algorithms=[self.algoritmo])
+        except self._error as e:
+            raise TokenInvalido(str(e))
+
+
+BACKENDS = {"nativo": BackendNativo, "jose": BackendJose}
+
+
+# ---------- Llavero ----------
+
+def parsear_llaves(texto: str | None) -> dict:
+    """'kid1=valor1,kid2=valor2' -> {'kid1': 'valor1', 'kid2': 'valor2'} (orden preservado)."""
+    llaves = {}
+    for item in (texto or "").split(","):
+        kid, sep, valor = item.strip().partition("=")
+        if sep and kid.strip() and valor.strip():
+            llaves[kid.strip()] = valor.strip()
+    return llaves
+
+
+class Llavero:
+    def __init__(self, backend, llaves: dict, kid_activo: str | None = None, legado: str | None = None):
+        self.backend = backend
+        self._firma = {}
+        self._verifica = {}
+        for kid, valor in llaves.items():
+            self._firma[kid], self._verifica[kid] = backend.preparar(valor)
+        if legado and backend.algoritmo.startswith("HS"):
+            self._firma[None], self._verifica[None] = backend.preparar(legado)
+        if kid_activo is None and llaves:
+            kid_activo = next(iter(llaves))
+        if kid_activo not in self._firma:
+            raise RuntimeError(f"JWT_KID={kid_activo!r} no está en JWT_KEYS" if kid_activo else "Falta SECRET_KEY o JWT_KEYS")
+        self.kid_activo = kid_activo
+
+    def firmar(self, claims: dict) -> str:
+        return self.backend.codificar(claims, self.kid_activo, self._firma[self.kid_activo])
+
+    def para_verificar(self, kid):
+        if kid not in self._verifica:
+            raise TokenInvalido("kid desconocido")
+        return self._verifica[kid]
+
+    def verificar(self, token: str) -> dict:
+        return self.backend.decodificar(token, self)
+
+    def kids(self) -> list:
+        return [k for k in self._verifica if k is not None]
@@ -1,33 +1,114 @@
-from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, status, Depends
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from cache import CacheLRU
+from .firmas import BACKENDS, Llavero, TokenInvalido, parsear_llaves
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_BACKEND = os.getenv("JWT_BACKEND", "nativo")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# 0 = sin refresh tokens (solo access token, como antes)
+REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", "0"))
+
+# Backend y llaves (ver jwt/firmas.py). Se arman en el primer uso para que
+# importar este módulo no exija SECRET_KEY.
+_llavero = None
+_llavero_lock = threading.Lock()
+
+
+def obtener_llavero() -> Llavero:
+    global _llavero
+    if _llavero is None:
+        with _llavero_lock:
+            if _llavero is None:
+                backend = BACKENDS[JWT_BACKEND](ALGORITHM)
+                _llavero = Llavero(backend, parsear_llaves(os.getenv("JWT_KEYS")), os.getenv("JWT_KID") or None, SECRET_KEY)
+                print(f"[JWT] backend={backend.nombre} alg={ALGORITHM} kid={_llavero.kid_activo}")
+    return _llavero
+
+
+# Cache de tokens ya verificados (token -> claims). Cada entrada vence con el
+# token (exp) o a los JWT_CACHE_TTL segundos, lo que ocurra primero.
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", "300"))
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", "4096"))
+_tokens_verificados = CacheLRU(maxsize=JWT_CACHE_MAX, ttl=JWT_CACHE_TTL)
 
 # oauth2 helper for FastAPI dependencies (tokenUrl matches /login endpoint)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
-def crear_access_token(data: dict, expires_delta: timedelta = None):
+def _firmar(data: dict, expires_delta: timedelta) -> str:
     to_encode = data.copy()
-    # use timezone-aware UTC expiry
-    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # use timezone-aware UTC expiry (as a NumericDate, like jose does)
+    expire = datetime.now(timezone.utc) + expires_delta
+    to_encode.update({"exp": int(expire.timestamp())})
+    return obtener_llavero().firmar(to_encode)
+
+
+def crear_access_token(data: dict, expires_delta: timedelta = None):
+    return _firmar(data, expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def crear_refresh_token(sub, expires_delta: timedelta = None):
+    """Refresh token de larga duración: solo identifica al usuario (sub = id_usuario).
+
+    Los claims del access token se vuelven a leer de la BD al refrescar, así que
+    un cambio de rol o de UV se refleja en el siguiente access token.
+    """
+    return _firmar(
+        {"sub": str(sub), "typ": "refresh"},
+        expires_delta or timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES),
+    )
+
+
+def verificar_refresh_token(token: str):
+    """Claims del refresh token o None. No pasa por la cache: se usa una vez por renovación."""
+    try:
+        payload = obtener_llavero().verificar(token)
+    except TokenInvalido:
+        return None
+    return payload if payload.get("typ") == "refresh" else None
+
 
 def verificar_access_token(token: str):
+    hit, payload = _tokens_verificados.obtener(token)
+    if hit:
+        return dict(payload)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+        payload = obtener_llavero().verificar(token)
+    except TokenInvalido:
         # keep compatibility with existing callers that expect None on invalid token
         return None
+    if payload.get("typ") == "refresh":
+        # un refresh token no autoriza llamadas a la API
+        return None
+    exp = payload.get("exp")
+    ttl = JWT_CACHE_TTL if exp is None else min(JWT_CACHE_TTL, float(exp) - time.time())
+    if ttl > 0:
+        _tokens_verificados.guardar(token, dict(payload), ttl=ttl)
+    return payload
+
+
+def tokens_cache_stats() -> dict:
+    return _tokens_verificados.stats()
+
+
+def jwt_info() -> dict:
+    llavero = obtener_llavero()
+    return {
+        "backend": llavero.backend.nombre,
+        "algoritmo": ALGORITHM,
+        "kid_activo": llavero.kid_activo,
+        "kids": llavero.kids(),
+        "access_min": ACCESS_TOKEN_EXPIRE_MINUTES,
+        "refresh_min": REFRESH_TOKEN_EXPIRE_MINUTES,
+    }
 
 
 def Obtener_usuario_actual_JWT(token: str = Depends(oauth2_scheme)):
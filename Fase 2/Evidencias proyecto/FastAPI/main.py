@@ -1,11 +1,19 @@
 from typing import Optional
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, EmailStr, field_validator
-from conexion import conectar_db
+from conexion import conectar_db, get_cursor, pool_stats, abrir_sesion, cerrar_sesion, Error as ErrorDB
 from config import configurar_cors
+from conexion_async import get_cursor_async, cerrar_pool as cerrar_pool_async, pool_async_stats
+from esquema import cargar_esquema, esquema_info
+from migraciones import aplicar_migraciones, MIGRAR_AL_INICIAR
+from correo import CORREO_WORKER, iniciar_worker, detener_worker, estado_correos
+from biometria.motor import BIOMETRIA_HABILITADA, BIOMETRIA_PRECARGAR
+from biometria.pool import pool_biometrico
+from geometria import buscar_uv
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
 from endpoints import (
     endpointActividades,
     endpointAdministradores,
@@ -18,13 +26,16 @@ from endpoints import (
     endpointUV,  
 )
 from datetime import date
-from fastapi import Depends, Header
+from fastapi import Depends, Header, Response
+from endpoints.utils import Pagina, consulta_paginada, listar, listar_async, COLUMNAS_OCULTAS
+from exportacion import exportar, parametro_formato
+from jwt.deps import id_uv_de_payload, invalidar_usuario, auth_cache_stats, get_directiva
 from fastapi.routing import APIRoute
-import math, json
 
 # JWT utils (acepta nombres en español o inglés)
 try:
-    from jwt.jwt_utils import crear_access_token, verificar_access_token
+    from jwt.jwt_utils import crear_access_token, verificar_access_token, tokens_cache_stats
+    from jwt.jwt_utils import crear_refresh_token, verificar_refresh_token, jwt_info, REFRESH_TOKEN_EXPIRE_MINUTES
 except ImportError:
     from jwt.jwt_utils import create_access_token as crear_access_token, verify_token as verificar_access_token
 
@@ -32,6 +43,28 @@ except ImportError:
 app = FastAPI(title="API Junta de Vecinos")
 configurar_cors(app)
 
+
+@app.on_event("startup")
+def al_iniciar():
+    # en producción las migraciones son un paso del despliegue (python migraciones.py)
+    if MIGRAR_AL_INICIAR:
+        aplicar_migraciones()
+    # columnas por tabla en memoria (evita INFORMATION_SCHEMA por request)
+    cargar_esquema()
+    # bandeja de correos: con CORREO_WORKER=externo la envía `python correo.py`
+    if CORREO_WORKER == "app":
+        iniciar_worker()
+    # procesos biométricos con ArcFace + RetinaFace cargados y calentados antes del primer /biometria/verificar
+    if BIOMETRIA_HABILITADA and BIOMETRIA_PRECARGAR:
+        pool_biometrico.iniciar()
+
+
+@app.on_event("shutdown")
+async def al_detener():
+    detener_worker()
+    pool_biometrico.cerrar()
+    await cerrar_pool_async()
+
 # Middleware de logging simple para depurar CORS/errores
 @app.middleware("http")
 async def log_requests(request, call_next):
@@ -45,6 +78,25 @@ async def log_requests(request, call_next):
     print(f"[REQ] {method} {path} origin={origin} -> {response.status_code} acao={acao}")
     return response
 
+# Una conexión y una transacción por request, compartida por dependencias y handler.
+# El commit corre antes de devolver la respuesta: si falla, el cliente recibe 500.
+@app.middleware("http")
+async def sesion_db(request, call_next):
+    sesion, token = abrir_sesion()
+    try:
+        try:
+            response = await call_next(request)
+        except Exception:
+            await run_in_threadpool(sesion.finalizar, False)
+            raise
+        try:
+            await run_in_threadpool(sesion.finalizar, response.status_code < 400)
+        except ErrorDB:
+            return JSONResponse(status_code=500, content={"detail": "No se pudieron guardar los cambios"})
+        return response
+    finally:
+        cerrar_sesion(token)
+
 # =========================
 # Routers
 # =========================
@@ -53,7 +105,8 @@ app.include_router(endpointAdministradores.router)
 app.include_router(endpointNoticias.router)
 app.include_router(endpointProyectos.router)
 app.include_router(endpointReserva.router)
-app.include_router(endpointBiometria.router)
+if BIOMETRIA_HABILITADA:
+    app.include_router(endpointBiometria.router)
 app.include_router(endpointCertificados.router)
 app.include_router(endpointNotificaciones.router)
 app.include_router(endpointUV.router) 
@@ -69,62 +122,7 @@ def obtener_usuario_actual(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Token inválido")
     return payload
 
-# NUEVO: dependencia simple para extraer id_uv desde el JWT
-def get_admin_uv(authorization: str = Header(None)) -> int | None:
-    # Devuelve None si no hay token o es inválido, para que los endpoints puedan responder vacío en lugar de 401
-    if not authorization or not authorization.startswith("Bearer "):
-        return None
-    token = authorization.split(" ", 1)[1]
-    payload = verificar_access_token(token)
-    if not payload:
-        return None
-
-    # 1) si viene en el token, úsalo
-    uv_claim = payload.get("id_uv")
-    if uv_claim is not None:
-        try:
-            return int(uv_claim)
-        except Exception:
-            return None
-
-    # 2) fallback: consulta a la BD por el usuario (sub) y, si es necesario, por su vecino o rut
-    user_id = payload.get("sub")
-    if not user_id:
-        return None
-    db = conectar_db()
-    if db is None:
-        # sin id_uv y sin DB: no se puede derivar; devolver None para negar acceso a datos sensibles
-        return None
-    cur = db.cursor(dictionary=True)
-    try:
-        cur.execute("SELECT id_uv, id_vecino, rut FROM usuarios WHERE id_usuario = %s", (user_id,))
-        row = cur.fetchone() or {}
-        if row.get("id_uv") is not None:
-            return int(row["id_uv"])
-        # intenta por id_vecino
-        if row.get("id_vecino") is not None:
-            cur.execute("SELECT id_uv FROM vecinos WHERE id_vecino = %s", (row["id_vecino"],))
-            v = cur.fetchone()
-            if v and v.get("id_uv") is not None:
-                return int(v["id_uv"])
-        # intenta por rut (desde usuarios o token)
-        rut = row.get("rut") or payload.get("rut")
-        if rut:
-            cur.execute("SELECT id_uv FROM vecinos WHERE rut = %s LIMIT 1", (rut,))
-            v2 = cur.fetchone()
-            if v2 and v2.get("id_uv") is not None:
-                return int(v2["id_uv"])
-        # no hay id_uv: devolver None para que los endpoints puedan decidir (p. ej., 1=0)
-        return None
-    finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
-        try:
-            db.close()
-        except Exception:
-            pass
+# get_admin_uv (id_uv del token, con caché de resolución por usuario) vive en jwt.deps
 
 def validar_rut(rut: str) -> bool:
     rut = rut.replace('.', '').replace('-', '')
@@ -148,6 +146,32 @@ def validar_rut(rut: str) -> bool:
 def list_routes():
     return sorted([r.path for r in app.routes if isinstance(r, APIRoute)])
 
+# Diagnóstico: estado del pool de conexiones MySQL
+@app.get("/__pool")
+def pool_estado():
+    return {**pool_stats(), "async": pool_async_stats()}
+
+# Diagnóstico: caches de autorización (tokens verificados, usuarios y UV por usuario)
+@app.get("/__auth")
+def auth_estado():
+    return {"jwt": jwt_info(), "tokens": tokens_cache_stats(), **auth_cache_stats()}
+
+# Diagnóstico: bandeja de salida de correos y worker SMTP (incluye destinatarios: solo directiva)
+@app.get("/__correos")
+def correos_estado(usuario=Depends(get_directiva)):
+    return estado_correos()
+
+# Diagnóstico: columnas conocidas por el registro de esquema (y recarga manual)
+@app.get("/__esquema")
+def esquema():
+    return esquema_info()
+
+@app.post("/__esquema/refrescar")
+def refrescar_esquema(usuario=Depends(obtener_usuario_actual)):
+    if usuario.get("rol") != "admin":
+        raise HTTPException(status_code=403, detail="Solo el admin puede refrescar el esquema")
+    return {"ok": cargar_esquema(), **esquema_info()}
+
 # Diagnóstico: conteo rápido de tablas y por id_uv del token (si viene)
 @app.get("/__counts")
 def counts(authorization: str | None = Header(None)):
@@ -230,57 +254,12 @@ def counts(authorization: str | None = Header(None)):
 # =========================
 # Helpers geoespaciales para UV
 # =========================
-def haversine_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    p1, p2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlmb = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dlmb/2)**2
-    return 2 * R * math.asin(math.sqrt(a))
-
-def min_vertex_distance(gj_str, p_lat, p_lon):
-    try:
-        gjson = json.loads(gj_str or "{}")
-    except:
-        return float("inf")
-    t = gjson.get("type")
-    if t not in ("Polygon", "MultiPolygon"):
-        return float("inf")
-    dmin = float("inf")
-    if t == "Polygon":
-        for ring in gjson.get("coordinates", []):
-            for lonv, latv in ring:
-                dmin = min(dmin, haversine_m(p_lat, p_lon, latv, lonv))
-    else:
-        for poly in gjson.get("coordinates", []):
-            for ring in poly:
-                for lonv, latv in ring:
-                    dmin = min(dmin, haversine_m(p_lat, p_lon, latv, lonv))
-    return dmin
-
-def resolver_id_uv_por_punto(cursor, lat: float | None, lon: float | None) -> int | None:
+def resolver_id_uv_por_punto(lat: float | None, lon: float | None) -> int | None:
     if lat is None or lon is None:
         return None
-    wkt = f"POINT({lon} {lat})"
-    # 1) Dentro del polígono
-    cursor.execute("""
-        SELECT id_uv
-        FROM juntas_vecinos
-        WHERE ST_Contains(geom, ST_GeomFromText(%s, ST_SRID(geom)))
-        LIMIT 1
-    """, (wkt,))
-    row = cursor.fetchone()
-    if row:
-        return row["id_uv"]
-    # 2) Más cercana por vértices
-    cursor.execute("""SELECT id_uv, ST_AsGeoJSON(geom) AS gj FROM juntas_vecinos""")
-    polys = cursor.fetchall() or []
-    best_id, best_d = None, float("inf")
-    for r in polys:
-        d = min_vertex_distance(r["gj"], lat, lon)
-        if d < best_d:
-            best_d, best_id = d, r["id_uv"]
-    return best_id
+    # contención o UV más cercana, resuelto contra el índice espacial en memoria
+    uv = buscar_uv(lat, lon)
+    return uv["id_uv"] if uv else None
 
 
 
@@ -294,60 +273,11 @@ def _get_payload(authorization: str | None):
 @app.get("/me/id_uv")
 def me_id_uv(authorization: str | None = Header(None)):
     payload = _get_payload(authorization)
-    print(payload.get("id_uv"))
-
     if not payload:
         return {"id_uv": None}
+    # claim del token o resolución cacheada por usuario (usuarios -> vecinos)
+    return {"id_uv": id_uv_de_payload(payload)}
 
-    # 1) si viene directo en el token
-    if payload.get("id_uv") is not None:
-        try:
-            return {"id_uv": int(payload["id_uv"])}
-        except Exception:
-            pass
-
-    db = conectar_db()
-    if db is None:
-        return {"id_uv": None}
-    cur = db.cursor(dictionary=True)
-    try:
-        # 2) por sub (id_usuario) -> usuarios -> (id_uv o id_vecino) -> vecinos
-        sub = payload.get("sub")
-        if sub is not None:
-            cur.execute("SELECT id_uv, id_vecino FROM usuarios WHERE id_usuario=%s", (sub,))
-            u = cur.fetchone() or {}
-            if u.get("id_uv") is not None:
-                return {"id_uv": int(u["id_uv"])}
-            if u.get("id_vecino") is not None:
-                cur.execute("SELECT id_uv FROM vecinos WHERE id_vecino=%s", (u["id_vecino"],))
-                v = cur.fetchone()
-                if v and v.get("id_uv") is not None:
-                    return {"id_uv": int(v["id_uv"])}
-
-        # 3) por rut -> usuarios (mejor) -> vecinos; si no, directo a vecinos
-        rut = payload.get("rut")
-        if rut:
-            cur.execute("SELECT id_uv, id_vecino FROM usuarios WHERE rut=%s", (rut,))
-            u2 = cur.fetchone() or {}
-            if u2.get("id_uv") is not None:
-                return {"id_uv": int(u2["id_uv"])}
-            if u2.get("id_vecino") is not None:
-                cur.execute("SELECT id_uv FROM vecinos WHERE id_vecino=%s", (u2["id_vecino"],))
-                v2 = cur.fetchone()
-                if v2 and v2.get("id_uv") is not None:
-                    return {"id_uv": int(v2["id_uv"])}
-            # último intento: rut directo en vecinos
-            cur.execute("SELECT id_uv FROM vecinos WHERE rut=%s LIMIT 1", (rut,))
-            v3 = cur.fetchone()
-            if v3 and v3.get("id_uv") is not None:
-                return {"id_uv": int(v3["id_uv"])}
-
-        return {"id_uv": None}
-    finally:
-        try: cur.close()
-        except: pass
-        try: db.close()
-        except: pass
 # =========================
 # Modelos Pydantic
 # =========================
@@ -392,6 +322,10 @@ class LoginRequest(BaseModel):
     contrasena: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class RegistroIdentidad(BaseModel):
     # Se usa tras verificación biométrica en el frontend
     nombre: str
@@ -453,7 +387,7 @@ def crear_vecino(vecino: Vecino):
             raise HTTPException(status_code=409, detail="El RUT ya está registrado como vecino.")
 
         # Resolver UV a partir de lat/lon (si vienen)
-        id_uv = resolver_id_uv_por_punto(cursor, vecino.lat, vecino.lon)  # <-- agregado
+        id_uv = resolver_id_uv_por_punto(vecino.lat, vecino.lon)  # <-- agregado
 
         # Insertar vecino (incluye fecha_nacimiento e id_uv)
         sql_vecino = """
@@ -473,7 +407,6 @@ def crear_vecino(vecino: Vecino):
                 vecino.fecha_nacimiento,
                 id_uv  # <-- agregado
             ))
-            db.commit()
         except Exception as e:
             # Detectar columna faltante en tablas MySQL y crearla automáticamente en entorno dev
             msg = str(e)
@@ -482,6 +415,7 @@ def crear_vecino(vecino: Vecino):
                     print("[DB] columna 'fecha_nacimiento' ausente: intentando agregar columna a 'vecinos'.")
                     cursor.execute("ALTER TABLE vecinos ADD COLUMN fecha_nacimiento INT NULL;")
                     db.commit()
+                    cargar_esquema()
                     # reintentar inserción
                     cursor.execute(sql_vecino, (
                         vecino.nombre,
@@ -495,7 +429,6 @@ def crear_vecino(vecino: Vecino):
                         vecino.fecha_nacimiento,
                         id_uv
                     ))
-                    db.commit()
                 except Exception as e2:
                     print("[DB] fallo al intentar crear columna fecha_nacimiento o reinsertar:", e2)
                     raise HTTPException(status_code=500, detail="Error en la base de datos (crear fecha_nacimiento).")
@@ -521,8 +454,11 @@ def crear_vecino(vecino: Vecino):
             vecino.rut,
             id_uv  # <-- agregado
         ))
+        # vecino + usuario en una sola transacción: un 409 aquí no deja vecinos huérfanos
         db.commit()
         id_usuario = cursor.lastrowid
+        # por si quedó cacheado un "usuario no encontrado" con ese id
+        invalidar_usuario(id_usuario=id_usuario, id_vecino=id_vecino, rut=vecino.rut)
 
         # Traer datos del usuario recién creado (incluye id_uv)
         cursor.execute(
@@ -547,50 +483,34 @@ def crear_vecino(vecino: Vecino):
         db.close()
 
 @app.get("/vecinos/")
-def obtener_todos_vecinos():
-    db = conectar_db()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM vecinos")
-    vecinos = cursor.fetchall()
-    cursor.close()
-    db.close()
-    return vecinos
+def obtener_todos_vecinos(response: Response, pagina: Pagina = Depends(), cursor=Depends(get_cursor)):
+    consulta = consulta_paginada("vecinos", "FROM vecinos t", [], (), pagina)
+    return listar(cursor, "vecinos", consulta, pagina, response)
 
 
 
 @app.get("/vecinos/uv/{id_uv}", tags=["CRUD vecinos"])
-def obtener_vecinos_por_uv(id_uv: int):
-    db = conectar_db()
-    if db is None:
-        return []
-    cur = db.cursor(dictionary=True)
+async def obtener_vecinos_por_uv(id_uv: int, response: Response, pagina: Pagina = Depends(), cur=Depends(get_cursor_async)):
+    consulta = consulta_paginada("vecinos", "FROM vecinos t", ["t.id_uv = %s"], (id_uv,), pagina)
+    rows = await listar_async(cur, "vecinos", consulta, pagina, response)
     try:
-        cur.execute("SELECT * FROM vecinos WHERE id_uv = %s", (id_uv,))
-        rows = cur.fetchall() or []
-        try:
-            print(f"[VECINOS_BY_UV] id_uv={id_uv} count={len(rows)}")
-        except Exception:
-            pass
-        return rows
-    finally:
-        try:
-            cur.close()
-        except Exception:
-            pass
-        try:
-            db.close()
-        except Exception:
-            pass
+        print(f"[VECINOS_BY_UV] id_uv={id_uv} count={len(rows)}")
+    except Exception:
+        pass
+    return rows
+
+
+@app.get("/vecinos/uv/{id_uv}/export", tags=["CRUD vecinos"])
+async def exportar_vecinos_por_uv(id_uv: int, formato: str = Depends(parametro_formato), usuario=Depends(get_directiva)):
+    """Padrón completo de la UV en streaming (NDJSON, CSV o JSON), sin contraseñas."""
+    consulta = consulta_paginada("vecinos", "FROM vecinos t", ["t.id_uv = %s"], (id_uv,))
+    return await exportar(consulta, formato, f"vecinos_uv{id_uv}", ocultas=COLUMNAS_OCULTAS)
 
 
 @app.get("/vecinos/{id_vecino}", tags=["CRUD vecinos"])
-def obtener_vecino(id_vecino: int):
-    db = conectar_db()
-    cursor = db.cursor(dictionary=True)
+def obtener_vecino(id_vecino: int, cursor=Depends(get_cursor)):
     cursor.execute("SELECT * FROM vecinos WHERE id_vecino = %s", (id_vecino,))
     vecino = cursor.fetchone()
-    cursor.close()
-    db.close()
     if vecino:
         return vecino
     else:
@@ -609,6 +529,9 @@ def actualizar_vecino(
     db = conectar_db()
     cursor = db.cursor(dictionary=True)
     campos = vecino.model_dump(exclude_unset=True)
+    # los listados no devuelven contrasena: el formulario de edición la reenvía vacía
+    if not campos.get("contrasena"):
+        campos.pop("contrasena", None)
     if not campos:
         raise HTTPException(status_code=400, detail="No se enviaron datos para actualizar")
     set_clause = ", ".join([f"{k}=%s" for k in campos.keys()])
@@ -616,8 +539,11 @@ def actualizar_vecino(
     try:
         cursor.execute(sql, (*campos.values(), id_vecino))
         db.commit()
+        invalidar_usuario(id_vecino=id_vecino, rut=campos.get("rut"))
         cursor.execute("SELECT * FROM vecinos WHERE id_vecino=%s", (id_vecino,))
         vecino_actualizado = cursor.fetchone()
+        if vecino_actualizado:
+            vecino_actualizado.pop("contrasena", None)
         return vecino_actualizado
     except Exception as e:
         db.rollback()
@@ -633,6 +559,7 @@ def eliminar_vecino(id_vecino: int):
     try:
         cursor.execute("DELETE FROM vecinos WHERE id_vecino=%s", (id_vecino,))
         db.commit()
+        invalidar_usuario(id_vecino=id_vecino)
         return {"mensaje": "Vecino eliminado exitosamente"}
     except Exception as e:
         db.rollback()
@@ -643,6 +570,31 @@ def eliminar_vecino(id_vecino: int):
 
 
 # ---------- Login (incluye id_vecino en el token) ----------
+def _respuesta_login(usuario: dict) -> dict:
+    # Incluye id_usuario como sub, rol/rut e id_uv en el token (útil para filtrado en frontend).
+    # sub va como texto (lo exigen ambos backends JWT) y es el id_usuario, como en el refresh token.
+    token = crear_access_token({
+        "sub": str(usuario["id_usuario"]),
+        "rol": usuario["rol"],
+        "rut": usuario["rut"],
+        "id_uv": usuario.get("id_uv")
+
+    })
+    respuesta = {
+        "access_token": token,
+        "token_type": "bearer",
+        "id_usuario": usuario["id_usuario"],
+        "id_vecino": usuario.get("id_vecino"),
+        "id_uv": usuario.get("id_uv"),
+        "rol": usuario["rol"],
+        "rut": usuario["rut"],
+        "nombre": usuario["nombre"]
+    }
+    if REFRESH_TOKEN_EXPIRE_MINUTES > 0:
+        respuesta["refresh_token"] = crear_refresh_token(usuario["id_usuario"])
+    return respuesta
+
+
 @app.post("/login/", tags=["login"])
 def login(request: LoginRequest):
     db = conectar_db()
@@ -654,24 +606,7 @@ def login(request: LoginRequest):
         )
         usuario = cursor.fetchone()
         if usuario:
-            # Incluye id_usuario como sub, rol/rut e id_uv en el token (útil para filtrado en frontend)
-            token = crear_access_token({
-                "sub": usuario.get("id_vecino"),
-                "rol": usuario["rol"],
-                "rut": usuario["rut"],
-                "id_uv": usuario.get("id_uv")
-
-            })
-            return {
-                "access_token": token,
-                "token_type": "bearer",
-                "id_usuario": usuario["id_usuario"],
-                "id_vecino": usuario.get("id_vecino"),
-                "id_uv": usuario.get("id_uv"),
-                "rol": usuario["rol"],
-                "rut": usuario["rut"],
-                "nombre": usuario["nombre"]
-            }
+            return _respuesta_login(usuario)
         else:
             raise HTTPException(status_code=401, detail="Credenciales incorrectas")
     finally:
@@ -679,6 +614,28 @@ def login(request: LoginRequest):
         db.close()
 
 
+# Renueva el access token (y rota el refresh token) sin pedir credenciales.
+# Solo disponible con REFRESH_TOKEN_EXPIRE_MINUTES > 0.
+@app.post("/token/refresh", tags=["login"])
+def refrescar_token(request: RefreshRequest):
+    if REFRESH_TOKEN_EXPIRE_MINUTES <= 0:
+        raise HTTPException(status_code=404, detail="Refresh tokens deshabilitados")
+    payload = verificar_refresh_token(request.refresh_token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Refresh token inválido o vencido")
+    db = conectar_db()
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM usuarios WHERE id_usuario = %s", (payload["sub"],))
+        usuario = cursor.fetchone()
+        if not usuario:
+            raise HTTPException(status_code=401, detail="Usuario no encontrado")
+        return _respuesta_login(usuario)
+    finally:
+        cursor.close()
+        db.close()
+
+
 # ---------- Registro final (tras biometría) ----------
 # Si tu frontend ya hace la verificación biométrica, aquí solo se persiste vecino+usuario.
 @app.post("/registro/identidad", tags=["Registro"])
@@ -728,6 +685,7 @@ def registro_identidad(data: RegistroIdentidad):
         id_usuario = cursor.lastrowid
 
         db.commit()
+        invalidar_usuario(id_usuario=id_usuario, id_vecino=id_vecino, rut=data.rut)
 
         # Devolver payload útil para auto login si quieres
         cursor.execute(
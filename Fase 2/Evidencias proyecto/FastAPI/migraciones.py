@@ -0,0 +1,180 @@
+"""Migraciones idempotentes de bd_sut: índices y columnas que el código asume.
+
+Cada migración revisa INFORMATION_SCHEMA antes de aplicarse. Se aplican como
+paso del despliegue, una vez y antes de levantar los workers de uvicorn:
+
+    python migraciones.py            # aplica las pendientes
+    python migraciones.py --dry-run  # solo muestra el SQL pendiente
+
+Algunas son DDL pesado sobre tablas en uso (ADD COLUMN, índices UNIQUE), por
+eso la API no las corre al arrancar salvo con MIGRAR_AL_INICIAR=1 (desarrollo).
+En ambos casos se toma GET_LOCK('migraciones'): si varios procesos las corren a
+la vez, solo uno las aplica y los demás esperan y encuentran todo hecho.
+
+Un índice se considera presente si ya existe uno con el mismo nombre o con las
+mismas columnas iniciales (p. ej. creado a mano con otro nombre), para no
+duplicarlos.
+"""
+import argparse
+import os
+
+from conexion import conectar_db
+from correo import DDL_CORREOS_SALIDA, DDL_ENVIOS_MASIVOS
+from biometria.embeddings import DDL_EMBEDDINGS_FACIALES
+
+MIGRAR_AL_INICIAR = os.getenv("MIGRAR_AL_INICIAR", "0") == "1"
+MIGRACIONES_ESPERA_SEG = int(os.getenv("MIGRACIONES_ESPERA_SEG", "300"))
+
+
+class Indice:
+    def __init__(self, tabla: str, nombre: str, columnas: tuple, unico: bool = False):
+        self.tabla = tabla
+        self.nombre = nombre
+        self.columnas = tuple(columnas)
+        self.unico = unico
+
+    def pendiente(self, cur) -> bool:
+        cur.execute(
+            "SELECT INDEX_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+            (self.tabla,),
+        )
+        indices: dict[str, list] = {}
+        for nombre, columna in cur.fetchall():
+            indices.setdefault(nombre, []).append(columna)
+        if not indices:
+            raise LookupError(f"la tabla {self.tabla} no existe")
+        if self.nombre in indices:
+            return False
+        n = len(self.columnas)
+        # con unico=True solo sirve un índice UNIQUE con exactamente esas columnas; se crea igual
+        return self.unico or not any(tuple(cols[:n]) == self.columnas for cols in indices.values())
+
+    def sentencias(self) -> list:
+        cols = ", ".join(f"`{c}`" for c in self.columnas)
+        tipo = "UNIQUE INDEX" if self.unico else "INDEX"
+        return [f"CREATE {tipo} `{self.nombre}` ON `{self.tabla}` ({cols})"]
+
+
+class Columna:
+    def __init__(self, tabla: str, nombre: str, definicion: str):
+        self.tabla = tabla
+        self.nombre = nombre
+        self.definicion = definicion
+
+    def pendiente(self, cur) -> bool:
+        cur.execute(
+            "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (self.tabla,),
+        )
+        cols = {fila[0] for fila in cur.fetchall()}
+        if not cols:
+            raise LookupError(f"la tabla {self.tabla} no existe")
+        return self.nombre not in cols
+
+    def sentencias(self) -> list:
+        return [f"ALTER TABLE `{self.tabla}` ADD COLUMN `{self.nombre}` {self.definicion}"]
+
+
+class Tabla:
+    def __init__(self, nombre: str, ddl: str):
+        self.nombre = nombre
+        self.ddl = ddl
+
+    def pendiente(self, cur) -> bool:
+        cur.execute(
+            "SELECT 1 FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (self.nombre,),
+        )
+        return not cur.fetchall()
+
+    def sentencias(self) -> list:
+        return [" ".join(self.ddl.split())]
+
+
+MIGRACIONES = [
+    # bandeja de salida de correos (correo.py)
+    Tabla("correos_salida", DDL_CORREOS_SALIDA),
+    # envíos masivos de /notificaciones/Notificar: trabajo + estado por destinatario en correos_salida
+    Tabla("envios_masivos", DDL_ENVIOS_MASIVOS),
+    Columna("correos_salida", "id_envio", "bigint DEFAULT NULL"),
+    Indice("correos_salida", "idx_correos_envio_estado", ("id_envio", "estado")),
+    # cupo por minuto entre procesos (correo._cupo_minuto)
+    Indice("correos_salida", "idx_correos_enviado_en", ("enviado_en",)),
+    # embeddings ArcFace por RUT para 1:N y re-verificación (biometria/embeddings.py)
+    Tabla("embeddings_faciales", DDL_EMBEDDINGS_FACIALES),
+    # crear_reserva: conflicto por sector y día (rango sobre fecha_inicio)
+    Indice("reservas", "idx_reservas_sector_fecha", ("nombreSector", "fecha_inicio")),
+    # crear_reserva: reservas activas del vecino (COUNT cubierto por el índice)
+    Indice("reservas", "idx_reservas_vecino_estado", ("id_vecino", "estado")),
+    # disponibilidad.reservar: un sector por día garantizado por la BD. Falla (y se
+    # informa) si ya hay duplicados; la transacción con bloqueos sigue aplicando la regla.
+    Columna("reservas", "dia", "DATE GENERATED ALWAYS AS (CAST(`fecha_inicio` AS DATE)) VIRTUAL"),
+    Indice("reservas", "uq_reservas_sector_dia", ("nombreSector", "dia"), unico=True),
+    # listados por UV paginados por fecha (endpoints.utils.consulta_paginada)
+    Indice("reservas", "idx_reservas_uv_fecha", ("id_uv", "fecha_inicio")),
+    Indice("noticias", "idx_noticias_uv_fecha", ("id_uv", "fecha_publicacion")),
+    Indice("proyectos", "idx_proyectos_uv_fecha", ("id_uv", "fecha_postulacion")),
+    Indice("certificados", "idx_certificados_uv_fecha", ("id_uv", "fecha_solicitud")),
+    Indice("notificaciones", "idx_notificaciones_uv_fecha", ("id_uv", "fecha_envio")),
+    Indice("actividades", "idx_actividades_uv_fecha", ("id_uv", "fecha_inicio")),
+    # conteo de inscritos por actividad y /actividades/{id}/enrolados (la UNIQUE existente empieza por usuario_id)
+    Indice("usuarios_en_actividades", "idx_uea_actividad_usuario", ("actividad_id", "usuario_id")),
+]
+
+
+def aplicar_migraciones(dry_run: bool = False) -> list:
+    """Aplica las migraciones pendientes. Devuelve las sentencias ejecutadas (o por ejecutar con dry_run)."""
+    db = conectar_db()
+    if db is None:
+        print("[MIGRACIONES] sin conexión a la BD")
+        return []
+    cur = db.cursor()
+    hechas = []
+    bloqueado = False
+    try:
+        # un solo proceso a la vez (varios workers arrancando o despliegues superpuestos)
+        cur.execute("SELECT GET_LOCK('migraciones', %s)", (MIGRACIONES_ESPERA_SEG,))
+        bloqueado = (cur.fetchone() or (None,))[0] == 1
+        if not bloqueado:
+            print(f"[MIGRACIONES] otro proceso las aplica hace más de {MIGRACIONES_ESPERA_SEG}s; se omiten")
+            return []
+        for m in MIGRACIONES:
+            try:
+                if not m.pendiente(cur):
+                    continue
+                for sql in m.sentencias():
+                    print(f"[MIGRACIONES] {'(dry-run) ' if dry_run else ''}{sql}")
+                    if not dry_run:
+                        cur.execute(sql)
+                    hechas.append(sql)
+            except LookupError as e:
+                print(f"[MIGRACIONES] se omite {m.nombre}: {e}")
+            except Exception as e:
+                print(f"[MIGRACIONES] error en {m.nombre}: {e}")
+    except Exception as e:
+        print(f"[MIGRACIONES] no se pudo tomar el bloqueo: {e}")
+    finally:
+        if bloqueado:
+            try:
+                cur.execute("SELECT RELEASE_LOCK('migraciones')")
+                cur.fetchall()
+            except Exception:
+                pass
+        try:
+            cur.close()
+        except Exception:
+            pass
+        try:
+            db.close()
+        except Exception:
+            pass
+    return hechas
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Aplica las migraciones pendientes de bd_sut")
+    ap.add_argument("--dry-run", action="store_true", help="solo muestra el SQL pendiente")
+    args = ap.parse_args()
+    hechas = aplicar_migraciones(dry_run=args.dry_run)
+    print(f"{len(hechas)} sentencia(s) {'pendientes' if args.dry_run else 'aplicadas'}")
@@ -46,6 +46,7 @@ class Actividad(BaseModel):
     razon_rechazo: Optional[str] = None  
     ubicacion: Optional[str] = None
     usuarios_enrolados: List[int] = []
+    enrolados: Optional[int] = None
 
 
 # --------------------
@@ -0,0 +1,66 @@
+import sys
+import os
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from endpoints import endpointUV
+
+
+def _uv(lat, lon):
+    return {"id_uv": 7 if lat < -33.5 else 8, "inside": True, "dist_m": 0.0}
+
+
+def _geocode(direccion, comuna, pais, timeout_ms=12000):
+    if direccion == "no existe":
+        return None
+    if direccion == "explota":
+        raise RuntimeError("proveedor caído")
+    return {"lat": -33.51, "lon": -70.77, "display_name": direccion, "source": "stub"}
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(endpointUV, "geocode_best", _geocode)
+    monkeypatch.setattr(endpointUV, "buscar_uv", _uv)
+    monkeypatch.setattr(endpointUV, "indice_uv", lambda: None)
+    app = FastAPI()
+    app.include_router(endpointUV.router)
+    return TestClient(app)
+
+
+def _lineas(r):
+    return sorted((json.loads(l) for l in r.text.splitlines() if l), key=lambda f: f["i"])
+
+
+def test_lote_responde_una_linea_ndjson_por_fila(cliente):
+    r = cliente.post("/uv/assign/batch", json={"filas": [
+        {"ref": "a", "direccion": "Pajaritos 1"},
+        {"ref": "b", "direccion": "no existe"},
+        {"ref": "c", "lat": -33.40, "lon": -70.70},
+    ]})
+    assert r.status_code == 200 and r.headers["content-type"].startswith("application/x-ndjson")
+    a, b, c = _lineas(r)
+    assert (a["i"], a["ref"], a["ok"], a["uv"]["id_uv"]) == (0, "a", True, 7)
+    assert a["geocoding"]["source"] == "stub"
+    assert (b["ok"], b["error"]) == (False, "Dirección no encontrada")
+    assert c["ok"] and c["geocoding"] is None and c["uv"]["id_uv"] == 8
+
+
+def test_error_de_una_fila_no_corta_el_lote(cliente):
+    r = cliente.post("/uv/assign/batch", json={"filas": [
+        {"direccion": "explota"}, {"direccion": "Pajaritos 1"},
+    ]})
+    malo, bueno = _lineas(r)
+    assert malo == {"i": 0, "ref": None, "ok": False, "error": "proveedor caído"}
+    assert bueno["ok"]
+
+
+def test_lote_respeta_uv_batch_max_y_valida_filas(cliente, monkeypatch):
+    monkeypatch.setattr(endpointUV, "UV_BATCH_MAX", 2)
+    r = cliente.post("/uv/assign/batch", json={"filas": [{"direccion": "x"}] * 3})
+    assert r.status_code == 413
+    assert cliente.post("/uv/assign/batch", json={"filas": [{"ref": "sin datos"}]}).status_code == 422
+    r = cliente.post("/uv/assign/batch", json={"filas": []})
+    assert r.status_code == 200 and r.text == ""
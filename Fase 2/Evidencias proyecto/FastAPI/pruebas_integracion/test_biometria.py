@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import threading
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+import numpy as np
+from biometria import motor as motor_mod
+from biometria import pool as pool_mod
+
+
+class DeepFaceFalso:
+    def __init__(self):
+        self.llamadas = []
+
+    def build_model(self, model_name, task):
+        self.llamadas.append(("build", model_name))
+
+    def verify(self, img1_path, img2_path, **kwargs):
+        self.llamadas.append(("verify", img1_path.shape, kwargs["enforce_detection"]))
+        return {"distance": 0.3, "threshold": 0.6}
+
+    def represent(self, img_path, **kwargs):
+        self.llamadas.append(("represent", img_path.shape, kwargs["enforce_detection"]))
+        # carnet (60x40): foto principal y foto fantasma; selfie: un rostro
+        if img_path.shape[:2] == (60, 40):
+            return [{"embedding": [0.0, 1.0], "facial_area": {"w": 5, "h": 5}},
+                    {"embedding": [1.0, 0.2], "facial_area": {"w": 30, "h": 30}}]
+        return [{"embedding": [1.0, 0.0], "facial_area": {"w": 40, "h": 40}}]
+
+
+def _jpg(alto=60, ancho=40):
+    return cv2.imencode(".jpg", np.zeros((alto, ancho, 3), np.uint8))[1].tobytes()
+
+
+def test_motor_carga_y_calienta_una_vez_y_verifica_desde_memoria(monkeypatch):
+    falso = DeepFaceFalso()
+    monkeypatch.setattr(motor_mod, "DeepFace", falso)
+    motor = motor_mod.MotorBiometrico()
+    assert not motor.listo()
+
+    motor.cargar()
+    motor.cargar()
+    assert motor.listo() and [l[0] for l in falso.llamadas] == ["build", "build", "verify", "represent"]
+    assert falso.llamadas[2][2] is False and motor.umbral == 0.6  # calentamiento sin exigir rostro
+
+    r = motor.verificar(_jpg(), _jpg(80, 50))
+    # menor distancia entre los rostros del carnet y la selfie
+    assert r["match"] and r["distance"] == pytest.approx(1 - 1 / np.hypot(1, 0.2))
+    assert list(r["embedding"]) == [1.0, 0.0]
+    assert ("represent", (60, 40, 3), True) in falso.llamadas
+    assert len([l for l in falso.llamadas if l[0] == "build"]) == 2
+
+    r = motor.comparar(_jpg(80, 50), np.array([0.0, 1.0], np.float32))
+    assert not r["match"] and r["distance"] == pytest.approx(1.0)
+
+    with pytest.raises(motor_mod.ImagenInvalida):
+        motor.verificar(b"no es imagen", _jpg())
+
+
+def test_pool_rechaza_con_429_al_llenarse_y_corta_por_timeout(monkeypatch):
+    liberar = threading.Event()
+    monkeypatch.setattr(pool_mod, "_iniciar_trabajador", lambda: None)
+    monkeypatch.setattr(pool_mod, "_verificar_trabajador", lambda a, b: liberar.wait(5) and {"match": True})
+    pool = pool_mod.PoolBiometrico(procesos=0, cola_max=2, timeout=0.2)
+
+    async def escenario():
+        lentos = [asyncio.ensure_future(pool.verificar(b"a", b"b")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(pool_mod.Saturado) as e:
+            await pool.verificar(b"a", b"b")
+        assert e.value.reintentar_en >= 1
+        for t in lentos:
+            with pytest.raises(pool_mod.TiempoAgotado):
+                await t
+        # el que esperaba en cola se cancela; el que corre conserva su cupo hasta terminar
+        assert pool.info()["en_curso"] == 1
+        liberar.set()
+        await asyncio.sleep(0.1)
+        assert await pool.verificar(b"a", b"b") == {"match": True}
+
+    asyncio.run(escenario())
+    pool.cerrar()
+    assert pool.info()["rechazados"] == 1 and pool.info()["timeouts"] == 2 and pool.info()["en_curso"] == 0
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("SECRET_KEY", "clave-de-prueba")
+import jwt.deps as deps
+from jwt.jwt_utils import crear_access_token
+
+consultas = []
+
+
+class CursorFalso:
+    def execute(self, sql, params):
+        consultas.append(sql)
+        self.sql = sql
+
+    def fetchone(self):
+        if "FROM usuarios" in self.sql:
+            return {"id_usuario": 7, "id_uv": None, "id_vecino": 3, "rut": "1-9"}
+        return {"id_uv": 5}
+
+    def close(self):
+        pass
+
+
+class DBFalsa:
+    def cursor(self, **kwargs):
+        return CursorFalso()
+
+    def close(self):
+        pass
+
+
+def test_uv_resuelta_se_cachea_hasta_invalidar(monkeypatch):
+    monkeypatch.setattr(deps, "conectar_db", lambda: DBFalsa())
+    consultas.clear()
+    token = crear_access_token({"sub": "7", "rol": "admin", "id_uv": None})
+    auth = "Bearer " + token
+
+    assert [deps.get_admin_uv(auth) for _ in range(3)] == [5, 5, 5]
+    assert len(consultas) == 2  # usuarios -> vecinos, solo la primera vez
+
+    deps.invalidar_usuario(id_vecino=3)
+    assert deps.get_admin_uv(auth) == 5
+    assert len(consultas) == 4
+
+
+def test_claim_id_uv_no_consulta_bd(monkeypatch):
+    monkeypatch.setattr(deps, "conectar_db", lambda: None)
+    token = crear_access_token({"sub": "8", "id_uv": 2})
+    assert deps.get_admin_uv("Bearer " + token) == 2
+
+
+def test_token_de_login_pasa_get_current_user(monkeypatch):
+    import main
+    monkeypatch.setattr(deps, "conectar_db", lambda: DBFalsa())
+    usuario = {"id_usuario": 7, "id_vecino": 3, "id_uv": 5, "rol": "secretario", "rut": "1-9", "nombre": "Ana"}
+    respuesta = main._respuesta_login(usuario)
+    actual = deps.get_current_user(respuesta["access_token"])
+    assert actual["id_usuario"] == 7 and actual["rol_from_token"] == "secretario"
+
+
+def test_sub_sin_usuario_resuelve_uv_por_rut(monkeypatch):
+    respuestas = {
+        "FROM usuarios WHERE id_usuario": None,  # sub que no es un id_usuario
+        "FROM usuarios WHERE rut": {"id_usuario": 9, "id_uv": None, "id_vecino": 4},
+        "FROM vecinos WHERE id_vecino": {"id_uv": 6},
+    }
+
+    class Cursor(CursorFalso):
+        def fetchone(self):
+            return next(v for k, v in respuestas.items() if k in self.sql)
+
+    class BD(DBFalsa):
+        def cursor(self, **kwargs):
+            return Cursor()
+
+    monkeypatch.setattr(deps, "conectar_db", lambda: BD())
+    token = crear_access_token({"sub": "77", "rut": "2-7"})
+    assert deps.get_admin_uv("Bearer " + token) == 6
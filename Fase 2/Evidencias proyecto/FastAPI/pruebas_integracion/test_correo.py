@@ -0,0 +1,172 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import socket
+import threading
+import time
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+import correo
+
+
+class Buzon:
+    """Servidor SMTP local: rechaza con 550 los destinatarios 'rechazado@' y con 451 los 'lleno@'."""
+
+    def __init__(self):
+        self.recibidos = []
+        self.sesiones = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rechazado@"):
+            return "550 5.1.1 Usuario desconocido"
+        if address.startswith("lleno@"):
+            return "451 4.2.2 Buzón lleno"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recibidos.append(envelope)
+        self.sesiones.add(id(session))
+        return "250 OK"
+
+
+def _autenticar(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == b"junta" and auth_data.password == b"clave")
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_local():
+    buzon = Buzon()
+    puerto = _puerto_libre()
+    ctl = Controller(buzon, hostname="127.0.0.1", port=puerto, authenticator=_autenticar, auth_require_tls=False)
+    ctl.start()
+    yield buzon, puerto
+    ctl.stop()
+
+
+class CursorFalso:
+    def __init__(self, filas):
+        self.filas = filas
+        self.sql = []
+        self.lastrowid = 9
+        self.en_el_minuto = 0
+
+    def execute(self, sql, params=None):
+        self.sql.append((" ".join(sql.split()), params))
+
+    def fetchone(self):
+        sql = self.sql[-1][0] if self.sql else ""
+        if "GET_LOCK" in sql:
+            return {"ok": 1}
+        if "AS n" in sql:
+            return {"n": self.en_el_minuto}
+        return self.filas[0] if self.filas else None
+
+    def fetchall(self):
+        return self.filas
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def __init__(self, filas):
+        self.cur = CursorFalso(filas)
+
+    def cursor(self, **kwargs):
+        return self.cur
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _fila(id_correo, destinatario, intentos=0):
+    return {"id_correo": id_correo, "destinatario": destinatario, "asunto": "Aviso", "cuerpo": "Hola",
+            "adjunto_nombre": None, "adjunto": None, "intentos": intentos}
+
+
+def test_envia_lotes_por_una_sola_conexion_autenticada(smtp_local):
+    buzon, puerto = smtp_local
+    enviador = correo.EnviadorSMTP("127.0.0.1", puerto, "plano", "junta", "clave", timeout=5, idle_seg=60)
+    for i in range(3):
+        enviador.enviar(correo.construir_mensaje({**_fila(i, f"vecino{i}@example.com"), "adjunto": b"%PDF-1.3", "adjunto_nombre": "c.pdf"},
+                                                 remitente="junta@example.com"))
+    enviador.cerrar()
+    assert len(buzon.recibidos) == 3 and len(buzon.sesiones) == 1
+    assert enviador.conexiones == 1 and enviador.enviados == 3
+    assert b"c.pdf" in buzon.recibidos[0].original_content
+
+
+def test_procesar_lote_marca_enviados_reintentos_y_fallidos(smtp_local, monkeypatch):
+    buzon, puerto = smtp_local
+    conn = ConexionFalsa([_fila(1, "a@example.com"), _fila(2, "rechazado@example.com"), _fila(3, "lleno@example.com", intentos=1)])
+    monkeypatch.setattr(correo, "conectar_db", lambda: conn)
+    enviador = correo.EnviadorSMTP("127.0.0.1", puerto, "plano", "junta", "clave", timeout=5)
+    assert correo.procesar_lote(enviador, correo.Limitador(0)) == 3
+    enviador.cerrar()
+
+    assert len(buzon.recibidos) == 1 and enviador.conexiones == 1
+    sql = [s for s, _ in conn.cur.sql]
+    assert "GET_LOCK" in sql[0] and sql.index([s for s in sql if "RELEASE_LOCK" in s][0]) == 4
+    reclamo = conn.cur.sql[3]
+    assert reclamo[0].startswith("UPDATE correos_salida SET estado = 'enviando'") and reclamo[1][1:] == (1, 2, 3)
+    marcas = {p[-1]: (sql.split("estado = ")[1][:11], p) for sql, p in conn.cur.sql[5:]}
+    assert marcas[1][0].startswith("'enviado'")
+    assert marcas[2][1][0] == "fallido" and "550" in marcas[2][1][2]
+    # tercer intento (intentos=1 + el reclamo): backoff base * 2^1
+    assert marcas[3][1][0] == "pendiente" and marcas[3][1][1] == int(correo.espera_reintento(2))
+
+
+def test_reclamo_respeta_el_cupo_por_minuto_entre_procesos(monkeypatch):
+    monkeypatch.setattr(correo, "CORREO_MAX_POR_MINUTO", 120)
+    conn = ConexionFalsa([])
+    conn.cur.en_el_minuto = 117  # enviados o 'enviando' por cualquier proceso
+    correo._reclamar(conn)
+    seleccion = [p for s, p in conn.cur.sql if s.startswith("SELECT id_correo")]
+    assert seleccion == [(3,)]
+    conn = ConexionFalsa([])
+    conn.cur.en_el_minuto = 120
+    assert correo._reclamar(conn) == []
+    assert not any(s.startswith("SELECT id_correo") for s, _ in conn.cur.sql)
+    assert "RELEASE_LOCK" in conn.cur.sql[-1][0]
+
+
+def test_backoff_exponencial_con_tope():
+    assert correo.espera_reintento(1) == correo.CORREO_BACKOFF_SEG
+    assert correo.espera_reintento(3) == correo.CORREO_BACKOFF_SEG * 4
+    assert correo.espera_reintento(50) == correo.CORREO_BACKOFF_MAX_SEG
+
+
+def test_crear_envio_encola_por_tramos_sin_repetidos(monkeypatch):
+    monkeypatch.setattr(correo, "_FILAS_POR_INSERT", 2)
+    conn = ConexionFalsa([])
+    destinatarios = ["a@x.cl", "b@x.cl", "a@x.cl", " c@x.cl ", None, ""]
+    assert correo.crear_envio(conn, "todos_los_funcionarios", destinatarios, "Aviso", "Hola") == (9, 3)
+    (envio, p0), (tramo1, p1), (tramo2, p2) = conn.cur.sql
+    assert envio.startswith("INSERT INTO envios_masivos") and p0[2] == 3
+    assert tramo1.count("(%s, %s, %s, %s)") == 2 and p1[::4] == ["a@x.cl", "b@x.cl"] and p1[3] == 9
+    assert p2 == ["c@x.cl", "Aviso", "Hola", 9]
+
+
+def test_limitador_reparte_envios_entre_hilos():
+    limite = correo.Limitador(1200)  # uno cada 50 ms
+    inicio = time.monotonic()
+    hilos = [threading.Thread(target=lambda: [limite.esperar() for _ in range(3)]) for _ in range(2)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert time.monotonic() - inicio >= 0.25
@@ -0,0 +1,99 @@
+import sys
+import os
+from datetime import date, datetime
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from fastapi import HTTPException
+import esquema
+import disponibilidad
+
+
+@pytest.fixture(autouse=True)
+def registro_esquema(monkeypatch):
+    """Registro de esquema en memoria, sin BD (solo durante cada prueba)."""
+    monkeypatch.setattr(esquema, "_columnas", {"reservas": frozenset({"id_reserva", "id_vecino", "nombreSector", "fecha_inicio", "estado", "id_uv"})})
+    monkeypatch.setattr(esquema, "_vence_en", float("inf"))
+    monkeypatch.setattr(esquema, "_cargado_en", 1.0)
+
+
+class CursorFalso:
+    def __init__(self, reglas=None, filas=()):
+        self.reglas = reglas
+        self.filas = list(filas)
+        self.sql = []
+        self.lastrowid = 40
+
+    def execute(self, sql, params=None):
+        self.sql.append(" ".join(sql.split()))
+
+    def fetchone(self):
+        return {"id_vecino": 1} if "FROM vecinos" in self.sql[-1] else self.reglas
+
+    def fetchall(self):
+        return self.filas
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def __init__(self, cursor):
+        self.cur = cursor
+        self.fin = []
+
+    def cursor(self, **kwargs):
+        return self.cur
+
+    def commit(self):
+        self.fin.append("commit")
+
+    def rollback(self):
+        self.fin.append("rollback")
+
+
+def test_reservar_bloquea_valida_e_inserta_en_una_transaccion():
+    conn = ConexionFalsa(CursorFalso({"activas": 1, "propia": 0, "ocupado": 0}))
+    assert disponibilidad.reservar(conn, 1, "Sede", datetime(2025, 12, 3, 18), "pendiente", 4) == 40
+    assert conn.fin == ["commit"]
+    vecino, reglas, insert = conn.cur.sql
+    assert vecino.endswith("FOR UPDATE") and reglas.endswith("FOR UPDATE")
+    assert "DATE(" not in reglas and insert.startswith("INSERT INTO reservas")
+
+    conn = ConexionFalsa(CursorFalso({"activas": 0, "propia": 0, "ocupado": 1}))
+    with pytest.raises(HTTPException) as e:
+        disponibilidad.reservar(conn, 2, "Sede", datetime(2025, 12, 3), "pendiente")
+    assert e.value.detail == "Ya existe una reserva para este sector y fecha."
+    assert conn.fin == ["rollback"] and len(conn.cur.sql) == 2
+
+
+def test_reservar_reintenta_si_innodb_aborta_por_deadlock():
+    from mysql.connector.errors import InternalError
+
+    class CursorDeadlock(CursorFalso):
+        deadlocks = 1
+
+        def execute(self, sql, params=None):
+            super().execute(sql, params)
+            if sql.lstrip().startswith("INSERT") and CursorDeadlock.deadlocks:
+                CursorDeadlock.deadlocks -= 1
+                raise InternalError(msg="Deadlock found when trying to get lock", errno=1213)
+
+    conn = ConexionFalsa(CursorDeadlock({"activas": 0, "propia": 0, "ocupado": 0}))
+    assert disponibilidad.reservar(conn, 1, "Sede", datetime(2025, 12, 3), "pendiente") == 40
+    assert conn.fin == ["rollback", "commit"]
+
+    # sigue chocando: 409, nunca un 500
+    CursorDeadlock.deadlocks = 5
+    conn = ConexionFalsa(CursorDeadlock({"activas": 0, "propia": 0, "ocupado": 0}))
+    with pytest.raises(HTTPException) as e:
+        disponibilidad.reservar(conn, 1, "Sede", datetime(2025, 12, 3), "pendiente")
+    assert e.value.status_code == 409 and conn.fin == ["rollback", "rollback"]
+
+
+def test_calendario_marca_dias_ocupados():
+    cur = CursorFalso(filas=[{"id_reserva": 7, "fecha_inicio": datetime(2025, 12, 3, 10), "estado": "aprobado"}])
+    dias = disponibilidad.calendario(cur, "Sede", date(2025, 12, 2), date(2025, 12, 4))
+    assert [(d["dia"].day, d["libre"], d["id_reserva"]) for d in dias] == [(2, True, None), (3, False, 7), (4, True, None)]
+    assert len(cur.sql) == 1
+    with pytest.raises(HTTPException):
+        disponibilidad.calendario(cur, "Sede", date(2025, 12, 4), date(2025, 12, 2))
@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+import pytest
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
+from biometria import embeddings
+from conexion import SesionDB
+from biometria.embeddings import IndiceEmbeddings, RostroYaRegistrado, a_bytes, normalizar_rut
+
+
+def _vectores(n, dim=512, semilla=0):
+    return np.random.default_rng(semilla).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_busqueda_1_n_vectorizada_excluye_el_propio_rut():
+    base = _vectores(1000)
+    indice = IndiceEmbeddings([(f"{i}-K", a_bytes(v)) for i, v in enumerate(base)])
+    assert indice.matriz.shape == (1000, 512) and indice.matriz.dtype == np.float32
+
+    consulta = base[42] + 0.05 * _vectores(1, semilla=1)[0]
+    (rut, dist), *_ = indice.buscar(consulta, k=3)
+    assert rut == "42-K" and dist < 0.01
+    # el mismo rostro bajo otro RUT es lo que se busca; el propio se excluye
+    assert indice.buscar(consulta, k=3, umbral=0.3, excluir="42-K") == []
+
+    indice.agregar("99999-9", consulta)
+    assert indice.buscar(base[42], k=1, umbral=0.3, excluir="42-K")[0][0] == "99999-9"
+    indice.agregar("99999-9", base[7])
+    assert len(indice) == 1001 and indice.buscar(base[7], k=2)[1][0] == "99999-9"
+
+
+def test_duplicados_usa_rut_normalizado(monkeypatch):
+    v = _vectores(2)
+    indice = IndiceEmbeddings([("12345678-K", a_bytes(v[0])), ("11111111-1", a_bytes(v[1]))])
+    monkeypatch.setattr(embeddings, "indice_embeddings", lambda: indice)
+    assert normalizar_rut("12.345.678-k") == "12345678-K"
+    assert embeddings.duplicados(v[0], "12.345.678-k", umbral=0.3) == []
+    assert [d["rut"] for d in embeddings.duplicados(v[0], "22.222.222-2", umbral=0.3)] == ["12345678-K"]
+    assert np.allclose(embeddings.embedding_de("12345678-k"), v[0] / np.linalg.norm(v[0]))
+    with pytest.raises(ValueError):
+        indice.agregar("1-9", np.ones(128))
+
+
+class BDFalsa:
+    """embeddings_faciales en memoria con la PK por rut de MySQL."""
+
+    def __init__(self):
+        self.filas = {}
+        self.sql = []
+
+    def cursor(self, **kw):
+        return self
+
+    def execute(self, sql, params):
+        self.sql.append(sql)
+        rut = params[0]
+        if rut in self.filas and "ON DUPLICATE KEY" not in sql:
+            raise IntegrityError(msg="Duplicate entry", errno=errorcode.ER_DUP_ENTRY)
+        self.filas[rut] = params[2]
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_guardar_no_sobrescribe_y_reemplazar_si(monkeypatch):
+    bd = BDFalsa()
+    monkeypatch.setattr(embeddings, "conectar_db", lambda: bd)
+    monkeypatch.setattr(embeddings, "_indice", None)
+    v = _vectores(2)
+    embeddings.guardar_embedding("12.345.678-k", v[0], "ArcFace")
+    with pytest.raises(RostroYaRegistrado):
+        embeddings.guardar_embedding("12345678-K", v[1], "ArcFace")
+    assert bd.filas["12345678-K"] == a_bytes(v[0])
+    assert "ON DUPLICATE KEY" not in bd.sql[0]
+    embeddings.reemplazar_embedding("12345678-K", v[1], "ArcFace")
+    assert bd.filas["12345678-K"] == a_bytes(v[1])
+
+
+def test_en_request_el_indice_se_actualiza_solo_tras_el_commit(monkeypatch):
+    v = _vectores(2)
+    monkeypatch.setattr(embeddings, "_indice", IndiceEmbeddings([("11111111-1", a_bytes(v[0]))]))
+    for ok, esperado in ((False, 1), (True, 2)):
+        sesion = SesionDB()
+        sesion._db = BDFalsa()
+        monkeypatch.setattr(embeddings, "conectar_db", lambda: sesion)
+        embeddings.guardar_embedding("22222222-2", v[1], "ArcFace")
+        assert len(embeddings._indice) == 1
+        sesion.finalizar(ok)
+        assert len(embeddings._indice) == esperado
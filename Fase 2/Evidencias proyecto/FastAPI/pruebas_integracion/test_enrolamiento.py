@@ -0,0 +1,126 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from fastapi import HTTPException
+from mysql.connector.errors import IntegrityError
+from endpoints import endpointActividades
+from endpoints.endpointActividades import enrolar_usuario, enrolar_usuarios_lote, EnrolamientoLote
+
+
+class BDFalsa:
+    """actividades + usuarios_en_actividades en memoria; entiende solo las sentencias del enrolamiento."""
+
+    def __init__(self, actividades):
+        self.actividades = {k: dict(v) for k, v in actividades.items()}
+        self.inscripciones = []  # (id, usuario_id, actividad_id)
+        self.fin = []
+        self.sql = []
+
+    def inscribir(self, usuario_id, actividad_id):
+        if any(u == usuario_id and a == actividad_id for _, u, a in self.inscripciones):
+            return None
+        nuevo = len(self.inscripciones) + 1
+        self.inscripciones.append((nuevo, usuario_id, actividad_id))
+        return nuevo
+
+    def cursor(self, **kwargs):
+        return CursorFalso(self, kwargs.get("dictionary", False))
+
+    def commit(self):
+        self.fin.append("commit")
+
+    def rollback(self):
+        self.fin.append("rollback")
+
+    def close(self):
+        pass
+
+
+class CursorFalso:
+    def __init__(self, bd, dictionary):
+        self.bd = bd
+        self.dictionary = dictionary
+        self.filas = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        bd, sql = self.bd, " ".join(sql.split())
+        self.filas, self.rowcount = [], 0
+        bd.sql.append(sql)
+        if sql.startswith("INSERT INTO usuarios_en_actividades"):
+            for i in range(0, len(params), 2):
+                self.lastrowid = bd.inscribir(params[i], params[i + 1])
+                if self.lastrowid is None:
+                    raise IntegrityError(msg="Duplicate entry", errno=1062)
+            self.rowcount = len(params) // 2
+        elif sql.startswith("UPDATE actividades SET cupo_actual = cupo_actual + %s WHERE id_actividad = %s AND"):
+            n, act = params[0], bd.actividades.get(params[1])
+            if act and act["cupo_actual"] + n <= act["cupo_max"]:
+                act["cupo_actual"] += n
+                self.rowcount = 1
+        elif sql.startswith("UPDATE actividades"):
+            bd.actividades[params[1]]["cupo_actual"] += params[0]
+            self.rowcount = 1
+        elif sql.startswith("SELECT 1 FROM actividades"):
+            self.filas = [(1,)] if params[0] in bd.actividades else []
+        elif sql.startswith("SELECT cupo_max, cupo_actual"):
+            act = bd.actividades.get(params[0])
+            self.filas = [dict(act)] if act else []
+        elif sql.startswith("SELECT usuario_id FROM usuarios_en_actividades"):
+            actividad, pedidos = params[0], set(params[1:])
+            self.filas = [{"usuario_id": u} for _, u, a in bd.inscripciones if a == actividad and u in pedidos]
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+    def fetchone(self):
+        return self.filas[0] if self.filas else None
+
+    def fetchall(self):
+        return self.filas
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    bd = BDFalsa({1: {"cupo_max": 2, "cupo_actual": 0}})
+    monkeypatch.setattr(endpointActividades, "conectar_db", lambda: bd)
+    return bd
+
+
+def test_enrolar_respeta_cupo_y_distingue_errores(bd):
+    assert enrolar_usuario(1, usuario_id=10) == {"detail": "Usuario enrolado correctamente"}
+    with pytest.raises(HTTPException) as e:
+        enrolar_usuario(1, usuario_id=10)
+    assert e.value.status_code == 400  # duplicado
+    enrolar_usuario(1, usuario_id=11)
+    with pytest.raises(HTTPException) as e:
+        enrolar_usuario(1, usuario_id=12)
+    assert e.value.status_code == 409  # llena: el UPDATE condicional no afecta filas
+    with pytest.raises(HTTPException) as e:
+        enrolar_usuario(99, usuario_id=10)
+    assert e.value.status_code == 404
+    assert bd.actividades[1]["cupo_actual"] == 2
+    assert bd.fin == ["commit", "rollback", "commit", "rollback", "rollback"]
+    # la actividad se bloquea antes del INSERT, en el mismo orden que el lote
+    assert bd.sql[0] == "SELECT 1 FROM actividades WHERE id_actividad = %s FOR UPDATE"
+    assert bd.sql[1].startswith("INSERT INTO usuarios_en_actividades")
+
+
+def test_lote_todo_o_nada_y_parcial(bd):
+    bd.actividades[1]["cupo_max"] = 3
+    bd.inscribir(10, 1)
+    bd.actividades[1]["cupo_actual"] = 1
+    with pytest.raises(HTTPException) as e:
+        enrolar_usuarios_lote(1, EnrolamientoLote(usuario_ids=[10, 11, 12, 13]))
+    assert e.value.status_code == 409 and e.value.detail["cupos_libres"] == 2
+    assert bd.actividades[1]["cupo_actual"] == 1
+
+    r = enrolar_usuarios_lote(1, EnrolamientoLote(usuario_ids=[10, 11, 12, 13], parcial=True))
+    assert r["enrolados"] == [11, 12]
+    assert r["ya_enrolados"] == [10] and r["sin_cupo"] == [13]
+    assert r["cupo_actual"] == 3 == bd.actividades[1]["cupo_actual"]
+
@@ -0,0 +1,169 @@
+import sys
+import os
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from geocodificacion import Cancelada, ClienteHTTP, LimiteFrecuencia
+
+
+class Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    fallos_pendientes = 0
+    conexiones = set()
+
+    def do_GET(self):
+        Stub.conexiones.add(self.client_address)
+        if Stub.fallos_pendientes > 0:
+            Stub.fallos_pendientes -= 1
+            self._responder(503, {"error": "ocupado"})
+            return
+        self._responder(200, [{"lat": "-33.51", "lon": "-70.77", "path": self.path}])
+
+    def _responder(self, status, cuerpo):
+        data = json.dumps(cuerpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/search"
+    server.shutdown()
+
+
+def test_reutiliza_conexion(url):
+    Stub.conexiones = set()
+    cliente = ClienteHTTP("stub")
+    for _ in range(5):
+        assert cliente.get_json(url, params={"q": "pajaritos"}, timeout=2)[0]["lat"] == "-33.51"
+    assert len(Stub.conexiones) == 1
+
+
+def test_reintenta_con_backoff(url):
+    Stub.fallos_pendientes = 2
+    cliente = ClienteHTTP("stub", reintentos=2, backoff=0.01)
+    assert cliente.get_json(url, timeout=2)[0]["lon"] == "-70.77"
+    assert Stub.fallos_pendientes == 0
+
+
+def test_limite_de_frecuencia(url):
+    cliente = ClienteHTTP("stub", intervalo_min=0.2)
+    inicio = time.monotonic()
+    for _ in range(3):
+        cliente.get_json(url, timeout=2)
+    assert time.monotonic() - inicio >= 0.4
+    # el próximo turno libre queda más allá del timeout pedido
+    cliente._proximo = time.monotonic() + 5
+    with pytest.raises(LimiteFrecuencia):
+        cliente.get(url, timeout=1)
+
+
+def test_reintentos_respetan_turno_y_timeout(url):
+    # cada reintento vuelve a pedir turno: 2 fallos + 1 éxito con intervalo 0.2 s
+    Stub.fallos_pendientes = 2
+    cliente = ClienteHTTP("stub", intervalo_min=0.2, reintentos=2, backoff=0.01)
+    inicio = time.monotonic()
+    assert cliente.get_json(url, timeout=2)[0]["lat"] == "-33.51"
+    assert time.monotonic() - inicio >= 0.4 and cliente.stats["reintentos"] == 2
+    # con el proveedor caído, intentos y backoff no pasan del timeout pedido
+    Stub.fallos_pendientes = 100
+    cliente = ClienteHTTP("stub", reintentos=10, backoff=0.2)
+    inicio = time.monotonic()
+    assert cliente.get(url, timeout=0.5).status_code == 503
+    assert time.monotonic() - inicio < 0.6
+    Stub.fallos_pendientes = 0
+
+
+def test_no_cachea_no_encontrado_si_ningun_proveedor_respondio(monkeypatch):
+    from endpoints import endpointUV
+    guardados = []
+    monkeypatch.setattr(endpointUV.geocache, "obtener", lambda k: (False, None))
+    monkeypatch.setattr(endpointUV.geocache, "guardar", lambda k, v: guardados.append(v))
+
+    def falla(t, c):
+        raise LimiteFrecuencia("sin turno")
+
+    monkeypatch.setattr(endpointUV, "_tareas_geocodificacion", lambda *a: [("nominatim", falla, 1.0)])
+    assert endpointUV.geocode_best("Pajaritos 1", "Maipú", "Chile", timeout_ms=2000) is None
+    assert guardados == []
+    # un proveedor respondió sin resultados: ahí sí es "no encontrado"
+    monkeypatch.setattr(endpointUV, "_tareas_geocodificacion",
+                        lambda *a: [("nominatim", falla, 1.0), ("geoapify", lambda t, c: None, 1.0)])
+    assert endpointUV.geocode_best("Pajaritos 1", "Maipú", "Chile", timeout_ms=2000) is None
+    assert guardados == [None]
+
+
+def _punto(fuente, dentro=True):
+    return {"lat": -33.51 if dentro else -33.0, "lon": -70.77, "display_name": "", "source": fuente}
+
+
+def _con_tareas(monkeypatch, tareas, hedge_ms=0):
+    from endpoints import endpointUV
+    monkeypatch.setattr(endpointUV, "GEOCODE_HEDGE_MS", hedge_ms)
+    monkeypatch.setattr(endpointUV, "_tareas_geocodificacion", lambda *a: tareas)
+    return endpointUV._geocode_best_proveedores("Pajaritos 1", "Maipú", "Chile", timeout_ms=3000)
+
+
+def test_gana_la_consulta_de_mayor_prioridad_dentro_del_bbox(monkeypatch):
+    def lenta(t, c):
+        time.sleep(0.2)
+        return _punto("google")
+
+    # la primera tarda más, pero tiene prioridad sobre la que respondió antes
+    g = _con_tareas(monkeypatch, [("google", lenta, 1.0), ("nominatim", lambda t, c: _punto("nominatim"), 1.0)])
+    assert g["source"] == "google" and set(g["latencias_ms"]) == {"google#0", "nominatim#1"}
+    # sin resultado o fuera del bbox, la siguiente gana
+    g = _con_tareas(monkeypatch, [("google", lambda t, c: None, 1.0),
+                                  ("nominatim", lambda t, c: _punto("fuera", dentro=False), 1.0),
+                                  ("geoapify", lambda t, c: _punto("geoapify"), 1.0)])
+    assert g["source"] == "geoapify"
+
+
+def test_consultas_escalonadas_cada_hedge_ms(monkeypatch):
+    inicios = []
+
+    def sin_resultado(t, c):
+        inicios.append(time.monotonic())
+        time.sleep(0.4)
+        return None
+
+    g = _con_tareas(monkeypatch, [("a", sin_resultado, 1.0), ("b", sin_resultado, 1.0),
+                                  ("c", lambda t, c: _punto("c"), 1.0)], hedge_ms=150)
+    assert g["source"] == "c"
+    assert 0.13 <= inicios[1] - inicios[0] < 0.35
+
+
+def test_las_consultas_perdedoras_no_consumen_turnos(monkeypatch):
+    cliente = ClienteHTTP("stub", intervalo_min=1.0)
+    cliente._proximo = time.monotonic() + 1.5  # la consulta escalonada tendría que esperar turno
+    reservado = cliente._proximo
+    cancelada = threading.Event()
+
+    def esperando_turno(t, c):
+        try:
+            return cliente.get("http://127.0.0.1:9/no-se-llama", timeout=t, cancelado=c)
+        except Cancelada:
+            cancelada.set()
+            raise
+
+    def rapida(t, c):
+        time.sleep(0.1)
+        return _punto("google")
+
+    inicio = time.monotonic()
+    g = _con_tareas(monkeypatch, [("google", rapida, 1.0), ("nominatim", esperando_turno, 5.0)])
+    assert g["source"] == "google"
+    assert cancelada.wait(0.5) and time.monotonic() - inicio < 1.0
+    # el turno reservado se devolvió y no salió ninguna consulta
+    assert cliente._proximo == reservado and cliente.stats["requests"] == 0
@@ -0,0 +1,37 @@
+import sys
+import os
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from geometria import IndiceUV, haversine_m
+
+
+def cuadrado(x0, y0, x1, y1):
+    return json.dumps({"type": "MultiPolygon", "coordinates": [[[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]]})
+
+
+# dos UV vecinas de ~1.8 x 2.2 km
+indice = IndiceUV([
+    {"id_uv": 1, "nombre": "UV 1", "gj": cuadrado(-70.80, -33.52, -70.78, -33.50)},
+    {"id_uv": 2, "nombre": "UV 2", "gj": cuadrado(-70.78, -33.52, -70.76, -33.50)},
+])
+
+
+def test_punto_dentro_de_uv():
+    uv = indice.buscar(-33.51, -70.77)
+    assert uv["id_uv"] == 2
+    assert uv["inside"] is True
+    assert uv["dist_m"] == 0.0
+
+
+def test_punto_fuera_usa_distancia_al_borde():
+    # ~22 m al sur del borde de la UV 1, a más de 900 m de cualquier vértice
+    uv = indice.buscar(-33.5202, -70.79)
+    assert uv["id_uv"] == 1
+    assert uv["inside"] is False
+    esperado = float(haversine_m(-33.52, -70.79, -33.5202, -70.79))
+    assert abs(uv["dist_m"] - esperado) < 0.5
+    assert min(indice.distancias_vertices(-33.5202, -70.79)) > 900
+
+
+def test_indice_vacio():
+    assert IndiceUV([]).buscar(-33.51, -70.77) is None
@@ -0,0 +1,10 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'pruebas_rendimiento')))
+import bench_importacion
+
+
+def test_import_main_no_carga_ml():
+    # el presupuesto de tiempo lo revisa pruebas_rendimiento/bench_importacion.py (depende de la máquina)
+    m = bench_importacion.medir(repeticiones=1)
+    assert m["prohibidos"] == [], f"main importa el stack de ML: {m['prohibidos']}"
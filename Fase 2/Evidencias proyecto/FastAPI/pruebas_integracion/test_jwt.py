@@ -0,0 +1,37 @@
+import sys
+import os
+from datetime import timedelta
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("SECRET_KEY", "clave-de-prueba")
+import pytest
+from jose import jwt as jose_jwt
+from jwt.firmas import BackendJose, BackendNativo, Llavero, TokenInvalido
+from jwt.jwt_utils import crear_access_token, crear_refresh_token, verificar_access_token, verificar_refresh_token
+
+
+def test_backends_intercambiables_y_rotacion_por_kid():
+    viejo = Llavero(BackendNativo("HS256"), {"k1": "uno"}, legado="legado")
+    nuevo = Llavero(BackendJose("HS256"), {"k1": "uno", "k2": "dos"}, kid_activo="k2", legado="legado")
+
+    # firmado por un backend, verificado por el otro
+    assert nuevo.verificar(viejo.firmar({"sub": "1"})) == {"sub": "1"}
+    token = nuevo.firmar({"sub": "2"})
+    assert jose_jwt.get_unverified_header(token)["kid"] == "k2"
+    with pytest.raises(TokenInvalido):
+        viejo.verificar(token)  # k2 aún no está en el llavero viejo
+
+    # tokens sin kid (previos al llavero) siguen valiendo con SECRET_KEY
+    sin_kid = jose_jwt.encode({"sub": "3"}, "legado", algorithm="HS256")
+    assert viejo.verificar(sin_kid) == nuevo.verificar(sin_kid) == {"sub": "3"}
+
+    # mismas reglas de claims que python-jose
+    for claims in ({"sub": 3}, {"sub": "1", "exp": 1}):
+        with pytest.raises(TokenInvalido):
+            viejo.verificar(viejo.firmar(claims))
+
+
+def test_refresh_no_sirve_como_access():
+    refresh = crear_refresh_token(7, timedelta(minutes=5))
+    assert verificar_access_token(refresh) is None
+    assert verificar_refresh_token(refresh)["sub"] == "7"
+    assert verificar_refresh_token(crear_access_token({"sub": "7"})) is None
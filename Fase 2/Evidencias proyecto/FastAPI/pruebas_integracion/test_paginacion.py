@@ -0,0 +1,134 @@
+import sys
+import os
+from datetime import datetime
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from fastapi import HTTPException
+import esquema
+from endpoints.utils import Pagina, consulta_paginada, cerrar_pagina, codificar_cursor, decodificar_cursor
+
+
+@pytest.fixture(autouse=True)
+def registro_esquema(monkeypatch):
+    """Registro de esquema en memoria, sin BD (solo durante cada prueba)."""
+    monkeypatch.setattr(esquema, "_columnas", {
+        "vecinos": frozenset({"id_vecino", "nombre", "contrasena", "id_uv"}),
+        "noticias": frozenset({"id_noticia", "titulo", "fecha_publicacion", "id_uv"}),
+    })
+    monkeypatch.setattr(esquema, "_vence_en", float("inf"))
+    monkeypatch.setattr(esquema, "_cargado_en", 1.0)
+
+
+def pagina(limit=None, after=None, fields=None, total=False):
+    return Pagina(limit=limit, after=after, fields=fields, total=total)
+
+
+def test_keyset_con_orden_y_desempate():
+    p = pagina(limit=10, after=codificar_cursor(datetime(2025, 1, 2, 3, 4, 5), 7), fields="titulo", total=True)
+    sql, params, sql_total, params_total = consulta_paginada(
+        "noticias", "FROM noticias t", ["t.id_uv = %s"], (3,), p, order_by="fecha_publicacion DESC"
+    )
+    assert sql.startswith("SELECT t.titulo, t.id_noticia, t.fecha_publicacion FROM noticias t")
+    assert ("(t.fecha_publicacion < %s OR (t.fecha_publicacion = %s AND t.id_noticia < %s)"
+            " OR t.fecha_publicacion IS NULL)") in sql
+    assert sql.endswith("ORDER BY t.fecha_publicacion DESC, t.id_noticia DESC LIMIT %s")
+    assert params == (3, "2025-01-02 03:04:05.000000", "2025-01-02 03:04:05.000000", 7, 11)
+    assert sql_total == "SELECT COUNT(DISTINCT t.id_noticia) AS total FROM noticias t WHERE t.id_uv = %s"
+    assert params_total == (3,)
+
+
+@pytest.mark.parametrize("orden", ["fecha_publicacion DESC", "fecha_publicacion ASC"])
+def test_keyset_recorre_filas_con_fecha_null(orden):
+    # sqlite ordena los NULL como MySQL (primero en ASC, al final en DESC)
+    import sqlite3
+    bd = sqlite3.connect(":memory:")
+    bd.row_factory = lambda c, f: {d[0]: v for d, v in zip(c.description, f)}
+    bd.execute("CREATE TABLE noticias (id_noticia INTEGER, titulo TEXT, fecha_publicacion TEXT, id_uv INTEGER)")
+    fechas = [None, "2025-01-01", None, "2025-01-03", "2025-01-01", None, "2025-01-02"]
+    bd.executemany("INSERT INTO noticias VALUES (?, 'x', ?, 1)", list(enumerate(fechas, 1)))
+
+    vistos, after = [], None
+    for _ in range(len(fechas)):
+        p = pagina(limit=2, after=after)
+        sql, params, _, _ = consulta_paginada("noticias", "FROM noticias t", ["t.id_uv = %s"], (1,), p, order_by=orden)
+        filas = bd.execute(sql.replace("%s", "?"), params).fetchall()
+
+        class Resp:
+            headers = {}
+
+        filas = cerrar_pagina(filas, "noticias", p, Resp, order_by=orden)
+        vistos += [f["id_noticia"] for f in filas]
+        after = Resp.headers.get("X-Next-Cursor")
+        if not after:
+            break
+    esperado = [f["id_noticia"] for f in bd.execute(
+        f"SELECT id_noticia FROM noticias ORDER BY {orden}, id_noticia {orden.split()[1]}").fetchall()]
+    assert vistos == esperado and len(vistos) == len(fechas)
+
+
+def test_nunca_expone_contrasena():
+    sql = consulta_paginada("vecinos", "FROM vecinos t", [], (), None)[0]
+    assert "contrasena" not in sql and "t.*" not in sql
+    with pytest.raises(HTTPException):
+        consulta_paginada("vecinos", "FROM vecinos t", [], (), pagina(fields="contrasena"))
+
+
+def test_cerrar_pagina_genera_cursor():
+    filas = [{"id_vecino": i, "nombre": "x", "contrasena": "1234"} for i in (1, 2, 3)]
+    p = pagina(limit=2)
+
+    class Resp:
+        headers = {}
+
+    resp = Resp()
+    out = cerrar_pagina(filas, "vecinos", p, resp)
+    assert [f["id_vecino"] for f in out] == [1, 2]
+    assert all("contrasena" not in f for f in out)
+    assert decodificar_cursor(resp.headers["X-Next-Cursor"]) == (2, 2)
+
+
+def test_esquema_vencido_no_bloquea_el_event_loop(monkeypatch):
+    import asyncio
+    import threading
+    import time
+    recargado = threading.Event()
+
+    def cargar_lento():
+        time.sleep(0.3)  # consulta a INFORMATION_SCHEMA
+        esquema._vence_en = float("inf")
+        recargado.set()
+        return True
+
+    monkeypatch.setattr(esquema, "cargar_esquema", cargar_lento)
+    monkeypatch.setattr(esquema, "_columnas", {"noticias": frozenset({"id_noticia", "id_uv"})})
+    monkeypatch.setattr(esquema, "_vence_en", 0.0)
+
+    async def handler():
+        t0 = time.perf_counter()
+        tiene = esquema.tiene_columna("noticias")
+        return tiene, time.perf_counter() - t0
+
+    tiene, demora = asyncio.run(handler())
+    assert tiene and demora < 0.1  # responde con lo ya cargado
+    assert recargado.wait(2)
+
+
+def test_sin_esquema_cargado_no_informa_columna_ausente(monkeypatch):
+    intentos = []
+
+    def cargar(exito):
+        intentos.append(exito)
+        if exito:
+            esquema._columnas = {"noticias": frozenset({"id_noticia", "id_uv"})}
+            esquema._cargado_en = 1.0
+        return exito
+
+    monkeypatch.setattr(esquema, "_columnas", {})
+    monkeypatch.setattr(esquema, "_cargado_en", 0.0)
+    monkeypatch.setattr(esquema, "_vence_en", float("inf"))  # la carga al iniciar falló hace poco
+    monkeypatch.setattr(esquema, "cargar_esquema", lambda: cargar(False))
+    with pytest.raises(HTTPException) as e:
+        esquema.tiene_columna("noticias")
+    assert e.value.status_code == 503
+    monkeypatch.setattr(esquema, "cargar_esquema", lambda: cargar(True))
+    assert esquema.tiene_columna("noticias") and intentos == [False, True]
@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from biometria import preproceso
+from biometria.preproceso import preprocesar, leer_limitado, ImagenDemasiadoGrande, FormatoNoSoportado
+
+
+def _codificar(img, formato, **kw):
+    buf = io.BytesIO()
+    img.save(buf, format=formato, **kw)
+    return buf.getvalue()
+
+
+def test_jpeg_grande_se_reduce_y_se_endereza_con_exif():
+    # foto "de teléfono" 4000x3000 con orientación 6 (girar 90° a la derecha)
+    img = Image.new("RGB", (4000, 3000), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    bgr, info = preprocesar(_codificar(img, "JPEG", exif=exif.tobytes()), lado_max=1024)
+    assert bgr.dtype == np.uint8 and bgr.flags["C_CONTIGUOUS"]
+    assert bgr.shape[:2] == (1024, 768)  # vertical tras aplicar EXIF
+    assert info["original"] == [4000, 3000] and info["procesada"] == [768, 1024]
+    assert info["orientacion_exif"] == 6 and info["formato"] == "JPEG"
+    b, g, r = bgr[512, 384].tolist()
+    assert r > 150 and b < 80  # canales en orden BGR
+
+
+def test_png_con_alfa_queda_en_tres_canales_sin_agrandar():
+    bgr, info = preprocesar(_codificar(Image.new("RGBA", (300, 200), (0, 0, 255, 128)), "PNG"))
+    assert bgr.shape == (200, 300, 3) and info["procesada"] == [300, 200]
+
+
+def test_formato_y_dimensiones_se_validan_antes_de_decodificar(monkeypatch):
+    with pytest.raises(FormatoNoSoportado):
+        preprocesar(_codificar(Image.new("RGB", (10, 10)), "GIF"))
+    with pytest.raises(FormatoNoSoportado):
+        preprocesar(b"no es una imagen")
+    monkeypatch.setattr(preproceso, "BIOMETRIA_MAX_PIXELES", 100 * 100)
+    with pytest.raises(ImagenDemasiadoGrande):
+        preprocesar(_codificar(Image.new("RGB", (101, 100)), "PNG"))
+
+
+class _Subida:
+    def __init__(self, datos, size=None):
+        self._buf = io.BytesIO(datos)
+        self.size = size
+        self.filename = "selfie.jpg"
+        self.leidos = 0
+
+    async def read(self, n=-1):
+        trozo = self._buf.read(n)
+        self.leidos += len(trozo)
+        return trozo
+
+
+def test_leer_limitado_corta_sin_leer_todo():
+    datos = b"x" * (3 * 1024 * 1024)
+    assert asyncio.run(leer_limitado(_Subida(datos), max_bytes=len(datos))) == datos
+    subida = _Subida(datos)
+    with pytest.raises(ImagenDemasiadoGrande):
+        asyncio.run(leer_limitado(subida, max_bytes=1024 * 1024))
+    assert subida.leidos < len(datos)
+    # con Content-Length conocido ni siquiera se lee
+    subida = _Subida(datos, size=len(datos))
+    with pytest.raises(ImagenDemasiadoGrande):
+        asyncio.run(leer_limitado(subida, max_bytes=1024 * 1024))
+    assert subida.leidos == 0
@@ -0,0 +1,166 @@
+"""Auditoría de planes de ejecución: corre EXPLAIN sobre las consultas de endpoints/ y marca los full scans.
+
+Fuentes de consultas:
+- los literales SQL pasados a cursor.execute(...) en endpoints/*.py, en los
+  módulos de MODULOS (y main.py con --main), extraídos con ast; las consultas armadas con f-strings o
+  concatenación se listan como "dinámicas" pero no se auditan;
+- los listados por UV generados por endpoints.utils.consulta_por_uv, con y sin
+  cursor de keyset, para cada tabla de CLAVES.
+
+En los literales, LIMIT/OFFSET %s pasan a 1 y el resto de los %s a
+'2000-01-01 00:00:00', que MySQL convierte al tipo de la columna (entero,
+fecha o texto) sin perder el índice; los listados generados usan sus propios
+parámetros. Se marca como FULL SCAN cada fila del plan con type=ALL y como
+advertencia type=index (recorre el índice completo). Requiere la BD de conexion.py con datos representativos:
+con tablas casi vacías el optimizador prefiere ALL aunque exista el índice, por
+eso --min-filas ignora tablas con menos filas estimadas.
+
+    python pruebas_rendimiento/auditar_consultas.py
+    python pruebas_rendimiento/auditar_consultas.py --min-filas 100 --main
+
+Sale con código 1 si hay full scans (sirve para CI).
+"""
+import argparse
+import ast
+import glob
+import os
+import re
+import sys
+
+BASE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE)
+
+from conexion import conectar_db
+from esquema import cargar_esquema
+from endpoints.utils import CLAVES, Pagina, codificar_cursor, consulta_por_uv
+
+AUDITABLES = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+# consultas que viven fuera de endpoints/ (conflictos/calendario de reservas, bandeja de correos)
+MODULOS = ("disponibilidad.py", "correo.py")
+
+# orden de cada listado por UV (como en los routers)
+ORDEN = {
+    "noticias": "fecha_publicacion DESC",
+    "proyectos": "fecha_postulacion DESC",
+    "reservas": "fecha_inicio DESC",
+    "certificados": "fecha_solicitud DESC",
+    "notificaciones": "fecha_envio DESC",
+    "actividades": "fecha_inicio DESC",
+}
+
+
+def _origen(ruta: str, linea: int) -> str:
+    return f"{os.path.relpath(ruta, BASE)}:{linea}"
+
+
+def consultas_en_archivo(ruta: str):
+    """(origen, sql o None si es dinámica, None) por cada cursor.execute(...) del archivo."""
+    with open(ruta, encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), filename=ruta)
+    literales = {}
+    # variables asignadas una sola vez con un literal (query = "..."; cursor.execute(query, ...))
+    for nodo in ast.walk(arbol):
+        if isinstance(nodo, ast.Assign) and isinstance(nodo.value, ast.Constant) and isinstance(nodo.value.value, str):
+            for destino in nodo.targets:
+                if isinstance(destino, ast.Name):
+                    literales.setdefault(destino.id, []).append(nodo.value.value)
+    for nodo in ast.walk(arbol):
+        if not (isinstance(nodo, ast.Call) and isinstance(nodo.func, ast.Attribute) and nodo.func.attr == "execute" and nodo.args):
+            continue
+        arg = nodo.args[0]
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            yield _origen(ruta, nodo.lineno), arg.value, None
+        elif isinstance(arg, ast.Name) and len(literales.get(arg.id, ())) == 1:
+            yield _origen(ruta, nodo.lineno), literales[arg.id][0], None
+        else:
+            yield _origen(ruta, nodo.lineno), None, None
+
+
+def consultas_generadas():
+    """Listados por UV tal como los arma endpoints.utils (primera página y página siguiente)."""
+    for tabla in CLAVES:
+        orden = ORDEN.get(tabla)
+        for after in (None, codificar_cursor("2000-01-01 00:00:00", 1)):
+            pagina = Pagina(limit=50, after=after, fields=None, total=False)
+            consulta = consulta_por_uv(tabla, 1, order_by=orden, pagina=pagina)
+            if consulta is not None:
+                yield f"consulta_por_uv({tabla}{', after' if after else ''})", consulta[0], consulta[1]
+
+
+def _sustituir(sql: str) -> str:
+    sql = re.sub(r"\b(LIMIT|OFFSET)\s+%s", r"\1 1", sql, flags=re.IGNORECASE)
+    return re.sub(r"%\(\w+\)s|%s", "'2000-01-01 00:00:00'", sql)
+
+
+def explicar(cur, sql: str, params=None):
+    if params is None:
+        cur.execute("EXPLAIN " + _sustituir(sql))
+    else:
+        cur.execute("EXPLAIN " + sql, params)
+    return cur.fetchall()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--min-filas", type=int, default=0, help="ignora full scans con menos filas estimadas")
+    ap.add_argument("--main", action="store_true", help="incluye las consultas de main.py")
+    args = ap.parse_args()
+
+    archivos = sorted(glob.glob(os.path.join(BASE, "endpoints", "*.py")))
+    archivos += [os.path.join(BASE, m) for m in MODULOS]
+    if args.main:
+        archivos.append(os.path.join(BASE, "main.py"))
+
+    cargar_esquema()
+    consultas = [c for ruta in archivos for c in consultas_en_archivo(ruta)]
+    consultas += list(consultas_generadas())
+
+    db = conectar_db()
+    if db is None:
+        print("Sin conexión a la BD")
+        sys.exit(2)
+    cur = db.cursor(dictionary=True)
+
+    full_scans = advertencias = dinamicas = errores = auditadas = 0
+    vistas = set()
+    try:
+        for origen, sql, params in consultas:
+            if sql is None:
+                dinamicas += 1
+                print(f"[DINÁMICA] {origen}")
+                continue
+            sql = " ".join(sql.split())
+            if not sql.upper().startswith(AUDITABLES) or sql in vistas:
+                continue
+            vistas.add(sql)
+            try:
+                plan = explicar(cur, sql, params)
+            except Exception as e:
+                errores += 1
+                print(f"[ERROR]    {origen}: {e}\n           {sql}")
+                continue
+            auditadas += 1
+            for fila in plan:
+                tipo, filas = fila.get("type"), fila.get("rows") or 0
+                extra = fila.get("Extra") or ""
+                if tipo == "ALL" and filas >= args.min_filas:
+                    full_scans += 1
+                    etiqueta = "[FULL SCAN]"
+                elif tipo == "index":
+                    advertencias += 1
+                    etiqueta = "[INDEX SCAN]"
+                else:
+                    continue
+                print(f"{etiqueta} {origen}  tabla={fila.get('table')} filas~{filas} posibles={fila.get('possible_keys')} {extra}\n           {sql}")
+    finally:
+        cur.close()
+        db.close()
+
+    print(f"\n{auditadas} consultas auditadas: {full_scans} full scans, {advertencias} index scans, "
+          f"{dinamicas} dinámicas sin auditar, {errores} con error")
+    sys.exit(1 if full_scans else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Presupuesto de arranque en frío: tiempo de `import main` medido con python -X importtime.
+
+Corre `import main` en procesos nuevos (el mejor de --repeticiones, para no
+medir la cache de disco fría), toma el tiempo acumulado del módulo main y
+falla (código 1) si:
+- supera --presupuesto-ms (IMPORTACION_PRESUPUESTO_MS, por defecto 1500), o
+- se importó algún módulo del stack de ML (deepface, tensorflow, keras, cv2,
+  retinaface...), que solo debe cargarse en los trabajadores biométricos.
+
+Muestra además los módulos importados directamente por main que más pesan.
+No necesita BD: importar main no abre conexiones.
+
+    python pruebas_rendimiento/bench_importacion.py
+    python pruebas_rendimiento/bench_importacion.py --presupuesto-ms 800 -r 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BASE = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORTACION_PRESUPUESTO_MS = float(os.getenv("IMPORTACION_PRESUPUESTO_MS", "1500"))
+PROHIBIDOS = ("deepface", "tensorflow", "tf_keras", "keras", "cv2", "retinaface", "mtcnn", "torch")
+
+
+def _parsear(salida: str) -> list:
+    """Líneas de -X importtime → [(nivel, modulo, propio_us, acumulado_us)]."""
+    filas = []
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        if not propio.strip().isdigit():
+            continue  # encabezado
+        nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        filas.append((nivel, nombre.strip(), int(propio), int(acumulado)))
+    return filas
+
+
+def medir_una_vez() -> dict:
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "clave-de-benchmark")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BASE, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import main falló:\n{proc.stderr[-2000:]}")
+    filas = _parsear(proc.stderr)
+    main = next(f for f in filas if f[1] == "main")
+    nivel_main = main[0]
+    return {
+        "total_ms": main[3] / 1000,
+        "prohibidos": sorted({f[1] for f in filas if f[1].split(".")[0] in PROHIBIDOS}),
+        "directos": sorted(((f[1], f[3] / 1000) for f in filas if f[0] == nivel_main + 1), key=lambda x: -x[1]),
+    }
+
+
+def medir(repeticiones: int = 3) -> dict:
+    return min((medir_una_vez() for _ in range(repeticiones)), key=lambda m: m["total_ms"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--presupuesto-ms", type=float, default=IMPORTACION_PRESUPUESTO_MS)
+    ap.add_argument("-r", "--repeticiones", type=int, default=3)
+    ap.add_argument("--top", type=int, default=12, help="módulos directos más pesados a mostrar")
+    args = ap.parse_args()
+
+    m = medir(args.repeticiones)
+    print(f"import main: {m['total_ms']:.0f} ms (presupuesto {args.presupuesto_ms:.0f} ms)")
+    for nombre, ms in m["directos"][:args.top]:
+        print(f"  {ms:8.1f} ms  {nombre}")
+    fallas = []
+    if m["prohibidos"]:
+        fallas.append("se importó el stack de ML: " + ", ".join(m["prohibidos"]))
+    if m["total_ms"] > args.presupuesto_ms:
+        fallas.append(f"arranque sobre el presupuesto por {m['total_ms'] - args.presupuesto_ms:.0f} ms")
+    for f in fallas:
+        print(f"[FALLA] {f}")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
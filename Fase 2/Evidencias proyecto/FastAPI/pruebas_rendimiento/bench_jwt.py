@@ -0,0 +1,70 @@
+"""Microbenchmark de firma y verificación de tokens por backend (jwt/firmas.py).
+
+Mide operaciones por segundo de crear_access_token (firma) y
+verificar_access_token (verificación sin cache y con la cache de tokens de
+jwt_utils) para cada backend disponible, con claims como los de /login.
+No necesita BD.
+
+    python pruebas_rendimiento/bench_jwt.py -n 20000
+    python pruebas_rendimiento/bench_jwt.py --algoritmo EdDSA --pem llave_ed25519.pem
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("SECRET_KEY", "clave-de-benchmark")
+
+from jwt import jwt_utils
+from jwt.firmas import BACKENDS, Llavero
+
+CLAIMS = {"sub": "123", "rol": "directiva", "rut": "12345678-9", "id_uv": 4}
+
+
+def por_segundo(fn, n: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - inicio)
+
+
+def medir(nombre: str, algoritmo: str, valor: str, n: int):
+    try:
+        llavero = Llavero(BACKENDS[nombre](algoritmo), {"bench": valor})
+    except (RuntimeError, ImportError) as e:
+        print(f"{nombre:>7} {algoritmo:<6}  no disponible: {e}")
+        return
+
+    def firmar():
+        claims = dict(CLAIMS, exp=int((datetime.now(timezone.utc) + timedelta(minutes=60)).timestamp()))
+        return llavero.firmar(claims)
+
+    token = firmar()
+    firma = por_segundo(firmar, n)
+    verifica = por_segundo(lambda: llavero.verificar(token), n)
+
+    # ruta completa de jwt_utils con este backend: primera verificación + hits de cache
+    jwt_utils._llavero = llavero
+    jwt_utils._tokens_verificados.limpiar()
+    cacheada = por_segundo(lambda: jwt_utils.verificar_access_token(token), n)
+    print(f"{nombre:>7} {algoritmo:<6}  firmar {firma:>10,.0f}/s   verificar {verifica:>10,.0f}/s   verificar+cache {cacheada:>10,.0f}/s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-n", type=int, default=10000, help="operaciones por medición")
+    ap.add_argument("--algoritmo", default="HS256")
+    ap.add_argument("--pem", help="PEM Ed25519 privado (solo EdDSA)")
+    args = ap.parse_args()
+
+    valor = args.pem if args.algoritmo == "EdDSA" else os.environ["SECRET_KEY"]
+    if valor is None:
+        ap.error("--algoritmo EdDSA requiere --pem")
+    for nombre in BACKENDS:
+        medir(nombre, args.algoritmo, valor, args.n)
+
+
+if __name__ == "__main__":
+    main()
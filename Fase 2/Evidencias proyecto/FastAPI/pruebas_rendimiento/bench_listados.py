@@ -0,0 +1,117 @@
+"""Compara el throughput de un listado por UV: handler sync (threadpool) vs async (aiomysql).
+
+Monta una app mínima con las dos variantes sobre la misma consulta
+(list_by_uv / list_by_uv_async) y la golpea en proceso con httpx, con N
+requests y C concurrentes. Requiere la BD de conexion.py levantada.
+
+    python pruebas_rendimiento/bench_listados.py --tabla noticias --id-uv 1 -n 2000 -c 200
+    python pruebas_rendimiento/bench_listados.py --sleep-ms 20   # simula una BD lenta
+
+Con --sleep-ms cada request agrega SELECT SLEEP(x), para ver cómo escala cada
+variante cuando la BD es lenta: la sync está acotada por los 40 hilos del
+threadpool y el pool sync, la async por DB_ASYNC_POOL_MAX. Para comparar con
+las mismas conexiones, el pool async se fija en DB_POOL_SIZE + DB_POOL_OVERFLOW.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import httpx
+from fastapi import Depends, FastAPI
+
+from conexion import get_cursor, DB_POOL_SIZE, DB_POOL_OVERFLOW
+
+# mismo número de conexiones en ambas variantes (antes de importar conexion_async)
+os.environ["DB_ASYNC_POOL_MAX"] = str(DB_POOL_SIZE + DB_POOL_OVERFLOW)
+from conexion_async import get_cursor_async, cerrar_pool, DB_ASYNC_POOL_MAX
+from esquema import cargar_esquema
+from endpoints.utils import list_by_uv, list_by_uv_async
+
+JOINS = {
+    "noticias": ("usuarios", "t.autor_id = j.id_usuario"),
+    "proyectos": ("vecinos", "t.id_vecino = j.id_vecino"),
+    "reservas": ("vecinos", "t.id_vecino = j.id_vecino"),
+    "certificados": ("vecinos", "t.id_vecino = j.id_vecino"),
+    "vecinos": (None, None),
+}
+
+
+def crear_app(tabla: str, sleep_s: float) -> FastAPI:
+    join_table, join_on = JOINS[tabla]
+    app = FastAPI()
+
+    @app.get("/sync/{id_uv}")
+    def listado_sync(id_uv: int, cursor=Depends(get_cursor)):
+        if sleep_s:
+            cursor.execute("SELECT SLEEP(%s)", (sleep_s,))
+            cursor.fetchall()
+        return list_by_uv(cursor, tabla, id_uv, join_table=join_table, join_on=join_on)
+
+    @app.get("/async/{id_uv}")
+    async def listado_async(id_uv: int, cursor=Depends(get_cursor_async)):
+        if sleep_s:
+            await cursor.execute("SELECT SLEEP(%s)", (sleep_s,))
+            await cursor.fetchall()
+        return await list_by_uv_async(cursor, tabla, id_uv, join_table=join_table, join_on=join_on)
+
+    return app
+
+
+async def medir(client: httpx.AsyncClient, ruta: str, n: int, concurrencia: int) -> dict:
+    sem = asyncio.Semaphore(concurrencia)
+    latencias = []
+    errores = 0
+
+    async def uno():
+        nonlocal errores
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.get(ruta)
+            latencias.append((time.perf_counter() - t0) * 1000)
+            if r.status_code != 200:
+                errores += 1
+
+    # calentamiento: abre conexiones de ambos pools
+    await asyncio.gather(*(client.get(ruta) for _ in range(min(concurrencia, 20))))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uno() for _ in range(n)))
+    total = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        "req_s": round(n / total, 1),
+        "p50_ms": round(statistics.median(latencias), 1),
+        "p95_ms": round(latencias[int(len(latencias) * 0.95) - 1], 1),
+        "errores": errores,
+    }
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--tabla", default="noticias", choices=sorted(JOINS))
+    ap.add_argument("--id-uv", type=int, default=1)
+    ap.add_argument("-n", type=int, default=2000, help="requests por variante")
+    ap.add_argument("-c", "--concurrencia", type=int, default=200)
+    ap.add_argument("--sleep-ms", type=float, default=0.0, help="latencia extra de BD por request")
+    args = ap.parse_args()
+
+    cargar_esquema()
+    app = crear_app(args.tabla, args.sleep_ms / 1000.0)
+    print(
+        f"tabla={args.tabla} id_uv={args.id_uv} n={args.n} c={args.concurrencia} sleep_ms={args.sleep_ms} "
+        f"pool_sync={DB_POOL_SIZE}+{DB_POOL_OVERFLOW} pool_async={DB_ASYNC_POOL_MAX}"
+    )
+    limites = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", limits=limites) as client:
+        for variante in ("sync", "async"):
+            res = await medir(client, f"/{variante}/{args.id_uv}", args.n, args.concurrencia)
+            print(f"{variante:>5}: {res}")
+    await cerrar_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,25 @@
-import React, { useState } from "react";
+import React, { useEffect, useState } from "react";
 import api from "../../../api";
 
 function Avisos() {
   const [aviso, setAviso] = useState("");
   const [segmento, setSegmento] = useState("todos_los_funcionarios");
   const [idRelacionado, setIdRelacionado] = useState(""); // Para actividad o reserva
+  const [envio, setEnvio] = useState(null); // Progreso del último aviso encolado
+
+  // El envío ocurre en segundo plano: consulta el avance hasta que termine
+  useEffect(() => {
+    if (!envio || envio.terminado) return;
+    const timer = setTimeout(async () => {
+      try {
+        const { data } = await api.get(`/notificaciones/envios/${envio.id_envio}`);
+        setEnvio(data);
+      } catch (err) {
+        setEnvio(null);
+      }
+    }, 2000);
+    return () => clearTimeout(timer);
+  }, [envio]);
 
   const handleEnviar = async () => {
     if (!aviso) return alert("El mensaje no puede estar vacío.");
@@ -20,8 +35,9 @@ function Avisos() {
     }
 
     try {
-      await api.post("/notificaciones/Notificar", payload);
-      alert("Aviso enviado correctamente.");
+      const { data } = await api.post("/notificaciones/Notificar", payload);
+      setEnvio({ id_envio: data.id_envio, total: data.encolados, procesados: 0, porcentaje: 0, terminado: false });
+      alert(`Aviso en cola para ${data.encolados} destinatario(s).`);
       setAviso("");
       setIdRelacionado("");
     } catch (err) {
@@ -74,6 +90,19 @@ function Avisos() {
       <button className="btn btn-primary mt-3" onClick={handleEnviar}>
         Enviar Aviso
       </button>
+      {envio && (
+        <div className="mt-3">
+          <div className="progress">
+            <div className="progress-bar" role="progressbar" style={{ width: `${envio.porcentaje}%` }}>
+              {envio.porcentaje}%
+            </div>
+          </div>
+          <small>
+            {envio.terminado ? "Envío terminado" : "Enviando"}: {envio.enviado ?? 0} enviados,
+            {" "}{envio.fallido ?? 0} fallidos de {envio.total}
+          </small>
+        </div>
+      )}
     </div>
   );
 }
@@ -62,7 +62,10 @@ const Actividades = () => {
 
   const cargarActividades = async () => {
     try {
-      const res = await axios.get(`${API_BASE}/actividades`);
+      // usuario_id: el backend marca en usuarios_enrolados si este usuario está inscrito
+      const res = await axios.get(`${API_BASE}/actividades`, {
+        params: user?.id_usuario ? { usuario_id: user.id_usuario } : {},
+      });
       setActividades(res.data);
     } catch {
       setActividades([]);
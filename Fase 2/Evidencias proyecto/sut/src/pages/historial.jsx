@@ -85,7 +85,7 @@ const HistorialPage = () => {
           tryGet(() => api.get("/reservas/"), () => (idUv ? api.get(`/reservas/uv/${idUv}`) : Promise.resolve({ data: [] }))),
           tryGet(() => api.get("/proyectos/"), () => (idUv ? api.get(`/proyectos/uv/${idUv}`) : Promise.resolve({ data: [] }))),
           tryGet(() => api.get("/certificados/residencia"), () => (idUv ? api.get(`/certificados/uv/${idUv}`) : Promise.resolve({ data: [] }))),
-          tryGet(() => api.get("/actividades")),
+          tryGet(() => api.get("/actividades", { params: { usuario_id: user.id_usuario } })),
         ]);
 
         if (!mounted) return;
@@ -894,6 +894,7 @@ const Registro = () => {
       const fd = new FormData();
       fd.append("id_front", idFrontFile);
       fd.append("selfie", selfieFile);
+      // el backend revisa que el rostro no esté ya registrado; se guarda tras crear la cuenta
       const { data } = await axios.post(`${API_BASE}/biometria/verificar`, fd, {
         headers: { "Content-Type": "multipart/form-data" },
         timeout: 60000,
@@ -913,6 +914,23 @@ const Registro = () => {
     }
   };
 
+  // Guarda el rostro del nuevo vecino con su propia sesión (no bloquea el registro si falla)
+  const enrolarRostro = async () => {
+    if (!idFrontFile || !capturedSelfie) return;
+    try {
+      const { data: sesion } = await axios.post(`${API_BASE}/login/`, { rut: form.rut, contrasena: form.password });
+      const fd = new FormData();
+      fd.append("id_front", idFrontFile);
+      fd.append("selfie", dataURLtoFile(capturedSelfie, "selfie.jpg"));
+      await axios.post(`${API_BASE}/biometria/enrolar`, fd, {
+        headers: { "Content-Type": "multipart/form-data", Authorization: `Bearer ${sesion.access_token}` },
+        timeout: 60000,
+      });
+    } catch (ex) {
+      console.warn("No se pudo guardar el rostro:", ex);
+    }
+  };
+
   // Envío de registro
   const finalizarRegistro = async () => {
     try {
@@ -938,6 +956,7 @@ const Registro = () => {
       if (resp.status >= 200 && resp.status < 300) {
         const usuario = resp.data.usuario;
         if (usuario) localStorage.setItem("user", JSON.stringify(usuario));
+        await enrolarRostro();
         alert("Registro enviado con éxito. ¡Gracias!");
         handleCloseVerify();
         setForm({